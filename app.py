@@ -1,5 +1,6 @@
 from flask import Flask, render_template, session
 from flask_wtf.csrf import CSRFProtect
+import click
 import os
 import logging
 from config import Config
@@ -20,26 +21,65 @@ def create_app(config_class=Config):
     # Initialiser la configuration
     config_class.init_app(app)
     
+    # Instrumentation des requêtes (/metrics), installée avant les autres hooks
+    from services.metriques import metriques
+    metriques.init_app(app)
+    
     # Initialiser les extensions
     csrf = CSRFProtect(app)
     
-    # Importer et initialiser la base de données
+    from services import cache, response_cache
+    cache.init_app(app)
+    response_cache.init_app(app)
+    from services.cache_recherche import search_cache
+    search_cache.init_app(app)
+    
+    # Importer et initialiser la base de données (profil SQLite de production)
     from models.models import db
+    from services import base_sqlite
+    base_sqlite.configure(app)
     db.init_app(app)
+    base_sqlite.init_app(app)
     
     # Créer les tables si nécessaire
     with app.app_context():
         db.create_all()
         logger.info("Base de données initialisée")
+        
+        # Mise à niveau du schéma des bases existantes
+        if app.config.get('MIGRATIONS_AUTO', True):
+            from services.migrations import upgrade
+            upgrade()
+        
+        from services.search_index import ensure_index
+        ensure_index()
+    
+    # Pool d'extraction du texte des fichiers
+    from services.extraction import text_extractor
+    text_extractor.init_app(app)
+    
+    # Compteur de vues tamponné
+    from services.view_counter import view_counter
+    view_counter.init_app(app)
+    
+    # Statistiques du tableau de bord
+    from services.statistiques import dashboard_stats
+    dashboard_stats.init_app(app)
+    
+    # Documents similaires (voisins TF-IDF précalculés)
+    from services.similarite import similarity_engine
+    similarity_engine.init_app(app)
     
     # Enregistrer les blueprints
     from blueprints.auth import auth_bp
     from blueprints.documents import documents_bp
     from blueprints.admin import admin_bp
+    from blueprints.api import api_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(documents_bp)
     app.register_blueprint(admin_bp)
+    app.register_blueprint(api_bp)
     
     logger.info("Blueprints enregistrés")
     
@@ -81,16 +121,10 @@ def create_app(config_class=Config):
     
     @app.context_processor
     def inject_announcement():
-        """Injecte le message défilant et le dernier document"""
+        """Injecte le message défilant et le dernier document (depuis le cache)"""
         try:
-            from models.models import Document, Configuration
-            # Dernier document ajouté
-            dernier_doc = Document.query.order_by(Document.id.desc()).first()
-            
-            # Message personnalisé
-            config_message = Configuration.get_value('message_defilant')
-            
-            return dict(dernier_doc=dernier_doc, config_message=config_message)
+            from services.cache import get_announcement
+            return get_announcement()
         except Exception as e:
             logger.error(f"Erreur lors du chargement de l'annonce: {e}")
             return dict(dernier_doc=None, config_message=None)
@@ -104,10 +138,111 @@ def create_app(config_class=Config):
         logger.info("Base de données initialisée via CLI")
         print("✅ Base de données initialisée avec succès")
     
+    @app.cli.command()
+    def upgrade_db():
+        """Applique les migrations de schéma en attente"""
+        from services.migrations import upgrade, current_version
+        
+        try:
+            appliquees = upgrade()
+            for version, description in appliquees:
+                print(f"  → {version}: {description}")
+            print(f"✅ Schéma à jour (version {current_version()})")
+        except Exception as e:
+            print(f"❌ Erreur: {str(e)}")
+    
+    @app.cli.command()
+    def reindex():
+        """Reconstruit l'index de recherche plein texte et le vocabulaire de la recherche approchée"""
+        from services.search_index import rebuild_index
+        from services.recherche_approchee import rebuild_terms
+        
+        try:
+            total = rebuild_index()
+            termes = rebuild_terms(db.session.connection())
+            db.session.commit()
+            print(f"✅ Index reconstruit: {total} document(s), {termes} terme(s)")
+        except Exception as e:
+            print(f"❌ Erreur: {str(e)}")
+    
+    @app.cli.command()
+    def build_similarities():
+        """Recalcule les documents similaires de tout le corpus"""
+        from models.models import db
+        from services.similarite import similarity_engine
+        
+        try:
+            total = similarity_engine.rebuild()
+            print(f"✅ Similarités calculées: {total} document(s)")
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Erreur: {str(e)}")
+    
+    @app.cli.command()
+    @click.option('--retry-failed', is_flag=True, help="Relance aussi les extractions en échec")
+    def extract_texts(retry_failed):
+        """Extrait le texte des documents qui ne l'ont pas encore été"""
+        from models.models import db, Document, DocumentTexte
+        from services.extraction import text_extractor
+        
+        statuts = [DocumentTexte.STATUT_EN_ATTENTE]
+        if retry_failed:
+            statuts.append(DocumentTexte.STATUT_ECHEC)
+        
+        try:
+            documents = Document.query.outerjoin(DocumentTexte).filter(
+                db.or_(DocumentTexte.document_id.is_(None), DocumentTexte.statut.in_(statuts))
+            ).all()
+            for doc in documents:
+                text_extractor.prepare(doc)
+            db.session.commit()
+            
+            futures = text_extractor.submit([doc.id for doc in documents])
+            for i, future in enumerate(futures, 1):
+                future.result()
+                print(f"  {i}/{len(futures)}", end='\r')
+            
+            termines = DocumentTexte.query.filter_by(statut=DocumentTexte.STATUT_TERMINE).count()
+            print(f"✅ {len(futures)} extraction(s) traitée(s), {termines} document(s) indexé(s) au total")
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Erreur: {str(e)}")
+    
+    @app.cli.command()
+    @click.argument('dossier', type=click.Path(exists=True, file_okay=False))
+    @click.option('--categorie', default=None, help="Catégorie des fichiers placés à la racine du dossier")
+    @click.option('--workers', type=int, default=None, help="Processus de hachage/copie (défaut: nombre de CPU)")
+    @click.option('--lot', type=int, default=500, show_default=True, help="Documents insérés par transaction")
+    def import_documents(dossier, categorie, workers, lot):
+        """Importe une arborescence de fichiers (un sous-dossier = une catégorie)"""
+        from services.import_masse import import_directory
+        from services.cache import invalidate_documents
+        from services.response_cache import purge
+        
+        def progression(traites, total, stats):
+            print(f"  {traites}/{total} fichier(s) - {stats['importes']} importé(s), "
+                  f"{stats['deja_importes']} déjà présent(s), {stats['erreurs']} erreur(s)", end='\r')
+        
+        try:
+            stats = import_directory(dossier, categorie, workers, lot, progression)
+            print()
+            if stats['importes']:
+                invalidate_documents()
+                purge('categories', 'documents:recent', *(f'category:{id}' for id in stats['categorie_ids']))
+            print(f"✅ {stats['importes']} document(s) importé(s) sur {stats['total']} fichier(s) "
+                  f"({stats['deja_importes']} déjà présent(s), {stats['erreurs']} erreur(s))")
+            if stats['hors_categorie']:
+                print(f"⚠️ {stats['hors_categorie']} fichier(s) à la racine ignoré(s) : utilisez --categorie")
+            if stats['importes']:
+                print("ℹ️ Lancez ensuite 'flask extract-texts' puis 'flask build-similarities'")
+        except Exception as e:
+            print(f"❌ Erreur: {str(e)}")
+    
     @app.cli.command()
     def create_admin():
         """Crée un utilisateur admin via CLI"""
         from models.models import db, User
+        from services.cache import invalidate_users
         import getpass
         
         username = input("Nom d'utilisateur: ")
@@ -129,6 +264,7 @@ def create_app(config_class=Config):
             user.set_password(password)
             db.session.add(user)
             db.session.commit()
+            invalidate_users()
             print(f"✅ Utilisateur admin '{username}' créé avec succès")
             
         except Exception as e:
@@ -139,6 +275,8 @@ def create_app(config_class=Config):
     def seed_data():
         """Ajoute des données de test"""
         from models.models import db, Categorie
+        from services.cache import invalidate_documents
+        from services.response_cache import purge
         
         try:
             categories_test = [
@@ -156,6 +294,8 @@ def create_app(config_class=Config):
                     db.session.add(cat)
             
             db.session.commit()
+            invalidate_documents()
+            purge('categories')
             print("✅ Données de test ajoutées avec succès")
             
         except Exception as e:
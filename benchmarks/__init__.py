@@ -0,0 +1 @@
+"""Mesures de performance reproductibles (python -m benchmarks.run --help)"""
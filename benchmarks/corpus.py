@@ -0,0 +1,213 @@
+"""
+Corpus synthétique pour les mesures de performance : catégories, documents
+aux titres français, textes extraits, index plein texte et fichiers factices.
+Le corpus est déterministe pour une graine donnée, ce qui rend les mesures
+comparables d'un commit à l'autre.
+"""
+from models.models import db, Categorie, Document, DocumentTexte, Blob, Fichier
+from services import storage
+from services.recherche_approchee import rebuild_terms
+from services.search_index import FTS_TABLE, is_available
+from sqlalchemy import text
+from datetime import datetime, timedelta
+import hashlib
+import json
+import logging
+import os
+import random
+
+logger = logging.getLogger(__name__)
+
+TAILLE_LOT = 10000
+FICHIERS_DISTINCTS = 200  # Contenus réels sur le disque, partagés par les documents
+FICHIER_PARAMETRES = 'corpus.json'
+DATE_REFERENCE = datetime(2024, 1, 1)
+ETENDUE_JOURS = 3 * 365
+
+THEMES = [
+    'Cultures vivrières', 'Cultures maraîchères', 'Sols et fertilisation', 'Irrigation',
+    'Protection des cultures', 'Semences', 'Élevage bovin', 'Élevage avicole',
+    'Pisciculture', 'Apiculture', 'Agroforesterie', 'Cacao et café',
+    'Transformation des produits', 'Machinisme agricole', 'Économie rurale',
+    'Climat et environnement', 'Foresterie', 'Coopératives', 'Nutrition', 'Stockage',
+]
+
+GENRES = [
+    'Guide pratique', 'Fiche technique', 'Rapport', 'Étude', 'Manuel', 'Synthèse',
+    'Bulletin', 'Compte rendu', 'Note de conjoncture', 'Atlas', 'Diagnostic', 'Plan',
+]
+
+SUJETS = [
+    'de la culture du manioc', 'de la culture du maïs', "de l'irrigation goutte à goutte",
+    'des sols ferralitiques', 'de la fertilisation organique', 'du compostage',
+    'de la lutte contre la chenille légionnaire', "de la production d'ananas",
+    'de la récolte du cacao', 'de la fermentation des fèves', "de l'élevage des poulets de chair",
+    'de la santé animale', 'des pâturages améliorés', 'de la pisciculture en étang',
+    'de la production de miel', 'de la transformation du soja', 'de la filière banane plantain',
+    "du séchage de l'igname", 'des semences certifiées', 'de la gestion post-récolte',
+    "de l'agriculture de conservation", 'du crédit agricole', 'des marchés ruraux',
+    'de la mécanisation légère', "de l'énergie solaire à la ferme", 'de la riziculture irriguée',
+    'de la culture du palmier à huile', 'de la production de café arabica',
+    'de la conservation des sols', 'des variétés résistantes à la sécheresse',
+]
+
+LIEUX = [
+    'au Cameroun', 'dans la région du Centre', 'dans la région du Littoral',
+    "dans l'Ouest", "dans l'Extrême-Nord", 'en zone forestière', 'en zone sahélienne',
+    'en Afrique centrale', 'dans les hautes terres', '',
+]
+
+VOCABULAIRE = (
+    'agriculture agronomie rendement parcelle récolte semis plantation bouture variété '
+    'engrais azote phosphore potassium compost fumier paillage jachère rotation '
+    'irrigation pluviométrie sécheresse humidité drainage bassin forage pompe '
+    'ravageur maladie champignon insecte traitement biopesticide désherbage '
+    'élevage bovin caprin porcin volaille alimentation vaccination vétérinaire '
+    'manioc maïs sorgho mil arachide haricot igname banane plantain cacao café '
+    'ananas tomate piment oignon gombo riz soja palmier hévéa coton '
+    'coopérative producteur marché prix crédit subvention formation vulgarisation '
+    'stockage séchage transformation conditionnement qualité certification '
+    'climat température saison érosion fertilité matière organique biodiversité '
+    'superficie hectare tonne production commercialisation filière exportation '
+    'technique méthode pratique résultat analyse enquête recommandation essai'
+).split()
+
+def _poids_zipf(n):
+    """Fréquences décroissantes (loi de Zipf) : quelques mots très courants"""
+    return [1.0 / (rang + 1) for rang in range(n)]
+
+def parametres_corpus(documents, categories, graine):
+    return {'documents': documents, 'categories': categories, 'graine': graine}
+
+def is_corpus(dossier):
+    """Indique si `dossier` a été créé par generate() (même interrompu)"""
+    return os.path.exists(os.path.join(dossier, FICHIER_PARAMETRES))
+
+def is_current(dossier, parametres):
+    """Indique si `dossier` contient déjà un corpus généré avec ces paramètres"""
+    if not is_corpus(dossier):
+        return False
+    with open(os.path.join(dossier, FICHIER_PARAMETRES), encoding='utf-8') as f:
+        return json.load(f) == parametres
+
+def nom_fichier(doc_id):
+    """Nom public du fichier du document `doc_id` (déterministe)"""
+    extension = ('.pdf', '.pdf', '.docx', '.odt', '.txt')[doc_id % 5]
+    return f"document_{doc_id:07d}{extension}"
+
+def _fichiers(rng, nombre):
+    """Écrit `nombre` contenus factices dans le stockage ; retourne [(sha256, taille)]"""
+    blobs = []
+    for i in range(nombre):
+        # Tailles réparties de 2 Ko à 2 Mo (échelle logarithmique)
+        taille = int(2048 * (1024 ** rng.random()))
+        mots = ' '.join(rng.choices(VOCABULAIRE, k=taille // 6 + 1))
+        contenu = f"Document factice {i}\n{mots}".encode('utf-8')[:taille]
+        sha = hashlib.sha256(contenu).hexdigest()
+        chemin = storage.blob_path(sha)
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        with open(chemin, 'wb') as f:
+            f.write(contenu)
+        blobs.append((sha, len(contenu)))
+    return blobs
+
+def _titre(rng):
+    annee = rng.randint(1995, 2024)
+    lieu = rng.choice(LIEUX)
+    return ' '.join(filter(None, [rng.choice(GENRES), rng.choice(SUJETS), lieu, f'({annee})']))
+
+def generate(dossier, documents=1000, categories=20, graine=42, progress=None):
+    """
+    Remplit la base (vide) de l'application courante. `progress(faits, total)`
+    est appelé après chaque lot. Les insertions passent par le noyau SQLAlchemy,
+    par lots d'une transaction, sans les événements de l'ORM : les compteurs,
+    les colonnes normalisées et le vocabulaire de la recherche approchée sont
+    recalculés à la fin.
+    """
+    # Marqueur posé d'abord : un corpus interrompu reste reconnu et remplaçable
+    with open(os.path.join(dossier, FICHIER_PARAMETRES), 'w', encoding='utf-8') as f:
+        json.dump({}, f)
+
+    rng = random.Random(graine)
+    poids = _poids_zipf(len(VOCABULAIRE))
+    ids_categories = list(range(1, categories + 1))
+    # Catégories de tailles inégales, comme dans une vraie base
+    poids_categories = _poids_zipf(categories)
+    maintenant = datetime.utcnow()
+
+    noms_categories = [
+        THEMES[i % len(THEMES)] + (f' {i // len(THEMES) + 1}' if i >= len(THEMES) else '')
+        for i in range(categories)
+    ]
+    db.session.execute(Categorie.__table__.insert(), [
+        {'id': i + 1, 'nom': nom, 'description': f"Documents sur le thème « {nom} »",
+         'date_creation': maintenant, 'document_count': 0}
+        for i, nom in enumerate(noms_categories)
+    ])
+
+    blobs = _fichiers(rng, min(documents, FICHIERS_DISTINCTS))
+    references = [0] * len(blobs)
+    fts = is_available()
+
+    for debut in range(1, documents + 1, TAILLE_LOT):
+        lignes_documents, lignes_textes, lignes_fichiers, lignes_fts = [], [], [], []
+        for doc_id in range(debut, min(debut + TAILLE_LOT, documents + 1)):
+            titre = _titre(rng)
+            description = ' '.join(rng.choices(VOCABULAIRE, weights=poids, k=rng.randint(8, 30)))
+            contenu = ' '.join(rng.choices(VOCABULAIRE, weights=poids, k=rng.randint(40, 160)))
+            date_ajout = DATE_REFERENCE + timedelta(days=rng.random() * ETENDUE_JOURS)
+            indice_blob = rng.randrange(len(blobs))
+            sha, taille = blobs[indice_blob]
+            references[indice_blob] += 1
+            nom = nom_fichier(doc_id)
+
+            lignes_documents.append({
+                'id': doc_id, 'titre': titre[:200], 'fichier_nom': nom, 'description': description,
+                'categorie_id': rng.choices(ids_categories, weights=poids_categories)[0],
+                'date_ajout': date_ajout, 'date_modification': date_ajout,
+                'taille_fichier': taille, 'nombre_vues': int(rng.paretovariate(1.5)) - 1,
+            })
+            lignes_textes.append({
+                'document_id': doc_id, 'fichier_nom': nom, 'statut': DocumentTexte.STATUT_TERMINE,
+                'contenu': contenu, 'nombre_pages': rng.randint(1, 80), 'extrait': contenu[:300],
+                'tentatives': 1, 'date_extraction': date_ajout,
+            })
+            lignes_fichiers.append({'nom': nom, 'blob_sha256': sha})
+            lignes_fts.append({'id': doc_id, 'titre': titre, 'description': description, 'contenu': contenu})
+
+        db.session.execute(Document.__table__.insert(), lignes_documents)
+        db.session.execute(DocumentTexte.__table__.insert(), lignes_textes)
+        db.session.execute(Fichier.__table__.insert(), lignes_fichiers)
+        if fts:
+            db.session.execute(
+                text(f"INSERT INTO {FTS_TABLE} (rowid, titre, description, contenu) "
+                     "VALUES (:id, :titre, :description, :contenu)"),
+                lignes_fts
+            )
+        db.session.commit()
+        if progress:
+            progress(min(debut + TAILLE_LOT - 1, documents), documents)
+
+    db.session.execute(Blob.__table__.insert(), [
+        {'sha256': sha, 'taille': taille, 'nb_references': nb, 'date_creation': maintenant}
+        for (sha, taille), nb in zip(blobs, references)
+    ])
+    db.session.commit()
+    Categorie.recompute_counts()
+    rebuild_terms(db.session.connection())
+    db.session.commit()
+
+    parametres = parametres_corpus(documents, categories, graine)
+    with open(os.path.join(dossier, FICHIER_PARAMETRES), 'w', encoding='utf-8') as f:
+        json.dump(parametres, f)
+    logger.info(f"Corpus synthétique généré: {documents} document(s), {categories} catégorie(s)")
+
+def describe():
+    """Ce dont les scénarios ont besoin pour construire leurs URL"""
+    ids_categories = [i for i, in db.session.query(Categorie.id).order_by(Categorie.id)]
+    nb_documents = db.session.query(db.func.max(Document.id)).scalar() or 0
+    return {
+        'categories': ids_categories,
+        'documents': nb_documents,
+        'termes': VOCABULAIRE[:40] + ['manioc récolte', 'irrigation sols', 'élevage volaille', 'cacao'],
+    }
@@ -0,0 +1,386 @@
+"""
+Banc de mesure des pages principales sur un corpus synthétique.
+
+    python -m benchmarks.run --documents 100000 --requetes 300
+    python -m benchmarks.run --documents 1000000 --dossier /var/tmp/corpus-1m
+    python -m benchmarks.run --serveur --concurrence 8 --comparer ancien.json
+
+Chaque scénario est joué via le client de test Flask (par défaut) ou un
+serveur WSGI local multi-threadé (--serveur). Le rapport donne le débit, les
+latences p50/p95/p99 et le nombre de requêtes SQL par page ; il est écrit en
+JSON avec le commit mesuré pour comparer les exécutions entre elles. Un
+scénario dont une réponse n'est pas 200 est marqué en échec : ses latences
+ne sont ni affichées ni comparées, et la commande se termine en erreur.
+Avec --dossier, le corpus est conservé et réutilisé tant que ses paramètres
+ne changent pas (la génération d'un million de documents prend du temps).
+"""
+from sqlalchemy import event
+from werkzeug.serving import make_server
+from datetime import datetime
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DOSSIER_RESULTATS = os.path.join(RACINE, 'benchmarks', 'resultats')
+
+# ==================== SCÉNARIOS ====================
+def _categorie(rng, corpus):
+    return rng.choice(corpus['categories'])
+
+def _document(rng, corpus):
+    return rng.randint(1, corpus['documents'])
+
+def _url_categorie(rng, corpus):
+    tri = rng.choice(['date_desc', 'date_desc', 'titre_asc', 'vues_desc'])
+    return f"/categorie/{_categorie(rng, corpus)}?sort={tri}"
+
+def _url_recherche(rng, corpus):
+    url = f"/search?q={urllib.parse.quote(rng.choice(corpus['termes']))}"
+    if rng.random() < 0.3:
+        url += f"&categorie={_categorie(rng, corpus)}"
+    return url
+
+def _url_fichier(rng, corpus):
+    from benchmarks.corpus import nom_fichier
+    return f"/uploads/{nom_fichier(_document(rng, corpus))}"
+
+# nom -> (fabrique d'URL, session administrateur)
+SCENARIOS = {
+    'index': (lambda rng, corpus: '/', False),
+    'show_category': (_url_categorie, False),
+    'search': (_url_recherche, False),
+    'show_document': (lambda rng, corpus: f"/document/{_document(rng, corpus)}", False),
+    'uploaded_file': (_url_fichier, False),
+    'admin.dashboard': (lambda rng, corpus: '/admin/dashboard', True),
+}
+
+STATUT_ATTENDU = 200  # Toute autre réponse invalide les mesures du scénario
+
+# Recherches limites (mots trop courts pour être corrigés, ponctuation seule) :
+# la page doit s'afficher, pas rediriger vers l'accueil sur une erreur
+RECHERCHES_LIMITES = ('jus', 'a"b', '"""', '!!')
+
+def verifier_recherches(app):
+    """Liste des URL de RECHERCHES_LIMITES qui ne répondent pas 200"""
+    client = app.test_client()
+    echecs = []
+    for q in RECHERCHES_LIMITES:
+        for url in (f"/search?q={urllib.parse.quote(q)}", f"/api/v1/search?q={urllib.parse.quote(q)}"):
+            try:
+                reponse = client.get(url)
+            except Exception as e:
+                echecs.append(f"{url} -> {type(e).__name__}: {e}")
+                continue
+            if reponse.status_code != 200:
+                echecs.append(f"{url} -> {reponse.status_code}")
+            reponse.close()
+    return echecs
+
+# ==================== MESURES ====================
+class CompteurSQL:
+    """Compte les requêtes SQL exécutées par le moteur"""
+
+    def __init__(self):
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        with self._lock:
+            self.total += 1
+
+def percentile(valeurs_triees, p):
+    """Percentile par rang le plus proche"""
+    if not valeurs_triees:
+        return 0.0
+    rang = max(0, min(len(valeurs_triees) - 1, int(round(p / 100 * len(valeurs_triees) + 0.5)) - 1))
+    return valeurs_triees[rang]
+
+def resume(durees, statuts, requetes_sql, duree_totale):
+    durees = sorted(durees)
+    ms = lambda s: round(s * 1000, 3)
+    resultat = {
+        'requetes': len(durees),
+        'statuts': {str(code): statuts.count(code) for code in sorted(set(statuts))},
+        # Latences d'une page qui redirige ou échoue : ne mesurent pas la page
+        'valide': bool(statuts) and all(code == STATUT_ATTENDU for code in statuts),
+        'debit': round(len(durees) / duree_totale, 1) if duree_totale else 0.0,
+        'moyenne_ms': ms(sum(durees) / len(durees)) if durees else 0.0,
+        'p50_ms': ms(percentile(durees, 50)),
+        'p95_ms': ms(percentile(durees, 95)),
+        'p99_ms': ms(percentile(durees, 99)),
+        'max_ms': ms(durees[-1]) if durees else 0.0,
+    }
+    if isinstance(requetes_sql, list):
+        resultat['sql_moyenne'] = round(sum(requetes_sql) / len(requetes_sql), 2) if requetes_sql else 0.0
+        resultat['sql_max'] = max(requetes_sql, default=0)
+    else:
+        resultat['sql_moyenne'] = round(requetes_sql / len(durees), 2) if durees else 0.0
+    return resultat
+
+def jouer_client(app, compteur, corpus, nom, nombre, echauffement, graine):
+    """Requêtes séquentielles via le client de test : SQL compté requête par requête"""
+    fabrique, admin = SCENARIOS[nom]
+    rng = random.Random(f"{graine}-{nom}")
+    client = app.test_client()
+    if admin:
+        with client.session_transaction() as session:
+            session['is_admin'] = True
+            session['username'] = 'benchmark'
+
+    for _ in range(echauffement):
+        client.get(fabrique(rng, corpus)).close()
+
+    durees, statuts, requetes_sql = [], [], []
+    debut_total = time.perf_counter()
+    for _ in range(nombre):
+        url = fabrique(rng, corpus)
+        avant = compteur.total
+        debut = time.perf_counter()
+        reponse = client.get(url)
+        reponse.get_data()
+        durees.append(time.perf_counter() - debut)
+        reponse.close()
+        requetes_sql.append(compteur.total - avant)
+        statuts.append(reponse.status_code)
+    return resume(durees, statuts, requetes_sql, time.perf_counter() - debut_total)
+
+def _cookie_admin(app):
+    """Cookie de session administrateur signé avec la clé de l'application"""
+    serialiseur = app.session_interface.get_signing_serializer(app)
+    valeur = serialiseur.dumps({'is_admin': True, 'username': 'benchmark'})
+    return f"{app.config.get('SESSION_COOKIE_NAME', 'session')}={valeur}"
+
+def jouer_serveur(app, compteur, corpus, nom, nombre, echauffement, graine, port, concurrence):
+    """Requêtes concurrentes sur le serveur local (connexions persistantes)"""
+    fabrique, admin = SCENARIOS[nom]
+    rng = random.Random(f"{graine}-{nom}")
+    urls = [fabrique(rng, corpus) for _ in range(echauffement + nombre)]
+    entetes = {'Cookie': _cookie_admin(app)} if admin else {}
+
+    def requete(connexion, url):
+        connexion.request('GET', url, headers=entetes)
+        reponse = connexion.getresponse()
+        reponse.read()
+        return reponse.status
+
+    connexion = http.client.HTTPConnection('127.0.0.1', port)
+    for url in urls[:echauffement]:
+        requete(connexion, url)
+    connexion.close()
+
+    a_jouer = urls[echauffement:]
+    durees, statuts = [], []
+    lock = threading.Lock()
+
+    def travailleur(indice):
+        connexion = http.client.HTTPConnection('127.0.0.1', port)
+        locales = []
+        for url in a_jouer[indice::concurrence]:
+            debut = time.perf_counter()
+            statut = requete(connexion, url)
+            locales.append((time.perf_counter() - debut, statut))
+        connexion.close()
+        with lock:
+            for duree, statut in locales:
+                durees.append(duree)
+                statuts.append(statut)
+
+    avant = compteur.total
+    debut_total = time.perf_counter()
+    threads = [threading.Thread(target=travailleur, args=(i,)) for i in range(concurrence)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return resume(durees, statuts, compteur.total - avant, time.perf_counter() - debut_total)
+
+# ==================== ENVIRONNEMENT ====================
+def commit_courant():
+    """Commit mesuré (suffixé de -modifie si l'arbre de travail a des changements)"""
+    try:
+        sha = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=RACINE, capture_output=True,
+                             text=True, check=True).stdout.strip()
+        modifie = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=RACINE,
+                                 capture_output=True, text=True).stdout.strip()
+        return sha + ('-modifie' if modifie else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def creer_application(dossier, avec_cache):
+    # app.py crée aussi une application à l'import : elle doit viser le même dossier
+    os.environ.update({
+        'DATABASE_URI': f"sqlite:///{os.path.join(dossier, 'database.db')}",
+        'UPLOAD_FOLDER': os.path.join(dossier, 'uploads'),
+        'CACHE_DIR': os.path.join(dossier, 'cache'),
+        'SIMILARITE_DOSSIER': os.path.join(dossier, 'similarite'),
+    })
+    from config import Config
+    from app import create_app
+
+    class BenchmarkConfig(Config):
+        SECRET_KEY = 'benchmark'
+        RESPONSE_CACHE_ENABLED = avec_cache
+        WTF_CSRF_ENABLED = False
+
+    return create_app(BenchmarkConfig)
+
+def comparer(resultats, chemin):
+    """Affiche l'évolution des latences par rapport à une exécution précédente"""
+    with open(chemin, encoding='utf-8') as f:
+        ancien = json.load(f)
+    print(f"\nComparaison avec {ancien.get('commit') or '?'} ({os.path.basename(chemin)})")
+    if ancien.get('parametres') != resultats['parametres']:
+        print(f"  ⚠️ Paramètres différents: {ancien.get('parametres')}")
+    for nom, actuel in resultats['scenarios'].items():
+        precedent = ancien.get('scenarios', {}).get(nom)
+        if not precedent:
+            continue
+        if not actuel['valide'] or not precedent.get('valide', True):
+            print(f"  {nom:<16} non comparable (réponses autres que {STATUT_ATTENDU})")
+            continue
+        colonnes = []
+        for cle in ('p50_ms', 'p95_ms', 'p99_ms', 'sql_moyenne'):
+            avant, apres = precedent.get(cle, 0), actuel.get(cle, 0)
+            ecart = f"{(apres - avant) / avant * 100:+.0f}%" if avant else 'n/a'
+            colonnes.append(f"{cle.replace('_ms', '')} {avant}→{apres} ({ecart})")
+        print(f"  {nom:<16} " + ' | '.join(colonnes))
+
+def afficher(resultats):
+    print(f"\n{'scénario':<16} {'req':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'max ms':>8} {'SQL':>6}  statuts")
+    for nom, r in resultats['scenarios'].items():
+        if not r['valide']:
+            print(f"{nom:<16} {r['requetes']:>5} {'ÉCHEC':>8}  réponses autres que {STATUT_ATTENDU}: {r['statuts']}")
+            continue
+        print(f"{nom:<16} {r['requetes']:>5} {r['debit']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} "
+              f"{r['p99_ms']:>8} {r['max_ms']:>8} {r['sql_moyenne']:>6}  {r['statuts']}")
+
+# ==================== POINT D'ENTRÉE ====================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesure les pages principales sur un corpus synthétique")
+    parser.add_argument('--documents', type=int, default=1000, help="Taille du corpus (défaut: 1000)")
+    parser.add_argument('--categories', type=int, default=20, help="Nombre de catégories (défaut: 20)")
+    parser.add_argument('--graine', type=int, default=42, help="Graine du corpus et des URL (défaut: 42)")
+    parser.add_argument('--requetes', type=int, default=200, help="Requêtes mesurées par scénario")
+    parser.add_argument('--echauffement', type=int, default=20, help="Requêtes non mesurées par scénario")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help="Scénarios séparés par des virgules (défaut: tous)")
+    parser.add_argument('--sans-cache', action='store_true', help="Désactive le cache des pages publiques")
+    parser.add_argument('--serveur', action='store_true', help="Passe par un serveur WSGI local")
+    parser.add_argument('--concurrence', type=int, default=4, help="Clients simultanés avec --serveur")
+    parser.add_argument('--dossier', help="Dossier du corpus, conservé et réutilisé (défaut: temporaire)")
+    parser.add_argument('--sortie', help="Fichier JSON du rapport (défaut: benchmarks/resultats/)")
+    parser.add_argument('--comparer', help="Rapport JSON d'une exécution précédente")
+    args = parser.parse_args(argv)
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    inconnus = [s for s in scenarios if s not in SCENARIOS]
+    if inconnus:
+        parser.error(f"Scénario(s) inconnu(s): {', '.join(inconnus)} (valeurs: {', '.join(SCENARIOS)})")
+
+    logging.getLogger().setLevel(logging.WARNING)
+    sys.path.insert(0, RACINE)
+    from benchmarks import corpus as corpus_synthetique
+
+    dossier = args.dossier or tempfile.mkdtemp(prefix='benchmark-')
+    parametres = corpus_synthetique.parametres_corpus(args.documents, args.categories, args.graine)
+    reutilise = corpus_synthetique.is_current(dossier, parametres)
+    if not reutilise:
+        # Seul un dossier de corpus (ou le dossier temporaire, vide) peut être vidé
+        if os.path.isdir(dossier) and os.listdir(dossier) and not corpus_synthetique.is_corpus(dossier):
+            parser.error(f"{dossier} n'est pas vide et ne contient pas de corpus "
+                         f"({corpus_synthetique.FICHIER_PARAMETRES}) : il ne sera pas supprimé")
+        shutil.rmtree(dossier, ignore_errors=True)
+        os.makedirs(dossier)
+
+    try:
+        app = creer_application(dossier, avec_cache=not args.sans_cache)
+        from models.models import db
+
+        with app.app_context():
+            duree_generation = None
+            if not reutilise:
+                debut = time.perf_counter()
+                corpus_synthetique.generate(
+                    dossier, args.documents, args.categories, args.graine,
+                    progress=lambda faits, total: print(f"\r  Corpus: {faits}/{total} document(s)", end='', flush=True)
+                )
+                duree_generation = round(time.perf_counter() - debut, 1)
+                print()
+            corpus = corpus_synthetique.describe()
+            echecs = verifier_recherches(app)
+            if echecs:
+                raise SystemExit("Recherches limites en erreur:\n  " + '\n  '.join(echecs))
+            compteur = CompteurSQL()
+            # Le pool en lecture seule éventuel (SQLITE_LECTURE_SEPAREE) est compté aussi
+            for engine in (db.engine, app.extensions.get('sqlite_lecture')):
+                if engine is not None:
+                    event.listen(engine, 'before_cursor_execute', compteur)
+
+        serveur = None
+        if args.serveur:
+            serveur = make_server('127.0.0.1', 0, app, threaded=True)
+            threading.Thread(target=serveur.serve_forever, daemon=True).start()
+
+        resultats = {
+            'commit': commit_courant(),
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'plateforme': platform.platform(),
+            'parametres': {**parametres, 'requetes': args.requetes, 'echauffement': args.echauffement,
+                           'cache': not args.sans_cache,
+                           'mode': f"serveur x{args.concurrence}" if args.serveur else 'client'},
+            'generation_corpus_s': duree_generation,
+            'scenarios': {},
+        }
+        for nom in scenarios:
+            print(f"  {nom}...", flush=True)
+            if serveur:
+                resultats['scenarios'][nom] = jouer_serveur(
+                    app, compteur, corpus, nom, args.requetes, args.echauffement,
+                    args.graine, serveur.server_port, max(1, args.concurrence))
+            else:
+                resultats['scenarios'][nom] = jouer_client(
+                    app, compteur, corpus, nom, args.requetes, args.echauffement, args.graine)
+        if serveur:
+            serveur.shutdown()
+        # Vues en attente écrites tant que la base existe encore
+        from services.view_counter import view_counter
+        view_counter.flush()
+    finally:
+        if not args.dossier:
+            shutil.rmtree(dossier, ignore_errors=True)
+
+    afficher(resultats)
+    sortie = args.sortie
+    if not sortie:
+        os.makedirs(DOSSIER_RESULTATS, exist_ok=True)
+        etiquette = (resultats['commit'] or 'inconnu')[:12]
+        sortie = os.path.join(DOSSIER_RESULTATS, f"{datetime.now():%Y%m%d-%H%M%S}-{etiquette}-{args.documents}.json")
+    with open(sortie, 'w', encoding='utf-8') as f:
+        json.dump(resultats, f, ensure_ascii=False, indent=2)
+    print(f"\nRapport: {sortie}")
+
+    if args.comparer:
+        comparer(resultats, args.comparer)
+
+    echecs = [nom for nom, r in resultats['scenarios'].items() if not r['valide']]
+    if echecs:
+        raise SystemExit(f"\n⚠️ Scénario(s) en échec, mesures non valides: {', '.join(echecs)}")
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,17 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, session, jsonify
 from models.models import db, Document, Categorie, User, Configuration
-from werkzeug.utils import secure_filename
+from services import search_index
+from services.cache import invalidate_documents, invalidate_configuration, invalidate_users
+from services.statistiques import dashboard_stats
+from services import response_cache
+from services.extraction import text_extractor
+from services.similarite import similarity_engine
+from services.autocompletion import autocomplete_index
+from services import storage, chunked_upload
 from functools import wraps
 import logging
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
@@ -26,44 +33,33 @@ def allowed_file(filename):
     """Vérifie si l'extension du fichier est autorisée"""
     return os.path.splitext(filename)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
 
-def get_unique_filename(filename):
-    """Génère un nom de fichier unique pour éviter les conflits"""
-    filename = secure_filename(filename)
-    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-    
-    if not os.path.exists(filepath):
-        return filename
-    
-    base, ext = os.path.splitext(filename)
-    counter = 1
-    
-    while os.path.exists(filepath):
-        filename = f"{base}_{counter}{ext}"
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-        counter += 1
-    
-    return filename
+def create_document(titre, description, categorie_id, fichier_nom, taille):
+    """Crée un document dans la transaction courante, l'indexe et prépare son extraction"""
+    doc = Document(
+        titre=titre,
+        description=description,
+        fichier_nom=fichier_nom,
+        categorie_id=categorie_id,
+        taille_fichier=taille
+    )
+    db.session.add(doc)
+    search_index.index_document(doc)
+    text_extractor.prepare(doc)
+    return doc
 
-def delete_file_safe(filename):
-    """Supprime un fichier de manière sécurisée"""
-    try:
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-        if os.path.exists(filepath):
-            os.remove(filepath)
-            logger.info(f"Fichier supprimé: {filename}")
-            return True
-    except Exception as e:
-        logger.error(f"Erreur lors de la suppression du fichier {filename}: {str(e)}")
-    return False
+def replace_document_file(doc, fichier_nom, taille):
+    """Remplace le fichier d'un document (dans la transaction courante)"""
+    storage.release(doc.fichier_nom)
+    doc.fichier_nom = fichier_nom
+    doc.taille_fichier = taille
+    # Le contenu de l'ancien fichier ne doit plus être trouvé
+    search_index.index_document(doc, contenu='')
+    text_extractor.prepare(doc)
 
-def get_file_size(filepath):
-    """Retourne la taille d'un fichier en octets"""
-    try:
-        if os.path.exists(filepath):
-            return os.path.getsize(filepath)
-    except Exception as e:
-        logger.error(f"Erreur lors de la récupération de la taille: {str(e)}")
-    return None
+def purge_document_pages(*categorie_ids):
+    """Purge les pages publiques affichant les documents des catégories données"""
+    response_cache.purge('documents:recent', 'categories',
+                         *(f'category:{int(id)}' for id in categorie_ids if id))
 
 # ==================== DASHBOARD ====================
 @admin_bp.route('/')
@@ -73,23 +69,12 @@ def dashboard():
     """Dashboard administrateur avec statistiques"""
     try:
         categories = Categorie.query.order_by(Categorie.nom.asc()).all()
-        documents = Document.query.order_by(Document.date_ajout.desc()).limit(10).all()
-        users = User.query.all()
-        
-        # Statistiques avancées
-        date_limite = datetime.utcnow() - timedelta(days=7)
-        documents_recents = Document.query.filter(Document.date_ajout >= date_limite).count()
+        documents = Document.query.options(db.joinedload(Document.categorie)) \
+            .order_by(Document.date_ajout.desc()).limit(10).all()
+        users = User.query.order_by(User.username.asc()).all()
         
-        # Top 5 documents les plus vus
-        top_documents = Document.query.order_by(Document.nombre_vues.desc()).limit(5).all()
-        
-        stats = {
-            'total_categories': len(categories),
-            'total_documents': Document.query.count(),
-            'total_users': len(users),
-            'documents_recents': documents_recents,
-            'top_documents': top_documents
-        }
+        # Statistiques agrégées (instantané en cache, voir services/statistiques.py)
+        stats = dashboard_stats.snapshot()
         
         return render_template('admin.html', 
                              categories=categories, 
@@ -101,6 +86,12 @@ def dashboard():
         flash("Une erreur est survenue.", 'error')
         return redirect(url_for('documents.index'))
 
+@admin_bp.route('/stats.json')
+@login_required_admin
+def stats_json():
+    """Statistiques du tableau de bord au format JSON (rafraîchissement périodique)"""
+    return jsonify(dict(dashboard_stats.to_json(), caches=response_cache.caches_stats()))
+
 # ==================== GESTION DES CATEGORIES ====================
 @admin_bp.route('/add-category', methods=['POST'])
 @login_required_admin
@@ -123,6 +114,8 @@ def add_category():
         new_cat = Categorie(nom=nom, description=description)
         db.session.add(new_cat)
         db.session.commit()
+        invalidate_documents()
+        response_cache.purge('categories')
         logger.info(f"Catégorie ajoutée: {nom}")
         flash("Catégorie ajoutée avec succès.", 'success')
     except Exception as e:
@@ -150,6 +143,8 @@ def edit_category(id):
             cat.nom = nom
             cat.description = description
             db.session.commit()
+            invalidate_documents()
+            response_cache.purge('categories', f'category:{id}')
             logger.info(f"Catégorie modifiée: {nom}")
             flash('Catégorie mise à jour avec succès.', 'success')
             return redirect(url_for('admin.dashboard'))
@@ -168,12 +163,18 @@ def delete_category(id):
         cat = Categorie.query.get_or_404(id)
         
         # Supprimer les fichiers associés
+        doc_ids = []
         for doc in cat.documents:
-            delete_file_safe(doc.fichier_nom)
+            doc_ids.append(doc.id)
+            storage.release(doc.fichier_nom)
+            search_index.remove_document(doc.id)
         
         # La cascade s'occupe de supprimer les documents
         db.session.delete(cat)
         db.session.commit()
+        invalidate_documents()
+        purge_document_pages(id)
+        similarity_engine.submit_removal(doc_ids)
         logger.info(f"Catégorie supprimée: {cat.nom}")
         flash('Catégorie supprimée avec succès.', 'success')
     except Exception as e:
@@ -207,6 +208,7 @@ def add_document():
     
     success_count = 0
     error_count = 0
+    nouveaux_documents = []
     
     try:
         for file in files:
@@ -216,25 +218,22 @@ def add_document():
                     error_count += 1
                     continue
                 
-                filename = get_unique_filename(file.filename)
-                filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+                # Écriture hachée en flux ; un contenu déjà stocké n'est pas dupliqué
+                filename, taille = storage.save_upload(file)
                 
-                file.save(filepath)
-                
-                # Récupérer la taille du fichier
-                taille = get_file_size(filepath)
-                
-                doc = Document(
-                    titre=f"{titre} - {filename}" if len(files) > 1 else titre,
-                    description=description,
-                    fichier_nom=filename,
-                    categorie_id=categorie_id,
-                    taille_fichier=taille
+                doc = create_document(
+                    f"{titre} - {filename}" if len(files) > 1 else titre,
+                    description, categorie_id, filename, taille
                 )
-                db.session.add(doc)
+                nouveaux_documents.append(doc)
                 success_count += 1
         
         db.session.commit()
+        invalidate_documents()
+        purge_document_pages(categorie_id)
+        
+        # L'extraction du texte se fait en arrière-plan, après la validation
+        text_extractor.submit([doc.id for doc in nouveaux_documents])
         
         if success_count > 0:
             logger.info(f"{success_count} document(s) ajouté(s)")
@@ -266,6 +265,7 @@ def edit_document(id):
             return render_template('edit_document.html', document=doc, categories=Categorie.query.all())
         
         try:
+            ancienne_categorie = doc.categorie_id
             doc.titre = titre
             doc.description = description
             doc.categorie_id = categorie_id
@@ -277,18 +277,19 @@ def edit_document(id):
                     flash("Extension de fichier non autorisée.", 'warning')
                     return render_template('edit_document.html', document=doc, categories=Categorie.query.all())
                 
-                # Supprimer l'ancien fichier
-                delete_file_safe(doc.fichier_nom)
-                
-                # Sauvegarder le nouveau
-                filename = get_unique_filename(file.filename)
-                filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                
-                doc.fichier_nom = filename
-                doc.taille_fichier = get_file_size(filepath)
+                # Sauvegarder le nouveau fichier et libérer l'ancien
+                replace_document_file(doc, *storage.save_upload(file))
+            else:
+                search_index.index_document(doc)
             
             db.session.commit()
+            invalidate_documents()
+            purge_document_pages(ancienne_categorie, categorie_id)
+            
+            if file and file.filename:
+                text_extractor.submit([doc.id])
+            else:
+                similarity_engine.submit_update([doc.id])
             logger.info(f"Document modifié: {titre}")
             flash('Document mis à jour avec succès.', 'success')
             return redirect(url_for('admin.dashboard'))
@@ -307,9 +308,13 @@ def delete_document(id):
     """Supprime un document"""
     try:
         doc = Document.query.get_or_404(id)
-        delete_file_safe(doc.fichier_nom)
+        storage.release(doc.fichier_nom)
+        search_index.remove_document(doc.id)
         db.session.delete(doc)
         db.session.commit()
+        invalidate_documents()
+        purge_document_pages(doc.categorie_id)
+        similarity_engine.submit_removal([id])
         logger.info(f"Document supprimé: {doc.titre}")
         flash('Document supprimé avec succès.', 'success')
     except Exception as e:
@@ -319,6 +324,111 @@ def delete_document(id):
     
     return redirect(url_for('admin.dashboard'))
 
+# ==================== UPLOAD PAR MORCEAUX ====================
+# Protocole : POST /uploads ouvre l'upload, PUT /uploads/<id>/chunks/<n> envoie
+# les morceaux dans l'ordre (corps brut, en-tête X-Chunk-Sha256 optionnel),
+# GET /uploads/<id> indique où reprendre, POST /uploads/<id>/complete vérifie
+# l'empreinte et crée (ou met à jour) le document.
+@admin_bp.errorhandler(chunked_upload.UploadError)
+def upload_error(e):
+    return jsonify({'erreur': str(e)}), e.status
+
+def _upload_status(meta):
+    return {
+        'upload_id': meta['upload_id'],
+        'next_chunk': meta['next_chunk'],
+        'offset': meta['offset'],
+        'chunk_size': current_app.config.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024),
+    }
+
+@admin_bp.route('/uploads', methods=['POST'])
+@login_required_admin
+def start_upload():
+    """Ouvre un upload par morceaux"""
+    data = request.get_json(silent=True) or request.form
+    filename = (data.get('filename') or '').strip()
+    
+    if not filename or not allowed_file(filename):
+        return jsonify({'erreur': "Nom de fichier manquant ou extension non autorisée."}), 400
+    
+    meta = chunked_upload.create(filename, data.get('taille'), data.get('sha256'))
+    logger.info(f"Upload par morceaux ouvert: {filename} ({meta['upload_id']})")
+    return jsonify(_upload_status(meta)), 201
+
+@admin_bp.route('/uploads/<upload_id>', methods=['GET'])
+@login_required_admin
+def upload_status(upload_id):
+    """Indique le prochain morceau attendu (reprise après coupure)"""
+    return jsonify(_upload_status(chunked_upload.load(upload_id)))
+
+@admin_bp.route('/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@login_required_admin
+def upload_chunk(upload_id, index):
+    """Reçoit un morceau en flux et l'ajoute au fichier de travail"""
+    meta = chunked_upload.write_chunk(
+        upload_id, index, request.stream, request.headers.get('X-Chunk-Sha256')
+    )
+    return jsonify(_upload_status(meta))
+
+@admin_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@login_required_admin
+def complete_upload(upload_id):
+    """Vérifie le fichier reçu, le range dans le stockage et crée le document"""
+    data = request.get_json(silent=True) or request.form
+    document_id = data.get('document_id')
+    titre = (data.get('titre') or '').strip()
+    categorie_id = data.get('categorie_id')
+    
+    if not document_id and (not titre or not categorie_id):
+        return jsonify({'erreur': "Le titre et la catégorie sont requis."}), 400
+
+    try:
+        document_id = int(document_id) if document_id else None
+        categorie_id = int(categorie_id) if categorie_id else None
+    except (TypeError, ValueError):
+        return jsonify({'erreur': "Identifiant de document ou de catégorie invalide."}), 400
+
+    doc = None
+    if document_id is not None:
+        doc = db.session.get(Document, document_id)
+        if doc is None:
+            return jsonify({'erreur': "Document introuvable."}), 404
+    elif db.session.get(Categorie, categorie_id) is None:
+        return jsonify({'erreur': "Catégorie introuvable."}), 400
+
+    data_path, sha256, taille, filename = chunked_upload.finish(upload_id, data.get('sha256'))
+    
+    try:
+        fichier_nom = storage.promote(data_path, sha256, taille, filename)
+        
+        if doc is not None:
+            replace_document_file(doc, fichier_nom, taille)
+            doc.date_modification = datetime.utcnow()
+        else:
+            doc = create_document(titre, (data.get('description') or '').strip(),
+                                  categorie_id, fichier_nom, taille)
+        
+        db.session.commit()
+        invalidate_documents()
+        purge_document_pages(doc.categorie_id)
+        text_extractor.submit([doc.id])
+        chunked_upload.discard(upload_id)
+        logger.info(f"Upload par morceaux terminé: {fichier_nom} ({taille} octets)")
+        return jsonify({'document_id': doc.id, 'fichier_nom': fichier_nom, 'sha256': sha256, 'taille': taille})
+    except Exception as e:
+        # L'annulation supprime le fichier reçu : l'upload est à recommencer
+        db.session.rollback()
+        chunked_upload.discard(upload_id)
+        logger.error(f"Erreur lors de la finalisation de l'upload {upload_id}: {str(e)}")
+        return jsonify({'erreur': "Erreur lors de l'enregistrement du document."}), 500
+
+@admin_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@login_required_admin
+def abort_upload(upload_id):
+    """Abandonne un upload par morceaux"""
+    chunked_upload.discard(upload_id)
+    return '', 204
+
 # ==================== GESTION DES CONFIGURATIONS ====================
 @admin_bp.route('/update_announcement', methods=['POST'])
 @login_required_admin
@@ -360,6 +470,7 @@ def create_admin_user():
         user.set_password(password)
         db.session.add(user)
         db.session.commit()
+        invalidate_users()
         logger.info(f"Utilisateur créé: {username} (Admin: {is_admin})")
         flash(f"Utilisateur '{username}' créé avec succès.", 'success')
     except Exception as e:
@@ -384,6 +495,7 @@ def delete_user(id):
         username = user.username
         db.session.delete(user)
         db.session.commit()
+        invalidate_users()
         logger.info(f"Utilisateur supprimé: {username}")
         flash(f"Utilisateur '{username}' supprimé avec succès.", 'success')
         
@@ -408,7 +520,14 @@ def reset_db():
     try:
         db.drop_all()
         db.create_all()
+        search_index.rebuild_index()
         db.session.commit()
+        invalidate_documents()
+        invalidate_configuration()
+        invalidate_users()
+        response_cache.purge(response_cache.TAG_PAGES)
+        similarity_engine.reset()
+        autocomplete_index.invalidate()
         logger.warning("⚠️ Base de données réinitialisée!")
         flash('Base de données réinitialisée. Toutes les données ont été supprimées.', 'warning')
     except Exception as e:
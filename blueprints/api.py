@@ -0,0 +1,242 @@
+"""API JSON en lecture seule (v1) : documents, catégories et recherche"""
+from flask import Blueprint, request, jsonify, current_app, g
+from models.models import db, Document, Categorie
+from services.cache import documents_generation
+from services.pagination import paginate_keyset, sort_key, count_cache, SORTS
+from services.recherche import build_search, search_order, parse_date
+from sqlalchemy import func
+from functools import wraps
+from werkzeug.exceptions import HTTPException
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+LIMITE_DEFAUT = 20
+LIMITE_MAX = 100
+MAX_IDS = 200
+
+# Champs exposés et colonnes à charger pour chacun (fields=...)
+CHAMPS_DOCUMENT = {
+    'id': (Document.id,),
+    'titre': (Document.titre,),
+    'description': (Document.description,),
+    'fichier_nom': (Document.fichier_nom,),
+    'categorie_id': (Document.categorie_id,),
+    'categorie_nom': (Document.categorie_id,),  # Plus une jointure sur la catégorie
+    'date_ajout': (Document.date_ajout,),
+    'date_modification': (Document.date_modification,),
+    'taille_fichier': (Document.taille_fichier,),
+    'nombre_vues': (Document.nombre_vues,),
+}
+
+CHAMPS_CATEGORIE = {
+    'id': (Categorie.id,),
+    'nom': (Categorie.nom,),
+    'description': (Categorie.description,),
+    'date_creation': (Categorie.date_creation,),
+    'nb_documents': (Categorie.document_count,),
+}
+
+# Champs modifiés sans écriture d'administration : l'ETag est alors calculé sur le contenu
+CHAMPS_VOLATILS = {'nombre_vues'}
+
+@api_bp.before_request
+def marquer_lecture_seule():
+    """L'API ne fait que des lectures : pool en lecture seule s'il est activé"""
+    g.lecture_seule = True
+
+class ApiError(Exception):
+    """Erreur renvoyée au client en JSON avec un code HTTP"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+@api_bp.errorhandler(ApiError)
+def api_error(e):
+    return jsonify({'erreur': str(e)}), e.status
+
+# Les gestionnaires par code de l'application (pages HTML) passent avant ceux par classe
+@api_bp.errorhandler(400)
+@api_bp.errorhandler(404)
+@api_bp.errorhandler(HTTPException)
+def http_error(e):
+    return jsonify({'erreur': e.description}), e.code
+
+# ==================== PARAMÈTRES ====================
+def _fields(champs):
+    """Champs demandés par fields=a,b,c (tous par défaut) ; id est toujours inclus"""
+    demande = request.args.get('fields')
+    if not demande:
+        return list(champs)
+    fields = [f.strip() for f in demande.split(',') if f.strip()]
+    inconnus = [f for f in fields if f not in champs]
+    if inconnus:
+        raise ApiError(f"Champ(s) inconnu(s): {', '.join(inconnus)}")
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return fields
+
+def _ids():
+    """Liste ids=1,2,3 pour une lecture groupée, ou None"""
+    brut = request.args.get('ids')
+    if brut is None:
+        return None
+    try:
+        ids = [int(x) for x in brut.split(',') if x.strip()]
+    except ValueError:
+        raise ApiError("ids doit être une liste d'entiers séparés par des virgules")
+    if len(ids) > MAX_IDS:
+        raise ApiError(f"Au plus {MAX_IDS} identifiants par requête")
+    return ids
+
+def _limit():
+    limit = request.args.get('limit', LIMITE_DEFAUT, type=int)
+    return max(1, min(limit, LIMITE_MAX))
+
+def _sort(defaut='date_desc'):
+    sort_by = request.args.get('sort', defaut)
+    if sort_by not in SORTS and sort_by != 'pertinence':
+        raise ApiError(f"Tri inconnu: {sort_by} (valeurs: {', '.join(['pertinence', *SORTS])})")
+    return sort_by
+
+def _date(nom):
+    try:
+        return parse_date(request.args.get(nom))
+    except ValueError:
+        raise ApiError(f"{nom} doit être au format AAAA-MM-JJ")
+
+# ==================== REQUÊTES ====================
+def _document_query(fields):
+    """Document.query ne chargeant que les colonnes des champs demandés"""
+    colonnes = {colonne for champ in fields for colonne in CHAMPS_DOCUMENT[champ]}
+    query = Document.query.options(db.load_only(*colonnes))
+    if 'categorie_nom' in fields:
+        query = query.options(db.joinedload(Document.categorie).load_only(Categorie.nom))
+    return query
+
+def _categorie_query(fields):
+    colonnes = {colonne for champ in fields for colonne in CHAMPS_CATEGORIE[champ]}
+    return Categorie.query.options(db.load_only(*colonnes))
+
+def _bulk(query, modele, ids, fields):
+    """Lecture groupée en une requête IN, dans l'ordre demandé"""
+    objets = {o.id: o for o in query.filter(modele.id.in_(ids)).all()} if ids else {}
+    return {
+        'data': [objets[i].to_dict(fields) for i in ids if i in objets],
+        'manquants': [i for i in ids if i not in objets],
+    }
+
+def _page(pagination, fields):
+    return {
+        'data': [doc.to_dict(fields) for doc in pagination.items],
+        'next_cursor': pagination.next_cursor,
+        'prev_cursor': pagination.prev_cursor,
+        'total': pagination.total,
+    }
+
+# ==================== RÉPONSES CONDITIONNELLES ====================
+def conditional(champs, par_generation=True):
+    """
+    Réponses avec ETag. Si aucun champ volatil n'est demandé, l'ETag dépend
+    seulement de l'URL et de la génération des documents : un client à jour
+    reçoit 304 sans qu'aucune requête SQL ne soit exécutée. Sinon (ou avec
+    par_generation=False) l'ETag est calculé sur le contenu de la réponse.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            fields = _fields(champs)
+            etag = None
+            if par_generation and not CHAMPS_VOLATILS.intersection(fields):
+                cle = f"{documents_generation.current()}|{request.full_path}"
+                etag = hashlib.sha1(cle.encode('utf-8')).hexdigest()
+                if request.if_none_match.contains(etag):
+                    response = current_app.response_class(status=304)
+                    response.set_etag(etag)
+                    return response
+
+            response = current_app.make_response(f(fields, *args, **kwargs))
+            if etag is not None:
+                response.set_etag(etag)
+            else:
+                response.add_etag()
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+# ==================== DOCUMENTS ====================
+@api_bp.route('/documents')
+@conditional(CHAMPS_DOCUMENT)
+def list_documents(fields):
+    """Documents par curseur (?categorie, sort, cursor, limit) ou par lot (?ids=)"""
+    ids = _ids()
+    query = _document_query(fields)
+    if ids is not None:
+        return jsonify(_bulk(query, Document, ids, fields))
+
+    # Totaux tenus à jour sur les catégories : aucun comptage des documents
+    categorie_id = request.args.get('categorie', type=int)
+    if categorie_id:
+        query = query.filter(Document.categorie_id == categorie_id)
+        categorie = db.session.get(Categorie, categorie_id)
+        total = categorie.nb_documents if categorie else 0
+    else:
+        total = db.session.query(func.coalesce(func.sum(Categorie.document_count), 0)).scalar()
+    sort_by = _sort()
+    cle, sens = sort_key(sort_by)
+
+    pagination = paginate_keyset(query, cle, sens, request.args.get('cursor'), _limit(), total)
+    return jsonify(_page(pagination, fields))
+
+@api_bp.route('/documents/<int:id>')
+@conditional(CHAMPS_DOCUMENT)
+def get_document(fields, id):
+    """Un document"""
+    doc = _document_query(fields).filter(Document.id == id).first_or_404(description="Document introuvable")
+    return jsonify({'data': doc.to_dict(fields)})
+
+# ==================== CATÉGORIES ====================
+@api_bp.route('/categories')
+@conditional(CHAMPS_CATEGORIE)
+def list_categories(fields):
+    """Toutes les catégories par nom, ou par lot (?ids=)"""
+    ids = _ids()
+    query = _categorie_query(fields)
+    if ids is not None:
+        return jsonify(_bulk(query, Categorie, ids, fields))
+    categories = query.order_by(Categorie.nom.asc()).all()
+    return jsonify({'data': [cat.to_dict(fields) for cat in categories]})
+
+@api_bp.route('/categories/<int:id>')
+@conditional(CHAMPS_CATEGORIE)
+def get_category(fields, id):
+    """Une catégorie"""
+    cat = _categorie_query(fields).filter(Categorie.id == id).first_or_404(description="Catégorie introuvable")
+    return jsonify({'data': cat.to_dict(fields)})
+
+# ==================== RECHERCHE ====================
+@api_bp.route('/search')
+# Le texte extrait arrive en arrière-plan : les résultats changent sans écriture d'administration
+@conditional(CHAMPS_DOCUMENT, par_generation=False)
+def search(fields):
+    """Recherche (?q, categorie, date_debut, date_fin, sort, cursor, limit)"""
+    q = request.args.get('q', '').strip()
+    categorie_id = request.args.get('categorie', type=int)
+    date_debut, date_fin = _date('date_debut'), _date('date_fin')
+    if not q and not categorie_id and not date_debut:
+        raise ApiError("Indiquez au moins q, categorie ou date_debut")
+
+    sort_by = _sort('pertinence' if q else 'date_desc')
+    query, fts = build_search(q, categorie_id, date_debut, date_fin, query=_document_query(fields))
+    cle, sens = search_order(sort_by, fts)
+
+    signature = ('recherche', q, request.args.get('categorie'),
+                 request.args.get('date_debut'), request.args.get('date_fin'))
+    total = count_cache.get(signature, query)
+    pagination = paginate_keyset(query, cle, sens, request.args.get('cursor'), _limit(), total)
+    return jsonify(_page(pagination, fields))
@@ -1,6 +1,16 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_from_directory, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify
 from models.models import db, Document, Categorie
-from datetime import datetime
+from services import storage, archive
+from services.pagination import paginate_keyset, sort_key
+from services.recherche import build_search, search_order, parse_date
+from services.extraits import highlights
+from services.facettes import facet_cache
+from services.cache_recherche import search_cache
+from services.response_cache import response_cache
+from services.similarite import documents_similaires
+from services.autocompletion import autocomplete_index
+from services.base_sqlite import lecture_seule
+from werkzeug.utils import send_file as werkzeug_send_file, secure_filename
 import logging
 import os
 
@@ -9,6 +19,8 @@ logger = logging.getLogger(__name__)
 documents_bp = Blueprint('documents', __name__)
 
 @documents_bp.route('/')
+@response_cache.cached(tags=('categories', 'documents:recent'))
+@lecture_seule
 def index():
     """Page d'accueil avec derniers documents"""
     try:
@@ -33,34 +45,24 @@ def index():
         return render_template('index.html', categories=[], documents=[], stats={})
 
 @documents_bp.route('/categorie/<int:id>')
+@response_cache.cached(tags=lambda id: (f'category:{id}',))
+@lecture_seule
 def show_category(id):
     """Affiche les documents d'une catégorie avec pagination et tri"""
     try:
         categorie = Categorie.query.get_or_404(id)
         
-        # Pagination
-        page = request.args.get('page', 1, type=int)
+        # Pagination par curseur
+        cursor = request.args.get('cursor')
         per_page = current_app.config.get('DOCUMENTS_PER_PAGE', 10)
         
         # Tri
         sort_by = request.args.get('sort', 'date_desc')
+        cle, sens = sort_key(sort_by)
         
+        # Total tenu à jour sur la catégorie : aucun comptage des documents
         query = Document.query.filter_by(categorie_id=id)
-        
-        # Appliquer le tri
-        if sort_by == 'date_desc':
-            query = query.order_by(Document.date_ajout.desc())
-        elif sort_by == 'date_asc':
-            query = query.order_by(Document.date_ajout.asc())
-        elif sort_by == 'titre_asc':
-            query = query.order_by(Document.titre.asc())
-        elif sort_by == 'titre_desc':
-            query = query.order_by(Document.titre.desc())
-        elif sort_by == 'vues_desc':
-            query = query.order_by(Document.nombre_vues.desc())
-        
-        # Paginer
-        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        pagination = paginate_keyset(query, cle, sens, cursor, per_page, categorie.nb_documents)
         documents = pagination.items
         
         return render_template(
@@ -75,7 +77,55 @@ def show_category(id):
         flash("Catégorie introuvable.", 'error')
         return redirect(url_for('documents.index'))
 
+@documents_bp.route('/categorie/<int:id>/archive')
+@lecture_seule
+def category_archive(id):
+    """
+    Télécharge tous les documents d'une catégorie dans une archive ZIP
+    produite à la volée. L'ETag dépend de l'ensemble des documents.
+    """
+    try:
+        categorie = Categorie.query.get_or_404(id)
+        entrees = archive.category_entries(id)
+        if not entrees:
+            flash("Cette catégorie ne contient aucun document.", 'info')
+            return redirect(url_for('documents.show_category', id=id))
+        
+        cle = archive.archive_key(id, entrees)
+        nom = f"{secure_filename(categorie.nom) or 'categorie'}.zip"
+        
+        # Archive déjà produite : envoi du fichier (Range, 304)
+        dossier = archive.cache_folder()
+        chemin = archive.cached_path(dossier, cle) if dossier else None
+        if chemin:
+            return werkzeug_send_file(
+                chemin, request.environ, mimetype='application/zip', as_attachment=True,
+                download_name=nom, etag=cle, conditional=True,
+                response_class=current_app.response_class
+            )
+        
+        if request.if_none_match.contains(cle):
+            response = current_app.response_class(status=304)
+            response.set_etag(cle)
+            return response
+        
+        if dossier:
+            corps = archive.stream_and_cache(entrees, dossier, cle, current_app.config.get('ARCHIVE_CACHE_MAX', 20))
+        else:
+            corps = archive.stream_zip(entrees)
+        response = current_app.response_class(corps, mimetype='application/zip', direct_passthrough=True)
+        response.set_etag(cle)
+        response.headers.set('Content-Disposition', 'attachment', filename=nom)
+        # Pas de mise en tampon par nginx : le client reçoit les octets dès leur production
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+    except Exception as e:
+        logger.error(f"Erreur lors de la création de l'archive de la catégorie {id}: {str(e)}")
+        flash("Catégorie introuvable ou archive indisponible.", 'error')
+        return redirect(url_for('documents.index'))
+
 @documents_bp.route('/document/<int:id>')
+@lecture_seule
 def show_document(id):
     """Affiche les détails d'un document"""
     try:
@@ -84,31 +134,44 @@ def show_document(id):
         # Incrémenter le compteur de vues
         document.increment_vues()
         
-        # Documents similaires (même catégorie)
-        documents_similaires = Document.query.filter(
-            Document.categorie_id == document.categorie_id,
-            Document.id != document.id
-        ).order_by(Document.date_ajout.desc()).limit(5).all()
-        
         return render_template(
             'document_detail.html',
             document=document,
-            documents_similaires=documents_similaires
+            documents_similaires=documents_similaires(document)
         )
     except Exception as e:
         logger.error(f"Erreur dans show_document: {str(e)}")
         flash("Document introuvable.", 'error')
         return redirect(url_for('documents.index'))
 
+@documents_bp.route('/autocomplete')
+@lecture_seule
+def autocomplete():
+    """Suggestions de titres et de catégories pendant la saisie (JSON)"""
+    q = request.args.get('q', '').strip()[:100]
+    limit = min(request.args.get('limit', 8, type=int), 20)
+    suggestions = autocomplete_index.suggest(q, limit=limit)
+    
+    for doc in suggestions['documents']:
+        doc['url'] = url_for('documents.show_document', id=doc['id'])
+    for cat in suggestions['categories']:
+        cat['url'] = url_for('documents.show_category', id=cat['id'])
+    
+    response = jsonify(suggestions)
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response
+
 @documents_bp.route('/search')
+@lecture_seule
 def search():
     """Recherche avancée de documents"""
     query = request.args.get('q', '').strip()
     categorie_id = request.args.get('categorie', None)
     date_debut = request.args.get('date_debut', None)
     date_fin = request.args.get('date_fin', None)
-    sort_by = request.args.get('sort', 'date_desc')
-    page = request.args.get('page', 1, type=int)
+    sort_by = request.args.get('sort', 'pertinence' if query else 'date_desc')
+    cursor = request.args.get('cursor')
     per_page = current_app.config.get('DOCUMENTS_PER_PAGE', 10)
     
     if not query and not categorie_id and not date_debut:
@@ -116,53 +179,36 @@ def search():
         return redirect(url_for('documents.index'))
     
     try:
-        # Construction de la requête
-        search_query = Document.query
-        
-        # Filtre par terme de recherche
-        if query:
-            search_query = search_query.filter(
-                db.or_(
-                    Document.titre.ilike(f'%{query}%'),
-                    Document.description.ilike(f'%{query}%')
-                )
-            )
+        # Filtres par date
+        date_debut_obj = date_fin_obj = None
+        try:
+            date_debut_obj = parse_date(date_debut)
+        except ValueError:
+            flash("Format de date de début invalide.", 'warning')
+        try:
+            date_fin_obj = parse_date(date_fin)
+        except ValueError:
+            flash("Format de date de fin invalide.", 'warning')
         
-        # Filtre par catégorie
-        if categorie_id:
-            search_query = search_query.filter_by(categorie_id=int(categorie_id))
-        
-        # Filtre par date
-        if date_debut:
-            try:
-                date_debut_obj = datetime.strptime(date_debut, '%Y-%m-%d')
-                search_query = search_query.filter(Document.date_ajout >= date_debut_obj)
-            except ValueError:
-                flash("Format de date de début invalide.", 'warning')
-        
-        if date_fin:
-            try:
-                date_fin_obj = datetime.strptime(date_fin, '%Y-%m-%d')
-                search_query = search_query.filter(Document.date_ajout <= date_fin_obj)
-            except ValueError:
-                flash("Format de date de fin invalide.", 'warning')
+        # Facettes par catégorie et par mois ; la même requête groupée donne le total
+        facettes = facet_cache.get(query, categorie_id, date_debut_obj, date_fin_obj)
         
-        # Tri
-        if sort_by == 'date_desc':
-            search_query = search_query.order_by(Document.date_ajout.desc())
-        elif sort_by == 'date_asc':
-            search_query = search_query.order_by(Document.date_ajout.asc())
-        elif sort_by == 'titre_asc':
-            search_query = search_query.order_by(Document.titre.asc())
-        elif sort_by == 'titre_desc':
-            search_query = search_query.order_by(Document.titre.desc())
-        elif sort_by == 'vues_desc':
-            search_query = search_query.order_by(Document.nombre_vues.desc())
-        
-        # Pagination
-        pagination = search_query.paginate(page=page, per_page=per_page, error_out=False)
+        def calcul():
+            # Construction de la requête (index plein texte, catégorie, dates)
+            search_query, fts = build_search(query, categorie_id, date_debut_obj, date_fin_obj)
+            # Tri (pertinence BM25 si l'index plein texte est utilisé)
+            cle, sens = search_order(sort_by, fts)
+            # Pagination par curseur
+            return paginate_keyset(search_query, cle, sens, cursor, per_page, facettes['total'])
+        
+        # Page de résultats mise en cache par recherche normalisée (identifiants seulement)
+        cle_cache = search_cache.key(query, categorie_id, date_debut_obj, date_fin_obj, sort_by, cursor, per_page)
+        pagination = search_cache.page(cle_cache, per_page, calcul)
         results = pagination.items
         
+        # Passages surlignés, pour les documents de la page seulement
+        extraits = highlights(query, [doc.id for doc in results])
+        
         # Récupérer toutes les catégories pour le formulaire
         categories = Categorie.query.order_by(Categorie.nom.asc()).all()
         
@@ -170,6 +216,8 @@ def search():
             'search.html',
             query=query,
             results=results,
+            extraits=extraits,
+            facettes=facettes,
             pagination=pagination,
             categories=categories,
             selected_categorie=int(categorie_id) if categorie_id else None,
@@ -183,16 +231,53 @@ def search():
         flash("Une erreur est survenue lors de la recherche.", 'error')
         return redirect(url_for('documents.index'))
 
+def _offload(response, filepath):
+    """
+    Confie l'envoi des octets au proxy frontal selon FICHIERS_OFFLOAD :
+    'x-sendfile' (Apache, lighttpd) ou 'x-accel-redirect' (nginx).
+    """
+    mode = current_app.config.get('FICHIERS_OFFLOAD')
+    if mode != 'x-accel-redirect' or 'X-Sendfile' not in response.headers:
+        return response
+    
+    # nginx sert le fichier via un emplacement interne (location internal)
+    del response.headers['X-Sendfile']
+    relatif = os.path.relpath(os.path.abspath(filepath), os.path.abspath(current_app.config['UPLOAD_FOLDER'])).replace(os.sep, '/')
+    prefixe = current_app.config.get('FICHIERS_ACCEL_PREFIX', '/_uploads/')
+    response.headers['X-Accel-Redirect'] = prefixe.rstrip('/') + '/' + relatif
+    return response
+
 @documents_bp.route('/uploads/<filename>')
+@lecture_seule
 def uploaded_file(filename):
-    """Télécharge un fichier"""
+    """
+    Télécharge un fichier. ETag fort basé sur l'empreinte du contenu, réponses
+    304 (If-None-Match / If-Modified-Since), requêtes Range pour la navigation
+    dans les PDF, et délégation optionnelle de l'envoi au proxy.
+    """
     try:
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-        if not os.path.exists(filepath):
+        filepath = storage.file_path(filename)
+        if not filepath or not os.path.exists(filepath):
             flash("Le fichier demandé n'existe pas.", 'error')
             return redirect(url_for('documents.index'))
         
-        return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
+        # Envoi via Werkzeug pour choisir X-Sendfile fichier par fichier
+        offload = current_app.config.get('FICHIERS_OFFLOAD') in ('x-sendfile', 'x-accel-redirect')
+        environ = request.environ
+        if offload:
+            # Corps vide : les plages (Range) sont servies par le proxy, pas ici
+            environ = {k: v for k, v in environ.items() if k not in ('HTTP_RANGE', 'HTTP_IF_RANGE')}
+        response = werkzeug_send_file(
+            os.path.abspath(filepath),
+            environ,
+            download_name=filename,
+            etag=storage.content_hash(filename, filepath),
+            conditional=True,
+            max_age=current_app.config.get('FICHIERS_MAX_AGE', 3600),
+            use_x_sendfile=offload,
+            response_class=current_app.response_class
+        )
+        return _offload(response, filepath)
     except Exception as e:
         logger.error(f"Erreur lors de l'accès au fichier {filename}: {str(e)}")
         flash("Erreur lors de l'accès au fichier.", 'error')
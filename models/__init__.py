@@ -1,2 +1,2 @@
 """Module des modèles de données"""
-from models.models import db, Categorie, Document, User
+from models.models import db, Categorie, Document, DocumentTexte, DocumentSimilaire, Blob, Fichier, User
@@ -1,9 +1,13 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import deferred
+from services.base_sqlite import SessionRoutee
+from services.normalisation import plier
 import bcrypt
 from datetime import datetime
 import os
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': SessionRoutee})
 
 class Categorie(db.Model):
     """Modèle pour les catégories de documents"""
@@ -13,24 +17,36 @@ class Categorie(db.Model):
     nom = db.Column(db.String(100), nullable=False, unique=True)
     description = db.Column(db.Text)
     date_creation = db.Column(db.DateTime, default=datetime.utcnow)
+    # Nombre de documents, maintenu par les évènements de Document (voir plus bas)
+    document_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     def __repr__(self):
         return f'<Categorie {self.nom}>'
     
     @property
     def nb_documents(self):
-        """Compte le nombre de documents dans cette catégorie"""
-        return self.documents.count()
+        """Nombre de documents dans cette catégorie (sans requête)"""
+        return self.document_count or 0
     
-    def to_dict(self):
-        """Convertit l'objet en dictionnaire"""
-        return {
-            'id': self.id,
-            'nom': self.nom,
-            'description': self.description,
-            'date_creation': self.date_creation.isoformat() if self.date_creation else None,
-            'nb_documents': self.nb_documents
+    @staticmethod
+    def recompute_counts():
+        """Recalcule tous les compteurs de documents (réparation)"""
+        db.session.execute(db.text(
+            "UPDATE categorie SET document_count = "
+            "(SELECT COUNT(*) FROM document WHERE document.categorie_id = categorie.id)"
+        ))
+        db.session.commit()
+    
+    def to_dict(self, fields=None):
+        """Convertit l'objet en dictionnaire (limité aux clés `fields` si donné)"""
+        valeurs = {
+            'id': lambda: self.id,
+            'nom': lambda: self.nom,
+            'description': lambda: self.description,
+            'date_creation': lambda: self.date_creation.isoformat() if self.date_creation else None,
+            'nb_documents': lambda: self.nb_documents
         }
+        return {champ: valeurs[champ]() for champ in (fields or valeurs)}
 
 class Configuration(db.Model):
     """Modèle pour les configurations système"""
@@ -46,24 +62,28 @@ class Configuration(db.Model):
     
     @staticmethod
     def get_value(cle, default=None):
-        """Récupère une valeur de configuration"""
-        config = Configuration.query.filter_by(cle=cle).first()
-        return config.valeur if config else default
+        """Récupère une valeur de configuration (depuis l'instantané en mémoire)"""
+        from services.config_store import config_store
+        return config_store.get(cle, default)
     
     @staticmethod
     def set_value(cle, valeur):
         """Définit une valeur de configuration"""
-        config = Configuration.query.filter_by(cle=cle).first()
-        if config:
-            config.valeur = valeur
-        else:
-            config = Configuration(cle=cle, valeur=valeur)
-            db.session.add(config)
-        db.session.commit()
+        from services.config_store import config_store
+        config_store.set(cle, valeur)
 
 class Document(db.Model):
     """Modèle pour les documents"""
     __tablename__ = 'document'
+    __table_args__ = (
+        # Listes par catégorie (tris date / titre / vues), voir services/migrations.py
+        db.Index('ix_document_categorie_date', 'categorie_id', 'date_ajout'),
+        db.Index('ix_document_categorie_titre', 'categorie_id', 'titre'),
+        db.Index('ix_document_categorie_vues', 'categorie_id', 'nombre_vues'),
+        # Fenêtre des 7 derniers jours et top des vues du tableau de bord
+        db.Index('ix_document_date_ajout', 'date_ajout'),
+        db.Index('ix_document_nombre_vues', 'nombre_vues'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     titre = db.Column(db.String(200), nullable=False)
@@ -75,16 +95,28 @@ class Document(db.Model):
     taille_fichier = db.Column(db.Integer)  # En octets
     nombre_vues = db.Column(db.Integer, default=0)
     
+    # Titre et description sans accents ni majuscules, tenus à jour à l'écriture
+    # (chargés seulement à la demande : ils ne servent qu'aux requêtes)
+    titre_normalise = deferred(db.Column(db.String(200)))
+    description_normalisee = deferred(db.Column(db.Text))
+    
     # Relation avec Categorie
     categorie = db.relationship('Categorie', backref=db.backref('documents', lazy='dynamic', cascade='all, delete-orphan'))
     
+    # Texte extrait du fichier (rempli en arrière-plan)
+    texte = db.relationship('DocumentTexte', uselist=False, backref='document', cascade='all, delete-orphan')
+    
+    # Voisins précalculés par services/similarite.py
+    voisins = db.relationship('DocumentSimilaire', foreign_keys='DocumentSimilaire.document_id',
+                              cascade='all, delete-orphan', order_by='DocumentSimilaire.rang')
+    
     def __repr__(self):
         return f'<Document {self.titre}>'
     
     def increment_vues(self):
-        """Incrémente le compteur de vues"""
-        self.nombre_vues += 1
-        db.session.commit()
+        """Incrémente le compteur de vues (tamponné, écrit en base par lots)"""
+        from services.view_counter import view_counter
+        view_counter.record(self.id)
     
     def get_extension(self):
         """Retourne l'extension du fichier"""
@@ -102,20 +134,113 @@ class Document(db.Model):
             size /= 1024.0
         return f"{size:.1f} To"
     
-    def to_dict(self):
-        """Convertit l'objet en dictionnaire"""
-        return {
-            'id': self.id,
-            'titre': self.titre,
-            'fichier_nom': self.fichier_nom,
-            'description': self.description,
-            'categorie_id': self.categorie_id,
-            'categorie_nom': self.categorie.nom if self.categorie else None,
-            'date_ajout': self.date_ajout.isoformat() if self.date_ajout else None,
-            'date_modification': self.date_modification.isoformat() if self.date_modification else None,
-            'taille_fichier': self.taille_fichier,
-            'nombre_vues': self.nombre_vues
+    def to_dict(self, fields=None):
+        """
+        Convertit l'objet en dictionnaire. Avec `fields`, seules ces clés sont
+        calculées : les autres attributs ne sont pas lus (pas de chargement).
+        """
+        valeurs = {
+            'id': lambda: self.id,
+            'titre': lambda: self.titre,
+            'fichier_nom': lambda: self.fichier_nom,
+            'description': lambda: self.description,
+            'categorie_id': lambda: self.categorie_id,
+            'categorie_nom': lambda: self.categorie.nom if self.categorie else None,
+            'date_ajout': lambda: self.date_ajout.isoformat() if self.date_ajout else None,
+            'date_modification': lambda: self.date_modification.isoformat() if self.date_modification else None,
+            'taille_fichier': lambda: self.taille_fichier,
+            'nombre_vues': lambda: self.nombre_vues
         }
+        return {champ: valeurs[champ]() for champ in (fields or valeurs)}
+
+class DocumentTexte(db.Model):
+    """Modèle pour le texte extrait du fichier d'un document"""
+    __tablename__ = 'document_texte'
+    
+    STATUT_EN_ATTENTE = 'en_attente'
+    STATUT_TERMINE = 'termine'
+    STATUT_ECHEC = 'echec'
+    
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), primary_key=True)
+    fichier_nom = db.Column(db.String(200), nullable=False)  # Fichier à l'origine de l'extraction
+    statut = db.Column(db.String(20), nullable=False, default=STATUT_EN_ATTENTE)
+    contenu = db.Column(db.Text)
+    nombre_pages = db.Column(db.Integer)
+    extrait = db.Column(db.String(500))
+    tentatives = db.Column(db.Integer, default=0)
+    erreur = db.Column(db.Text)
+    date_extraction = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<DocumentTexte {self.document_id} ({self.statut})>'
+    
+    def reset(self, fichier_nom):
+        """Remet l'extraction en attente pour un nouveau fichier"""
+        self.fichier_nom = fichier_nom
+        self.statut = self.STATUT_EN_ATTENTE
+        self.contenu = None
+        self.nombre_pages = None
+        self.extrait = None
+        self.tentatives = 0
+        self.erreur = None
+        self.date_extraction = None
+
+class DocumentSimilaire(db.Model):
+    """Modèle pour un voisin précalculé d'un document (similarité TF-IDF)"""
+    __tablename__ = 'document_similaire'
+    
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), primary_key=True)
+    similaire_id = db.Column(db.Integer, db.ForeignKey('document.id'), primary_key=True, index=True)
+    rang = db.Column(db.Integer, nullable=False)  # 0 = le plus proche
+    score = db.Column(db.Float, nullable=False)   # Similarité cosinus
+    
+    def __repr__(self):
+        return f'<DocumentSimilaire {self.document_id} -> {self.similaire_id} ({self.score:.3f})>'
+
+class TermeRecherche(db.Model):
+    """Mot (plié) des titres et descriptions, candidat à la correction des recherches"""
+    __tablename__ = 'terme_recherche'
+    
+    terme = db.Column(db.String(100), primary_key=True)
+    nb_trigrammes = db.Column(db.Integer, nullable=False)
+    
+    def __repr__(self):
+        return f'<TermeRecherche {self.terme}>'
+
+class TermeTrigramme(db.Model):
+    """Index des trigrammes vers les termes (recherche approchée, voir services/recherche_approchee.py)"""
+    __tablename__ = 'terme_trigramme'
+    __table_args__ = {'sqlite_with_rowid': False}
+    
+    trigramme = db.Column(db.String(3), primary_key=True)
+    terme = db.Column(db.String(100), db.ForeignKey('terme_recherche.terme'), primary_key=True)
+    
+    def __repr__(self):
+        return f'<TermeTrigramme {self.trigramme!r} -> {self.terme}>'
+
+class Blob(db.Model):
+    """Modèle pour un contenu de fichier stocké une seule fois, par empreinte SHA-256"""
+    __tablename__ = 'blob'
+    
+    sha256 = db.Column(db.String(64), primary_key=True)
+    taille = db.Column(db.Integer)  # En octets
+    nb_references = db.Column(db.Integer, nullable=False, default=0)
+    date_creation = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    fichiers = db.relationship('Fichier', backref='blob', cascade='all, delete-orphan')
+    
+    def __repr__(self):
+        return f'<Blob {self.sha256[:12]} ({self.nb_references} réf.)>'
+
+class Fichier(db.Model):
+    """Modèle associant un nom de fichier public (Document.fichier_nom) à un blob"""
+    __tablename__ = 'fichier'
+    
+    nom = db.Column(db.String(200), primary_key=True)
+    blob_sha256 = db.Column(db.String(64), db.ForeignKey('blob.sha256'), nullable=False)
+    
+    def __repr__(self):
+        return f'<Fichier {self.nom}>'
 
 class User(db.Model):
     """Modèle utilisateur"""
@@ -160,4 +285,54 @@ class User(db.Model):
             'is_admin': self.is_admin,
             'date_creation': self.date_creation.isoformat() if self.date_creation else None,
             'derniere_connexion': self.derniere_connexion.isoformat() if self.derniere_connexion else None
-        }
\ No newline at end of file
+        }
+
+# ==================== COMPTEURS DE DOCUMENTS PAR CATÉGORIE ====================
+def _shift_document_count(connection, categorie_id, delta):
+    """Ajoute delta au compteur de documents d'une catégorie"""
+    if categorie_id is None:
+        return
+    table = Categorie.__table__
+    connection.execute(
+        table.update()
+        .where(table.c.id == int(categorie_id))
+        .values(document_count=table.c.document_count + delta)
+    )
+
+@event.listens_for(Document, 'after_insert')
+def _document_inserted(mapper, connection, target):
+    _shift_document_count(connection, target.categorie_id, 1)
+
+@event.listens_for(Document, 'after_delete')
+def _document_deleted(mapper, connection, target):
+    _shift_document_count(connection, target.categorie_id, -1)
+
+@event.listens_for(Document, 'after_update')
+def _document_updated(mapper, connection, target):
+    historique = db.inspect(target).attrs.categorie_id.history
+    if not historique.has_changes() or not historique.deleted:
+        return
+    ancien, nouveau = historique.deleted[0], target.categorie_id
+    if ancien is not None and nouveau is not None and int(ancien) == int(nouveau):
+        return
+    _shift_document_count(connection, ancien, -1)
+    _shift_document_count(connection, nouveau, 1)
+
+# ==================== COLONNES NORMALISÉES ET TERMES DE RECHERCHE ====================
+@event.listens_for(Document, 'before_insert')
+@event.listens_for(Document, 'before_update')
+def _normaliser_document(mapper, connection, target):
+    target.titre_normalise = plier(target.titre)
+    target.description_normalisee = plier(target.description) if target.description else None
+
+@event.listens_for(Document, 'after_insert')
+def _termes_document_insere(mapper, connection, target):
+    from services.recherche_approchee import record_terms
+    record_terms(connection, (target.titre_normalise, target.description_normalisee))
+
+@event.listens_for(Document, 'after_update')
+def _termes_document_modifie(mapper, connection, target):
+    etat = db.inspect(target)
+    if etat.attrs.titre.history.has_changes() or etat.attrs.description.history.has_changes():
+        from services.recherche_approchee import record_terms
+        record_terms(connection, (target.titre_normalise, target.description_normalisee))
@@ -0,0 +1 @@
+"""Module des services applicatifs"""
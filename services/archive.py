@@ -0,0 +1,151 @@
+"""
+Archive ZIP des documents d'une catégorie, produite à la volée : les
+entrées sont écrites au fil de la lecture des fichiers, sans fichier
+temporaire et à mémoire constante. Les formats déjà compressés (PDF,
+DOCX, ODT) sont stockés tels quels. En option, l'archive terminée est
+conservée sur disque, indexée par l'empreinte de l'ensemble des documents.
+"""
+from flask import current_app
+from models.models import db, Document, Fichier
+from services import storage
+from sqlalchemy import func
+from datetime import datetime
+import hashlib
+import logging
+import os
+import uuid
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+TAILLE_BLOC = 256 * 1024
+VERSION_FORMAT = 2  # À incrémenter si le contenu des archives change
+DEJA_COMPRESSES = {'.pdf', '.docx', '.odt', '.zip', '.jpg', '.jpeg', '.png'}
+FICHIER_MANQUANTS = 'FICHIERS_MANQUANTS.txt'
+
+class _Flux:
+    """
+    Destination non positionnable du ZipFile : les octets écrits sont
+    récupérés et envoyés au client au fur et à mesure.
+    """
+
+    def __init__(self):
+        self._morceaux = []
+
+    def write(self, data):
+        self._morceaux.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def vider(self):
+        data = b''.join(self._morceaux)
+        self._morceaux.clear()
+        return data
+
+def _date_zip(date):
+    date = date or datetime.utcnow()
+    return max(date, datetime(1980, 1, 1)).timetuple()[:6]
+
+def category_entries(categorie_id):
+    """
+    Fichiers de la catégorie en une requête : [(nom, chemin, empreinte, date)].
+    L'empreinte est le SHA-256 du blob, ou mtime:taille pour un fichier historique.
+    Un fichier partagé par plusieurs documents (contenu dédupliqué) n'apparaît
+    qu'une fois, daté de sa dernière modification.
+    """
+    lignes = (
+        db.session.query(Document.fichier_nom, func.max(Document.date_modification), Fichier.blob_sha256)
+        .outerjoin(Fichier, Fichier.nom == Document.fichier_nom)
+        .filter(Document.categorie_id == categorie_id)
+        .group_by(Document.fichier_nom, Fichier.blob_sha256)
+        .order_by(Document.fichier_nom)
+        .all()
+    )
+    entrees = []
+    for nom, date, sha in lignes:
+        chemin = storage.path_for(nom, sha)
+        if sha is None and chemin and os.path.exists(chemin):
+            stat = os.stat(chemin)
+            sha = f"{stat.st_mtime_ns}:{stat.st_size}"
+        entrees.append((nom, chemin, sha, date))
+    return entrees
+
+def archive_key(categorie_id, entrees):
+    """Empreinte de l'ensemble des documents (sert d'ETag et de clé de cache)"""
+    h = hashlib.sha256(f"{VERSION_FORMAT}|{categorie_id}".encode('utf-8'))
+    for nom, _, sha, date in entrees:
+        h.update(f"|{nom}:{sha}:{date.isoformat() if date else ''}".encode('utf-8'))
+    return h.hexdigest()
+
+def stream_zip(entrees):
+    """Générateur des octets de l'archive ; le premier morceau part dès le premier en-tête"""
+    flux = _Flux()
+    manquants = []
+    with zipfile.ZipFile(flux, 'w', allowZip64=True) as archive:
+        for nom, chemin, _, date in entrees:
+            if not chemin or not os.path.exists(chemin):
+                manquants.append(nom)
+                continue
+            info = zipfile.ZipInfo(nom, date_time=_date_zip(date))
+            info.compress_type = zipfile.ZIP_STORED if os.path.splitext(nom)[1].lower() in DEJA_COMPRESSES \
+                else zipfile.ZIP_DEFLATED
+            info.file_size = os.path.getsize(chemin)
+            with open(chemin, 'rb') as source, archive.open(info, 'w') as destination:
+                for bloc in iter(lambda: source.read(TAILLE_BLOC), b''):
+                    destination.write(bloc)
+                    data = flux.vider()
+                    if data:
+                        yield data
+            yield flux.vider()
+        if manquants:
+            logger.warning(f"Archive: {len(manquants)} fichier(s) introuvable(s) sur le disque")
+            archive.writestr(FICHIER_MANQUANTS, "Fichiers introuvables lors de la création de l'archive :\n"
+                             + '\n'.join(manquants) + '\n')
+    yield flux.vider()
+
+# ==================== CACHE SUR DISQUE ====================
+def cache_folder():
+    """Dossier des archives conservées, ou None si le cache est désactivé"""
+    if not current_app.config.get('ARCHIVE_CACHE_ENABLED', False):
+        return None
+    dossier = current_app.config.get('ARCHIVE_CACHE_DOSSIER') or os.path.join(current_app.instance_path, 'archives')
+    os.makedirs(dossier, exist_ok=True)
+    return dossier
+
+def cached_path(dossier, cle):
+    chemin = os.path.join(dossier, f"{cle}.zip")
+    return chemin if os.path.exists(chemin) else None
+
+def _prune(dossier, maximum):
+    """Ne garde que les `maximum` archives les plus récemment écrites"""
+    archives = [os.path.join(dossier, nom) for nom in os.listdir(dossier) if nom.endswith('.zip')]
+    if len(archives) <= maximum:
+        return
+    archives.sort(key=lambda chemin: os.path.getmtime(chemin), reverse=True)
+    for chemin in archives[maximum:]:
+        try:
+            os.remove(chemin)
+        except OSError:
+            pass
+
+def stream_and_cache(entrees, dossier, cle, maximum):
+    """
+    Envoie l'archive tout en l'écrivant dans le cache ; elle n'y est rangée
+    qu'une fois complète (une interruption du client l'abandonne).
+    """
+    final = os.path.join(dossier, f"{cle}.zip")
+    tmp = os.path.join(dossier, f".{cle}.{uuid.uuid4().hex}.tmp")
+    complete = False
+    try:
+        with open(tmp, 'wb') as f:
+            for data in stream_zip(entrees):
+                f.write(data)
+                yield data
+        os.replace(tmp, final)
+        complete = True
+        _prune(dossier, maximum)
+    finally:
+        if not complete and os.path.exists(tmp):
+            os.remove(tmp)
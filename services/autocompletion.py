@@ -0,0 +1,210 @@
+"""
+Autocomplétion de la recherche : index en mémoire des mots des titres de
+documents et des noms de catégories (tableau trié + bisect), sans accents
+ni majuscules, classé par popularité.
+"""
+from flask import current_app
+from models.models import db, Document, Categorie
+from services.cache import Generation
+from services.normalisation import plier, mots
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from bisect import bisect_left
+import heapq
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+LONGUEUR_MIN = 2        # Caractères minimum avant de proposer des suggestions
+MAX_CANDIDATS = 2000    # Borne le travail pour les préfixes très fréquents
+
+DOCUMENT = 'document'
+CATEGORIE = 'categorie'
+
+class AutocompleteIndex:
+    """
+    Tableau trié des mots indexés, parallèle à la liste des entrées
+    (type, id) qui les contiennent. Une recherche de préfixe est une
+    bisection suivie d'un parcours des mots qui commencent par ce préfixe.
+
+    Les écritures faites par ce processus sont appliquées en place après
+    validation de la transaction ; celles des autres workers sont détectées
+    par une génération partagée. L'index est alors reconstruit en
+    arrière-plan pendant que l'ancien continue de répondre : seul le premier
+    chargement se fait pendant une requête.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = Generation('autocompletion')
+        self._mots = []
+        self._refs = []
+        self._entrees = {}
+        self._jeton = None
+        self._expiration = 0.0
+        self._charge = False
+        self._reconstruction = None
+
+    # ---------- Construction ----------
+    def _reset(self, entrees):
+        paires = sorted(
+            (mot, cle) for cle, entree in entrees.items() for mot in set(entree['mots'])
+        )
+        self._entrees = entrees
+        self._mots = [mot for mot, _ in paires]
+        self._refs = [cle for _, cle in paires]
+
+    def rebuild(self):
+        """Recharge l'index depuis la base (deux requêtes légères)"""
+        # Lue avant le chargement : une écriture pendant celui-ci laisse l'index périmé
+        jeton = self._generation.current()
+        entrees = {}
+        for doc_id, titre, vues in db.session.query(Document.id, Document.titre, Document.nombre_vues):
+            entrees[(DOCUMENT, doc_id)] = self._entree(titre, vues)
+        for cat_id, nom, nb in db.session.query(Categorie.id, Categorie.nom, Categorie.document_count):
+            entrees[(CATEGORIE, cat_id)] = self._entree(nom, nb)
+
+        with self._lock:
+            self._jeton = jeton
+            self._charge = True
+            self._reset(entrees)
+            self._expiration = time.monotonic() + current_app.config.get('AUTOCOMPLETION_TTL', 300)
+        logger.info(f"Index d'autocomplétion reconstruit: {len(entrees)} entrée(s)")
+
+    @staticmethod
+    def _entree(libelle, score):
+        return {'libelle': libelle, 'tri': plier(libelle), 'mots': mots(libelle), 'score': score or 0}
+
+    def _ensure_fresh(self):
+        """
+        Charge l'index au premier appel. Un index expiré ou modifié par un
+        autre worker est reconstruit en arrière-plan et sert en attendant.
+        """
+        with self._lock:
+            if (self._jeton is not None
+                    and self._jeton == self._generation.current()
+                    and time.monotonic() < self._expiration):
+                return
+            if self._charge:
+                if self._reconstruction is None or not self._reconstruction.is_alive():
+                    self._reconstruction = threading.Thread(
+                        target=self._rebuild_in_background, args=(current_app._get_current_object(),),
+                        name='autocompletion', daemon=True
+                    )
+                    self._reconstruction.start()
+                return
+        self.rebuild()
+
+    def _rebuild_in_background(self, app):
+        with app.app_context():
+            try:
+                self.rebuild()
+            except Exception as e:
+                logger.error(f"Erreur lors de la reconstruction de l'autocomplétion: {str(e)}")
+
+    # ---------- Mises à jour en place ----------
+    def _remove(self, cle):
+        entree = self._entrees.pop(cle, None)
+        if entree is None:
+            return
+        for mot in set(entree['mots']):
+            i = bisect_left(self._mots, mot)
+            while i < len(self._mots) and self._mots[i] == mot:
+                if self._refs[i] == cle:
+                    del self._mots[i]
+                    del self._refs[i]
+                    break
+                i += 1
+
+    def _insert(self, cle, entree):
+        self._entrees[cle] = entree
+        for mot in set(entree['mots']):
+            i = bisect_left(self._mots, mot)
+            self._mots.insert(i, mot)
+            self._refs.insert(i, cle)
+
+    def apply(self, changements):
+        """Applique des changements validés : [(cle, entree ou None pour une suppression)]"""
+        with self._lock:
+            # Un autre worker a-t-il écrit depuis la dernière synchronisation ?
+            synchronise = self._jeton is not None and self._jeton == self._generation.current()
+            # Appliqués même à un index périmé, qui sert jusqu'à sa reconstruction
+            for cle, entree in changements:
+                self._remove(cle)
+                if entree is not None:
+                    self._insert(cle, entree)
+            # Prévient les autres workers ; ce processus reconstruit s'il n'était pas à jour
+            jeton = self._generation.bump()
+            self._jeton = jeton if synchronise else None
+
+    def invalidate(self):
+        """Force la reconstruction dans tous les workers (écriture hors ORM)"""
+        with self._lock:
+            self._generation.bump()
+            self._jeton = None
+
+    # ---------- Recherche ----------
+    def suggest(self, q, limit=8, limit_categories=3):
+        """Suggestions pour la saisie `q` : {'documents': [...], 'categories': [...]}"""
+        jetons = mots(q)
+        if not jetons or len(plier(q).strip()) < LONGUEUR_MIN:
+            return {'documents': [], 'categories': []}
+
+        self._ensure_fresh()
+        prefixe, autres = jetons[-1], jetons[:-1]
+
+        with self._lock:
+            candidats = set()
+            i = bisect_left(self._mots, prefixe)
+            while i < len(self._mots) and self._mots[i].startswith(prefixe) and len(candidats) < MAX_CANDIDATS:
+                candidats.add(self._refs[i])
+                i += 1
+            resultats = {DOCUMENT: [], CATEGORIE: []}
+            for cle in candidats:
+                entree = self._entrees[cle]
+                # Les mots précédents du texte saisi doivent aussi être présents
+                if all(any(m.startswith(t) for m in entree['mots']) for t in autres):
+                    resultats[cle[0]].append((-entree['score'], entree['tri'], cle, entree['libelle']))
+
+        documents = [(c, l, -s) for s, _, c, l in heapq.nsmallest(limit, resultats[DOCUMENT])]
+        categories = [(c, l, -s) for s, _, c, l in heapq.nsmallest(limit_categories, resultats[CATEGORIE])]
+        return {
+            'documents': [{'id': cle[1], 'titre': libelle, 'vues': score} for cle, libelle, score in documents],
+            'categories': [{'id': cle[1], 'nom': libelle, 'nb_documents': score} for cle, libelle, score in categories],
+        }
+
+autocomplete_index = AutocompleteIndex()
+
+# ==================== SUIVI DES ÉCRITURES ====================
+def _changement(objet, supprime):
+    if isinstance(objet, Document):
+        cle = (DOCUMENT, objet.id)
+        return cle, None if supprime else AutocompleteIndex._entree(objet.titre, objet.nombre_vues)
+    if isinstance(objet, Categorie):
+        cle = (CATEGORIE, objet.id)
+        return cle, None if supprime else AutocompleteIndex._entree(objet.nom, objet.document_count)
+    return None
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    changements = session.info.setdefault('autocompletion', [])
+    for objets, supprime in ((session.new, False), (session.dirty, False), (session.deleted, True)):
+        for objet in objets:
+            changement = _changement(objet, supprime)
+            if changement is not None:
+                changements.append(changement)
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    changements = session.info.pop('autocompletion', None)
+    if changements:
+        try:
+            autocomplete_index.apply(changements)
+        except Exception as e:
+            logger.error(f"Erreur lors de la mise à jour de l'autocomplétion: {str(e)}")
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('autocompletion', None)
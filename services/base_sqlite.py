@@ -0,0 +1,109 @@
+"""
+Profil de production pour SQLite : pragmas appliqués à chaque connexion
+(WAL, synchronous=NORMAL, cache, mmap, attente des verrous), pool de
+connexions par worker et, en option, un pool séparé en lecture seule pour
+les pages publiques afin que les lectures n'attendent jamais les écritures.
+"""
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.dml import UpdateBase
+from functools import wraps
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+PRAGMAS_DEFAUT = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 15000,
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+def _fichier_sqlite(uri):
+    """Indique si `uri` désigne une base SQLite sur disque (pas en mémoire)"""
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:') \
+        and url.query.get('mode') != 'memory'
+
+def configure(app):
+    """
+    Complète SQLALCHEMY_ENGINE_OPTIONS pour une base SQLite sur disque (à
+    appeler avant db.init_app). Les options déjà définies sont conservées.
+    """
+    if not _fichier_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+        return
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    options.setdefault('pool_size', app.config.get('SQLITE_POOL_SIZE', 5))
+    options.setdefault('max_overflow', app.config.get('SQLITE_MAX_OVERFLOW', 5))
+    options.setdefault('pool_timeout', app.config.get('SQLITE_POOL_TIMEOUT', 30))
+    # Délai d'attente d'un verrou côté pilote, aligné sur busy_timeout
+    pragmas = {**PRAGMAS_DEFAUT, **app.config.get('SQLITE_PRAGMAS', {})}
+    connect_args = dict(options.get('connect_args') or {})
+    connect_args.setdefault('timeout', int(pragmas.get('busy_timeout', 5000)) / 1000)
+    options['connect_args'] = connect_args
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+def _listener_pragmas(pragmas, lecture_seule=False):
+    def appliquer(dbapi_connection, connection_record):
+        curseur = dbapi_connection.cursor()
+        try:
+            for nom, valeur in pragmas.items():
+                curseur.execute(f"PRAGMA {nom} = {valeur}")
+            if lecture_seule:
+                curseur.execute("PRAGMA query_only = 1")
+        finally:
+            curseur.close()
+    return appliquer
+
+def _prepare_engine(engine, pragmas, lecture_seule=False):
+    event.listen(engine, 'connect', _listener_pragmas(pragmas, lecture_seule))
+    # Un worker issu d'un fork ne doit pas réutiliser les connexions du parent
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+def init_app(app):
+    """Installe les pragmas sur les moteurs SQLite de l'application (après db.init_app)"""
+    from models.models import db
+
+    pragmas = {**PRAGMAS_DEFAUT, **app.config.get('SQLITE_PRAGMAS', {})}
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                _prepare_engine(engine, pragmas)
+
+        if app.config.get('SQLITE_LECTURE_SEPAREE') and _fichier_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+            options = {k: v for k, v in app.config['SQLALCHEMY_ENGINE_OPTIONS'].items() if k != 'url'}
+            lecture = create_engine(db.engine.url, **options)
+            _prepare_engine(lecture, pragmas, lecture_seule=True)
+            app.extensions['sqlite_lecture'] = lecture
+            logger.info("Pool de connexions en lecture seule activé")
+
+def lecture_seule(f):
+    """
+    Décorateur des vues qui n'écrivent pas en base : leurs requêtes passent
+    par le pool en lecture seule s'il est activé (SQLITE_LECTURE_SEPAREE).
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.lecture_seule = True
+        try:
+            return f(*args, **kwargs)
+        finally:
+            g.lecture_seule = False
+    return decorated_function
+
+class SessionRoutee(Session):
+    """Session qui envoie les lectures des vues @lecture_seule au pool de lecture"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not isinstance(clause, UpdateBase) \
+                and has_app_context() and g.get('lecture_seule'):
+            lecture = current_app.extensions.get('sqlite_lecture')
+            if lecture is not None:
+                return lecture
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
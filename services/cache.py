@@ -0,0 +1,146 @@
+"""Caches en mémoire invalidés par des compteurs de génération partagés entre workers"""
+from flask import current_app
+from models.models import Document, Configuration
+import itertools
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_sequence = itertools.count()
+
+def cache_dir(app=None):
+    """Dossier des fichiers de génération (partagé par tous les workers)"""
+    app = app or current_app
+    return app.config.get('CACHE_DIR') or os.path.join(app.instance_path, 'cache')
+
+def init_app(app):
+    """Crée le dossier de cache de l'application"""
+    os.makedirs(cache_dir(app), exist_ok=True)
+
+class Generation:
+    """
+    Compteur de génération stocké dans un petit fichier. Chaque écriture
+    remplace le jeton par une valeur unique : un worker sait que ses caches
+    sont périmés dès que le jeton lu diffère de celui mémorisé.
+    Le fichier est relu au plus toutes les CACHE_GENERATION_INTERVALLE
+    secondes ; les écritures du worker courant sont visibles immédiatement.
+    """
+
+    def __init__(self, nom):
+        self.nom = nom
+        self._jeton = None
+        self._lu_a = 0.0
+
+    def _path(self):
+        return os.path.join(cache_dir(), f'{self.nom}.gen')
+
+    def current(self):
+        """Jeton courant ('0' si le compteur n'a jamais été incrémenté)"""
+        maintenant = time.monotonic()
+        intervalle = current_app.config.get('CACHE_GENERATION_INTERVALLE', 0.5)
+        if self._jeton is not None and maintenant - self._lu_a < intervalle:
+            return self._jeton
+
+        try:
+            with open(self._path(), 'r') as f:
+                jeton = f.read() or '0'
+        except FileNotFoundError:
+            jeton = '0'
+        self._jeton = jeton
+        self._lu_a = maintenant
+        return jeton
+
+    def bump(self):
+        """Invalide tous les caches dépendant de cette génération"""
+        jeton = f'{time.time_ns()}-{os.getpid()}-{next(_sequence)}'
+        path = self._path()
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                f.write(jeton)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.error(f"Impossible d'incrémenter la génération {self.nom}: {str(e)}")
+        self._jeton = jeton
+        self._lu_a = time.monotonic()
+        return jeton
+
+# Générations utilisées par l'application
+documents_generation = Generation('documents')
+configuration_generation = Generation('configuration')
+utilisateurs_generation = Generation('utilisateurs')
+
+def invalidate_documents():
+    """À appeler après toute écriture sur les documents ou les catégories"""
+    documents_generation.bump()
+
+def invalidate_configuration():
+    """À appeler après toute écriture sur la configuration"""
+    configuration_generation.bump()
+
+def invalidate_users():
+    """À appeler après toute écriture sur les utilisateurs"""
+    utilisateurs_generation.bump()
+
+class CachedValue:
+    """
+    Valeur calculée une fois par processus puis servie depuis la mémoire tant
+    que les générations dont elle dépend n'ont pas changé (et que le TTL
+    optionnel n'est pas écoulé).
+    """
+
+    def __init__(self, loader, generations=(), ttl=None):
+        self.loader = loader
+        self.generations = generations
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cle = None
+        self._valeur = None
+        self._expiration = None
+
+    def _current_key(self):
+        return tuple(g.current() for g in self.generations)
+
+    def get(self):
+        """Retourne la valeur en cache, recalculée si elle est périmée"""
+        cle = self._current_key()
+        with self._lock:
+            if cle == self._cle and (self._expiration is None or time.monotonic() < self._expiration):
+                return self._valeur
+
+        # La clé est lue avant le calcul : une écriture concurrente
+        # provoquera un nouveau calcul à la prochaine lecture
+        valeur = self.loader()
+        with self._lock:
+            self._cle = cle
+            self._valeur = valeur
+            self._expiration = time.monotonic() + self.ttl if self.ttl else None
+        return valeur
+
+    def clear(self):
+        """Vide le cache local"""
+        with self._lock:
+            self._cle = None
+            self._valeur = None
+
+# ==================== ANNONCE ====================
+def _load_announcement():
+    """Charge le dernier document ajouté et le message défilant"""
+    # Ligne légère (id, titre, date) : ne garde pas d'objet ORM entre requêtes
+    dernier_doc = Document.query.with_entities(
+        Document.id, Document.titre, Document.date_ajout
+    ).order_by(Document.id.desc()).first()
+    config_message = Configuration.get_value('message_defilant')
+    return {'dernier_doc': dernier_doc, 'config_message': config_message}
+
+announcement_cache = CachedValue(
+    _load_announcement,
+    generations=(documents_generation, configuration_generation)
+)
+
+def get_announcement():
+    """Retourne {'dernier_doc': ..., 'config_message': ...} depuis le cache"""
+    return announcement_cache.get()
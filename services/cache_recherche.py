@@ -0,0 +1,62 @@
+"""
+Cache des pages de résultats de recherche. Pour une recherche normalisée
+(texte plié, catégorie, dates, tri, curseur), il conserve les identifiants
+des documents de la page, les curseurs voisins et le total : une page
+servie depuis le cache ne coûte qu'une requête IN pour recharger les
+documents. Les entrées sont périmées par toute écriture sur les documents
+(étiquette 'documents') et par l'indexation d'un texte extrait
+(étiquette 'recherche').
+"""
+from models.models import Document
+from services.normalisation import plier
+from services.pagination import KeysetPage
+from services.response_cache import TaggedCache, purge, register_cache
+
+TAG_RECHERCHE = 'recherche'
+TAGS = ('documents', TAG_RECHERCHE)
+
+def invalidate_search():
+    """À appeler quand le texte indexé change sans écriture sur les documents"""
+    purge(TAG_RECHERCHE)
+
+class SearchCache(TaggedCache):
+    """LRU + TTL des pages de résultats (RECHERCHE_CACHE_*)"""
+
+    def __init__(self):
+        super().__init__('RECHERCHE_CACHE')
+
+    def init_app(self, app):
+        app.extensions['search_cache'] = self
+        register_cache('recherche', self)
+
+    @staticmethod
+    def key(q, categorie_id, date_debut, date_fin, sort_by, cursor, per_page):
+        """Clé normalisée : 'Récolte ' et 'recolte' donnent la même page"""
+        return (
+            ' '.join(plier(q).split()), str(int(categorie_id)) if categorie_id else '',
+            date_debut, date_fin, sort_by, cursor or '', per_page,
+        )
+
+    def page(self, cle, per_page, calcul):
+        """
+        KeysetPage de la recherche `cle` ; `calcul()` la produit en cas
+        d'absence. Les documents sont rechargés dans l'ordre mémorisé.
+        """
+        if not self._config('ENABLED', True):
+            return calcul()
+
+        resultat = {}
+
+        def calculer():
+            resultat['page'] = page = calcul()
+            return ([doc.id for doc in page.items], page.next_cursor, page.prev_cursor, page.total)
+
+        ids, next_cursor, prev_cursor, total = self.get_or_compute(cle, TAGS, calculer)
+        if 'page' in resultat:
+            return resultat['page']
+
+        documents = {doc.id: doc for doc in Document.query.filter(Document.id.in_(ids))} if ids else {}
+        items = [documents[doc_id] for doc_id in ids if doc_id in documents]
+        return KeysetPage(items, per_page, next_cursor, prev_cursor, total)
+
+search_cache = SearchCache()
@@ -0,0 +1,164 @@
+"""Upload par morceaux numérotés, reprenable, avec vérification d'empreinte"""
+from flask import current_app
+from services import storage
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+SHA256_RE = re.compile(r'^[0-9a-fA-F]{64}$')
+
+class UploadError(Exception):
+    """Erreur d'upload renvoyée au client avec un code HTTP"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def _staging_root():
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], '.staging')
+
+def _staging_dir(upload_id):
+    if not UPLOAD_ID_RE.match(upload_id or ''):
+        raise UploadError("Identifiant d'upload invalide", 404)
+    return os.path.join(_staging_root(), upload_id)
+
+def _data_path(upload_id):
+    return os.path.join(_staging_dir(upload_id), 'data')
+
+def _save_meta(meta):
+    """Écrit les métadonnées de manière atomique"""
+    dossier = _staging_dir(meta['upload_id'])
+    tmp = os.path.join(dossier, 'meta.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(dossier, 'meta.json'))
+
+def load(upload_id):
+    """Retourne l'état d'un upload (prochain morceau attendu, octets reçus...)"""
+    try:
+        with open(os.path.join(_staging_dir(upload_id), 'meta.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise UploadError("Upload introuvable ou expiré", 404)
+
+def _parse_size(taille):
+    """Taille annoncée par le client : entier positif ou nul, ou None si absente"""
+    if taille is None or taille == '':
+        return None
+    if isinstance(taille, str) and taille.isascii() and taille.isdigit():
+        return int(taille)
+    if isinstance(taille, int) and not isinstance(taille, bool) and taille >= 0:
+        return taille
+    raise UploadError("Taille annoncée invalide (entier positif attendu)")
+
+def _parse_sha256(sha256):
+    """Empreinte annoncée par le client, en minuscules, ou None si absente"""
+    if sha256 is None or sha256 == '':
+        return None
+    if not isinstance(sha256, str) or not SHA256_RE.match(sha256):
+        raise UploadError("Empreinte annoncée invalide (SHA-256 hexadécimal attendu)")
+    return sha256.lower()
+
+def create(filename, taille=None, sha256=None):
+    """Ouvre un nouvel upload et retourne ses métadonnées"""
+    taille = _parse_size(taille)
+    sha256 = _parse_sha256(sha256)
+
+    purge_expired()
+
+    upload_id = uuid.uuid4().hex
+    os.makedirs(_staging_dir(upload_id))
+    open(_data_path(upload_id), 'wb').close()
+
+    meta = {
+        'upload_id': upload_id,
+        'filename': filename,
+        'taille': taille,
+        'sha256': sha256,
+        'next_chunk': 0,
+        'offset': 0,
+        'date_creation': time.time(),
+    }
+    _save_meta(meta)
+    return meta
+
+def write_chunk(upload_id, index, stream, sha256=None):
+    """
+    Ajoute le morceau `index` au fichier de travail en flux. Un morceau déjà
+    reçu est ignoré (réémission après coupure) ; un morceau dans le désordre
+    est refusé. Les octets d'un morceau interrompu sont tronqués au prochain essai.
+    """
+    meta = load(upload_id)
+    if index < meta['next_chunk']:
+        return meta
+    if index > meta['next_chunk']:
+        raise UploadError(f"Morceau {meta['next_chunk']} attendu, {index} reçu", 409)
+
+    taille_max = current_app.config.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)
+    sha = hashlib.sha256()
+    ecrits = 0
+    with open(_data_path(upload_id), 'r+b') as f:
+        # Repartir du dernier morceau validé
+        f.seek(meta['offset'])
+        f.truncate()
+        for bloc in iter(lambda: stream.read(storage.TAILLE_BLOC), b''):
+            ecrits += len(bloc)
+            if ecrits > taille_max:
+                f.truncate(meta['offset'])
+                raise UploadError(f"Morceau trop volumineux (maximum {taille_max} octets)", 413)
+            sha.update(bloc)
+            f.write(bloc)
+
+        if sha256 and sha.hexdigest() != sha256.lower():
+            f.truncate(meta['offset'])
+            raise UploadError("Empreinte du morceau invalide", 422)
+
+    meta['next_chunk'] += 1
+    meta['offset'] += ecrits
+    _save_meta(meta)
+    return meta
+
+def finish(upload_id, sha256=None):
+    """
+    Vérifie le fichier reçu et retourne (chemin, sha256, taille, nom d'origine).
+    Le chemin est ensuite promu dans le stockage par storage.promote().
+    """
+    meta = load(upload_id)
+    attendue = _parse_sha256(sha256) or meta.get('sha256')
+    annoncee = _parse_size(meta.get('taille'))
+    data_path = _data_path(upload_id)
+    empreinte, taille = storage.hash_file(data_path)
+
+    if attendue and attendue != empreinte:
+        raise UploadError("L'empreinte du fichier ne correspond pas", 422)
+    if annoncee is not None and annoncee != taille:
+        raise UploadError(f"Taille reçue {taille} différente de la taille annoncée {meta['taille']}", 422)
+
+    return data_path, empreinte, taille, meta['filename']
+
+def discard(upload_id):
+    """Supprime le dossier de travail d'un upload"""
+    shutil.rmtree(_staging_dir(upload_id), ignore_errors=True)
+
+def purge_expired():
+    """Supprime les uploads abandonnés depuis plus de UPLOAD_STAGING_EXPIRATION secondes"""
+    racine = _staging_root()
+    if not os.path.isdir(racine):
+        return
+    limite = time.time() - current_app.config.get('UPLOAD_STAGING_EXPIRATION', 24 * 3600)
+    for upload_id in os.listdir(racine):
+        chemin = os.path.join(racine, upload_id)
+        try:
+            if os.path.getmtime(chemin) < limite:
+                shutil.rmtree(chemin, ignore_errors=True)
+                logger.info(f"Upload abandonné supprimé: {upload_id}")
+        except OSError:
+            pass
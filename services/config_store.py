@@ -0,0 +1,91 @@
+"""Registre typé de la configuration, lu par instantanés versionnés"""
+from models.models import db, Configuration
+from services.cache import CachedValue, configuration_generation
+from types import MappingProxyType
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _to_bool(valeur):
+    return str(valeur).strip().lower() in ('1', 'true', 'oui', 'on', 'yes')
+
+# Clés connues : type et valeur par défaut. Les clés absentes du registre
+# sont renvoyées telles qu'elles sont stockées (texte).
+REGISTRE = {
+    'message_defilant': (str, None),
+}
+
+CONVERTISSEURS = {
+    str: str,
+    int: int,
+    float: float,
+    bool: _to_bool,
+}
+
+def _serialize(valeur):
+    """Convertit une valeur Python en texte pour la table configuration"""
+    if valeur is None:
+        return None
+    if isinstance(valeur, bool):
+        return '1' if valeur else '0'
+    return str(valeur)
+
+class ConfigStore:
+    """
+    Sert la configuration depuis un instantané en mémoire. L'instantané est
+    chargé en une requête et rechargé seulement quand la génération
+    'configuration' change (écriture dans ce worker ou dans un autre).
+    """
+
+    def __init__(self):
+        self._snapshot = CachedValue(self._load, generations=(configuration_generation,))
+
+    def _load(self):
+        """Charge toutes les clés en une seule requête"""
+        valeurs = {cle: valeur for cle, valeur in
+                   db.session.query(Configuration.cle, Configuration.valeur).all()}
+        return MappingProxyType(valeurs)
+
+    def snapshot(self):
+        """Instantané courant (lecture seule) de toutes les valeurs brutes"""
+        return self._snapshot.get()
+
+    def get(self, cle, default=None):
+        """Valeur typée d'une clé, sans requête si l'instantané est à jour"""
+        type_, defaut_registre = REGISTRE.get(cle, (None, None))
+        brute = self.snapshot().get(cle)
+        if brute is None:
+            return default if default is not None else defaut_registre
+        if type_ is None:
+            return brute
+        try:
+            return CONVERTISSEURS[type_](brute)
+        except (TypeError, ValueError):
+            logger.warning(f"Valeur de configuration invalide pour {cle}: {brute!r}")
+            return default if default is not None else defaut_registre
+
+    def set_many(self, valeurs):
+        """Enregistre plusieurs clés dans une seule transaction"""
+        if not valeurs:
+            return
+
+        existantes = {c.cle: c for c in Configuration.query.filter(Configuration.cle.in_(list(valeurs))).all()}
+        try:
+            for cle, valeur in valeurs.items():
+                texte = _serialize(valeur)
+                if cle in existantes:
+                    existantes[cle].valeur = texte
+                else:
+                    db.session.add(Configuration(cle=cle, valeur=texte))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        configuration_generation.bump()
+
+    def set(self, cle, valeur):
+        """Enregistre une seule clé"""
+        self.set_many({cle: valeur})
+
+config_store = ConfigStore()
@@ -0,0 +1,250 @@
+"""Extraction en arrière-plan du texte des fichiers uploadés (PDF, DOCX, ODT, TXT)"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from xml.etree import ElementTree
+import logging
+import os
+import re
+import threading
+import zipfile
+from models.models import db, DocumentTexte
+from services import search_index, storage
+from services.cache_recherche import invalidate_search
+from services.similarite import similarity_engine
+
+try:
+    from pypdf import PdfReader
+    from pypdf.errors import PyPdfError
+except ImportError:  # Dépendance optionnelle : les PDF ne seront pas extraits
+    PdfReader = None
+    PyPdfError = ValueError
+
+logger = logging.getLogger(__name__)
+
+# Longueur maximale du texte conservé pour un document
+MAX_CARACTERES = 2_000_000
+LONGUEUR_EXTRAIT = 300
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+ODT_TEXT_NS = '{urn:oasis:names:tc:opendocument:xmlns:text:1.0}'
+ODT_META_NS = '{urn:oasis:names:tc:opendocument:xmlns:meta:1.0}'
+
+class ExtractionError(Exception):
+    """Erreur définitive d'extraction (format non pris en charge, fichier absent...)"""
+
+# ==================== EXTRACTEURS ====================
+def _extract_txt(filepath):
+    """Lit un fichier texte (UTF-8, Latin-1 à défaut)"""
+    with open(filepath, 'rb') as f:
+        data = f.read(MAX_CARACTERES * 4)
+    try:
+        return data.decode('utf-8'), None
+    except UnicodeDecodeError:
+        return data.decode('latin-1'), None
+
+def _extract_pdf(filepath):
+    """Extrait le texte page par page avec pypdf"""
+    if PdfReader is None:
+        raise ExtractionError("pypdf n'est pas installé")
+
+    reader = PdfReader(filepath)
+    morceaux = []
+    longueur = 0
+    for page in reader.pages:
+        if longueur >= MAX_CARACTERES:
+            break
+        texte = page.extract_text() or ''
+        morceaux.append(texte)
+        longueur += len(texte)
+    return '\n'.join(morceaux), len(reader.pages)
+
+def _iter_xml_paragraphs(stream, paragraph_tags, text_tags):
+    """Parcourt un XML en flux et renvoie le texte de chaque paragraphe"""
+    morceaux = []
+    for event, elem in ElementTree.iterparse(stream, events=('end',)):
+        if elem.tag in text_tags and elem.text:
+            morceaux.append(elem.text)
+        elif elem.tag in paragraph_tags:
+            if morceaux:
+                yield ''.join(morceaux)
+                morceaux = []
+            elem.clear()
+
+def _read_zip_xml_value(archive, member, tag, attribute=None):
+    """Lit une métadonnée (texte ou attribut) dans un membre XML d'une archive"""
+    try:
+        with archive.open(member) as stream:
+            for event, elem in ElementTree.iterparse(stream, events=('end',)):
+                if elem.tag == tag:
+                    valeur = elem.get(attribute) if attribute else elem.text
+                    return int(valeur) if valeur else None
+    except (KeyError, ValueError, ElementTree.ParseError):
+        pass
+    return None
+
+def _extract_docx(filepath):
+    """Extrait les paragraphes de word/document.xml"""
+    with zipfile.ZipFile(filepath) as archive:
+        with archive.open('word/document.xml') as stream:
+            paragraphes = list(_iter_xml_paragraphs(stream, {f'{WORD_NS}p'}, {f'{WORD_NS}t'}))
+        pages = _read_zip_xml_value(
+            archive, 'docProps/app.xml',
+            '{http://schemas.openxmlformats.org/officeDocument/2006/extended-properties}Pages'
+        )
+    return '\n'.join(paragraphes), pages
+
+def _extract_odt(filepath):
+    """Extrait les paragraphes et titres de content.xml"""
+    tags = (f'{ODT_TEXT_NS}p', f'{ODT_TEXT_NS}h')
+    paragraphes = []
+    with zipfile.ZipFile(filepath) as archive:
+        with archive.open('content.xml') as stream:
+            for event, elem in ElementTree.iterparse(stream, events=('end',)):
+                if elem.tag in tags:
+                    texte = ''.join(elem.itertext())
+                    if texte:
+                        paragraphes.append(texte)
+                    elem.clear()
+        pages = _read_zip_xml_value(
+            archive, 'meta.xml', f'{ODT_META_NS}document-statistic', f'{ODT_META_NS}page-count'
+        )
+    return '\n'.join(paragraphes), pages
+
+EXTRACTEURS = {
+    '.txt': _extract_txt,
+    '.pdf': _extract_pdf,
+    '.docx': _extract_docx,
+    '.odt': _extract_odt,
+}
+
+def extract_file(filepath, nom=None):
+    """
+    Extrait le texte d'un fichier. Le format est déduit de `nom` (nom public,
+    les blobs n'ayant pas d'extension) ou à défaut du chemin.
+    Retourne un tuple (texte, nombre_pages) ; nombre_pages peut valoir None.
+    """
+    ext = os.path.splitext(nom or filepath)[1].lower()
+    extracteur = EXTRACTEURS.get(ext)
+    if extracteur is None:
+        raise ExtractionError(f"Format non pris en charge: {ext}")
+    if not os.path.exists(filepath):
+        raise ExtractionError(f"Fichier introuvable: {filepath}")
+
+    try:
+        texte, pages = extracteur(filepath)
+    except (PyPdfError, zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+        # Fichier corrompu ou mal formé : inutile de réessayer
+        raise ExtractionError(f"Fichier illisible: {str(e)}")
+    return texte[:MAX_CARACTERES], pages
+
+def make_snippet(texte, longueur=LONGUEUR_EXTRAIT):
+    """Construit un court extrait lisible à partir du texte brut"""
+    texte = re.sub(r'\s+', ' ', texte or '').strip()
+    if len(texte) <= longueur:
+        return texte
+    return texte[:longueur].rsplit(' ', 1)[0] + '…'
+
+# ==================== POOL DE WORKERS ====================
+class TextExtractor:
+    """Pool de threads qui extrait le texte des documents hors des requêtes HTTP"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Crée le pool de workers pour l'application"""
+        self.app = app
+        self.max_tentatives = app.config.get('EXTRACTION_MAX_TENTATIVES', 3)
+        self.delai_retry = app.config.get('EXTRACTION_DELAI_RETRY', 30)
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config.get('EXTRACTION_WORKERS', 2),
+            thread_name_prefix='extraction'
+        )
+        app.extensions['text_extractor'] = self
+
+    def prepare(self, doc):
+        """
+        Marque le document comme en attente d'extraction (dans la transaction
+        courante). Appeler submit() une fois la transaction validée.
+        """
+        if doc.texte is None:
+            doc.texte = DocumentTexte(fichier_nom=doc.fichier_nom)
+        doc.texte.reset(doc.fichier_nom)
+
+    def submit(self, doc_ids):
+        """Planifie l'extraction des documents donnés ; retourne les futures"""
+        if self.executor is None:
+            return []
+        return [self.executor.submit(self._run, doc_id) for doc_id in doc_ids]
+
+    def _retry_later(self, doc_id, tentative):
+        """Replanifie une extraction échouée avec un délai croissant"""
+        timer = threading.Timer(self.delai_retry * tentative, self.submit, args=([doc_id],))
+        timer.daemon = True
+        timer.start()
+
+    def _run(self, doc_id):
+        """Extrait le texte d'un document et enregistre le résultat"""
+        with self.app.app_context():
+            texte_doc = db.session.get(DocumentTexte, doc_id)
+            if texte_doc is None or texte_doc.statut != DocumentTexte.STATUT_EN_ATTENTE:
+                return None
+
+            fichier_nom = texte_doc.fichier_nom
+            filepath = storage.file_path(fichier_nom)
+            # Ne pas garder de transaction ouverte pendant une extraction longue
+            db.session.rollback()
+
+            try:
+                texte, pages = extract_file(filepath, fichier_nom)
+            except Exception as e:
+                return self._record_failure(doc_id, fichier_nom, e)
+
+            try:
+                texte_doc = db.session.get(DocumentTexte, doc_id)
+                # Le fichier a pu être remplacé pendant l'extraction
+                if texte_doc is None or texte_doc.fichier_nom != fichier_nom:
+                    return None
+
+                texte_doc.contenu = texte
+                texte_doc.nombre_pages = pages
+                texte_doc.extrait = make_snippet(texte)
+                texte_doc.statut = DocumentTexte.STATUT_TERMINE
+                texte_doc.erreur = None
+                texte_doc.date_extraction = datetime.utcnow()
+                search_index.index_document(texte_doc.document, contenu=texte)
+                db.session.commit()
+                invalidate_search()
+                logger.info(f"Texte extrait pour le document {doc_id} ({len(texte)} caractères)")
+                similarity_engine.submit_update([doc_id])
+                return texte_doc.statut
+            except Exception as e:
+                db.session.rollback()
+                return self._record_failure(doc_id, fichier_nom, e)
+
+    def _record_failure(self, doc_id, fichier_nom, erreur):
+        """Enregistre un échec et replanifie si l'erreur n'est pas définitive"""
+        texte_doc = db.session.get(DocumentTexte, doc_id)
+        if texte_doc is None or texte_doc.fichier_nom != fichier_nom:
+            return None
+
+        texte_doc.tentatives = (texte_doc.tentatives or 0) + 1
+        texte_doc.erreur = str(erreur)
+        definitive = isinstance(erreur, ExtractionError) or texte_doc.tentatives >= self.max_tentatives
+        texte_doc.statut = DocumentTexte.STATUT_ECHEC if definitive else DocumentTexte.STATUT_EN_ATTENTE
+        db.session.commit()
+
+        if definitive:
+            logger.error(f"Extraction impossible pour le document {doc_id}: {str(erreur)}")
+            # Le titre et la description suffisent à placer le document
+            similarity_engine.submit_update([doc_id])
+        else:
+            logger.warning(f"Extraction échouée pour le document {doc_id} "
+                           f"(tentative {texte_doc.tentatives}): {str(erreur)}")
+            self._retry_later(doc_id, texte_doc.tentatives)
+        return texte_doc.statut
+
+text_extractor = TextExtractor()
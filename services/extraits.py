@@ -0,0 +1,152 @@
+"""
+Passages des résultats de recherche : pour chaque document de la page, un
+ou deux extraits du texte indexé où les termes recherchés sont surlignés.
+Les termes sont reconnus comme par l'index plein texte (préfixes, sans
+accents ni majuscules) avec une expression régulière compilée une fois par
+recherche. Une seconde requête MATCH avec snippet() serait bien plus lente :
+pour une requête par préfixes, FTS5 fusionne les listes de tous les termes
+concernés, même pour relire un seul document.
+"""
+from markupsafe import Markup, escape
+from models.models import db
+from services.normalisation import plier
+from services.search_index import FTS_TABLE, is_available
+from sqlalchemy import bindparam, text
+from functools import lru_cache
+import re
+
+LONGUEUR_PASSAGE = 200   # Caractères par passage
+CONTEXTE_AVANT = 60      # Caractères conservés avant le premier terme
+NB_PASSAGES = 2
+MAX_TEXTE = 60000        # Début du texte extrait examiné (~ 15 pages)
+MAX_OCCURRENCES = 60     # Suffisant pour choisir les passages ; arrête la lecture
+
+def _variantes():
+    """Caractères latins regroupés par lettre de base ('e' -> 'EeÈÉÊËèéêë...')"""
+    variantes = {}
+    for code in range(0x20, 0x250):
+        caractere = chr(code)
+        plie = plier(caractere)
+        if len(plie) == 1 and plie.isalnum():
+            variantes.setdefault(plie, set()).add(caractere)
+    return {base: ''.join(sorted(caracteres)) for base, caracteres in variantes.items()}
+
+VARIANTES = _variantes()
+
+def termes(query):
+    """Termes de la recherche, pliés, du plus long au plus court"""
+    return tuple(sorted({plier(mot) for mot in re.findall(r'\w+', query, re.UNICODE)}, key=len, reverse=True))
+
+@lru_cache(maxsize=256)
+def _motif(termes):
+    """Mots commençant par l'un des termes, quels que soient accents et majuscules"""
+    alternatives = [
+        ''.join(f"[{re.escape(VARIANTES[c])}]" if c in VARIANTES else re.escape(c) for c in terme)
+        for terme in termes
+    ]
+    # Les classes couvrent déjà majuscules et accents latins ; IGNORECASE (plus lent) pour le reste
+    latin = all(c in VARIANTES for terme in termes for c in terme)
+    return re.compile(r'(?<!\w)(?:' + '|'.join(alternatives) + r')\w*', 0 if latin else re.IGNORECASE)
+
+def _occurrences(texte, motif, termes):
+    """[(début, fin, terme)] des mots reconnus dans `texte`"""
+    occurrences = []
+    for m in motif.finditer(texte):
+        plie = plier(m.group())
+        terme = next((t for t in termes if plie.startswith(t)), None)
+        occurrences.append((m.start(), m.end(), terme))
+        if len(occurrences) >= MAX_OCCURRENCES:
+            break
+    return occurrences
+
+def _fenetres(occurrences, nombre):
+    """
+    Choisit jusqu'à `nombre` fenêtres disjointes [début, fin) de LONGUEUR_PASSAGE
+    caractères, celles qui couvrent le plus de termes distincts puis d'occurrences.
+    """
+    candidates = []
+    j = 0
+    for i, (debut, _, _) in enumerate(occurrences):
+        ouverture = max(0, debut - CONTEXTE_AVANT)
+        fermeture = ouverture + LONGUEUR_PASSAGE
+        j = max(j, i)
+        while j + 1 < len(occurrences) and occurrences[j + 1][1] <= fermeture:
+            j += 1
+        couvertes = occurrences[i:j + 1]
+        score = (len({terme for _, _, terme in couvertes}), len(couvertes), -debut)
+        candidates.append((score, ouverture, fermeture))
+
+    choisies = []
+    for _, ouverture, fermeture in sorted(candidates, reverse=True):
+        if all(fermeture <= o or ouverture >= f for o, f in choisies):
+            choisies.append((ouverture, fermeture))
+            if len(choisies) == nombre:
+                break
+    return sorted(choisies)
+
+def _marquer(texte, occurrences, debut=0, fin=None):
+    """Texte échappé entre `debut` et `fin`, termes entourés de <mark>, espaces réduits"""
+    fin = len(texte) if fin is None else fin
+    morceaux = []
+    position = debut
+    for o_debut, o_fin, _ in occurrences:
+        if o_debut < debut or o_fin > fin:
+            continue
+        morceaux.append(escape(re.sub(r'\s+', ' ', texte[position:o_debut])))
+        morceaux.append(Markup('<mark>%s</mark>') % texte[o_debut:o_fin])
+        position = o_fin
+    morceaux.append(escape(re.sub(r'\s+', ' ', texte[position:fin])))
+    return Markup('').join(morceaux)
+
+def _passage(texte, occurrences, ouverture, fermeture):
+    """Passage coupé aux limites de mots, avec des points de suspension"""
+    fermeture = min(fermeture, len(texte))
+    dedans = [o for o in occurrences if o[0] >= ouverture and o[1] <= fermeture]
+    if not dedans:
+        return None
+    premier, dernier = dedans[0][0], dedans[-1][1]
+    if ouverture > 0:
+        espace = texte.find(' ', ouverture, premier)
+        ouverture = espace + 1 if espace != -1 else ouverture
+    if fermeture < len(texte):
+        espace = texte.rfind(' ', dernier, fermeture)
+        fermeture = espace if espace != -1 else fermeture
+    passage = _marquer(texte, dedans, ouverture, fermeture).strip()
+    return (Markup('…') if ouverture > 0 else Markup('')) + passage + \
+        (Markup('…') if fermeture < len(texte) else Markup(''))
+
+def highlights(query, doc_ids):
+    """
+    Titre surligné et passages des documents `doc_ids` (ceux de la page) :
+    {doc_id: {'titre': Markup, 'passages': [Markup]}}. Les passages viennent
+    du texte extrait, puis de la description s'il en manque.
+    """
+    mots = termes(query or '')
+    if not doc_ids or not mots or not is_available():
+        return {}
+    motif = _motif(mots)
+
+    lignes = db.session.execute(
+        text(
+            f"SELECT rowid, titre, description, substr(contenu, 1, :max_texte) "
+            f"FROM {FTS_TABLE} WHERE rowid IN :ids"
+        ).bindparams(bindparam('ids', expanding=True)),
+        {'ids': list(doc_ids), 'max_texte': MAX_TEXTE}
+    )
+    resultats = {}
+    for doc_id, titre, description, contenu in lignes:
+        passages = []
+        for texte in (contenu, description):
+            if not texte or len(passages) >= NB_PASSAGES:
+                continue
+            occurrences = _occurrences(texte, motif, mots)
+            for ouverture, fermeture in _fenetres(occurrences, NB_PASSAGES - len(passages)):
+                passage = _passage(texte, occurrences, ouverture, fermeture)
+                if passage:
+                    passages.append(passage)
+        titre = titre or ''
+        resultats[doc_id] = {
+            'titre': _marquer(titre, _occurrences(titre, motif, mots)),
+            'passages': passages,
+        }
+    return resultats
@@ -0,0 +1,115 @@
+"""
+Facettes de la recherche : nombre de résultats par catégorie et par mois
+d'ajout, calculés en une seule requête groupée (catégorie, mois) qui donne
+aussi le total de la page de résultats. Chaque facette ignore son propre
+filtre (les autres catégories restent proposées avec leur nombre) et le
+résultat est mis en cache par recherche normalisée.
+"""
+from flask import current_app
+from models.models import db, Categorie, Document
+from services.cache import documents_generation
+from services.cache_recherche import TAG_RECHERCHE
+from services.response_cache import tag_generation
+from services.normalisation import plier
+from services.recherche import build_search, date_conditions
+from collections import OrderedDict
+from datetime import date, timedelta
+import threading
+import time
+
+NOMS_MOIS = ('janvier', 'février', 'mars', 'avril', 'mai', 'juin', 'juillet',
+             'août', 'septembre', 'octobre', 'novembre', 'décembre')
+
+def _mois(colonne):
+    """Expression 'AAAA-MM' de la date `colonne`"""
+    if db.engine.dialect.name == 'sqlite':
+        # Dates stockées en texte ISO : bien moins coûteux que strftime()
+        return db.func.substr(colonne, 1, 7)
+    return db.func.to_char(colonne, 'YYYY-MM')
+
+def _entree_mois(mois, nombre):
+    annee, numero = int(mois[:4]), int(mois[5:7])
+    debut = date(annee, numero, 1)
+    fin = (debut + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+    return {
+        'mois': mois, 'libelle': f"{NOMS_MOIS[numero - 1]} {annee}", 'nombre': nombre,
+        'date_debut': debut.isoformat(), 'date_fin': fin.isoformat(),
+    }
+
+def compute_facets(q, categorie_id=None, date_debut=None, date_fin=None):
+    """
+    {'total': n, 'categories': [{'id', 'nom', 'nombre'}], 'mois': [{'mois',
+    'libelle', 'nombre', 'date_debut', 'date_fin'}]} pour la recherche `q`.
+    Les catégories sont comptées dans la période choisie, les mois dans la
+    catégorie choisie ; le total applique les deux filtres.
+    """
+    categorie_id = int(categorie_id) if categorie_id else None
+    query, _ = build_search(q, score=False)
+    periode = date_conditions(date_debut, date_fin)
+    dans_periode = db.func.sum(db.case((db.and_(*periode), 1), else_=0)) if periode else db.func.count()
+    mois = _mois(Document.date_ajout)
+
+    lignes = (
+        query.with_entities(Document.categorie_id, mois, db.func.count(), dans_periode)
+        .order_by(None)
+        .group_by(Document.categorie_id, mois)
+        .all()
+    )
+
+    total = 0
+    par_categorie, par_mois = {}, {}
+    for cat_id, cle_mois, nombre, nombre_periode in lignes:
+        nombre_periode = nombre_periode or 0
+        par_categorie[cat_id] = par_categorie.get(cat_id, 0) + nombre_periode
+        if categorie_id is None or cat_id == categorie_id:
+            total += nombre_periode
+            if cle_mois:
+                par_mois[cle_mois] = par_mois.get(cle_mois, 0) + nombre
+
+    noms = dict(db.session.query(Categorie.id, Categorie.nom).filter(
+        Categorie.id.in_([cat_id for cat_id, nombre in par_categorie.items() if nombre])
+    ).all()) if par_categorie else {}
+    categories = sorted(
+        ({'id': cat_id, 'nom': noms.get(cat_id, ''), 'nombre': nombre}
+         for cat_id, nombre in par_categorie.items() if nombre),
+        key=lambda c: (-c['nombre'], c['nom'])
+    )
+    return {
+        'total': total,
+        'categories': categories,
+        'mois': [_entree_mois(cle, nombre) for cle, nombre in sorted(par_mois.items(), reverse=True)],
+    }
+
+class FacetCache:
+    """
+    Facettes mises en cache par recherche normalisée (texte plié, filtres),
+    jusqu'à une écriture sur les documents, l'indexation d'un texte extrait
+    ou l'expiration du TTL.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, q, categorie_id=None, date_debut=None, date_fin=None):
+        ttl = current_app.config.get('FACETTES_TTL', 300)
+        cle = (' '.join(plier(q).split()), str(categorie_id or ''), date_debut, date_fin,
+               documents_generation.current(), tag_generation(TAG_RECHERCHE).current())
+        maintenant = time.monotonic()
+
+        with self._lock:
+            entree = self._entries.get(cle)
+            if entree is not None and entree[1] > maintenant:
+                self._entries.move_to_end(cle)
+                return entree[0]
+
+        facettes = compute_facets(q, categorie_id, date_debut, date_fin)
+        with self._lock:
+            self._entries[cle] = (facettes, maintenant + ttl)
+            self._entries.move_to_end(cle)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return facettes
+
+facet_cache = FacetCache()
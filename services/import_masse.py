@@ -0,0 +1,177 @@
+"""
+Import en masse d'une arborescence de fichiers (flask import-documents).
+Chaque sous-dossier de premier niveau correspond à une catégorie. Les
+fichiers sont hachés sur place par un pool de processus ; seuls les contenus
+nouveaux sont copiés dans le stockage, puis les documents sont insérés par
+lots, une transaction par lot.
+"""
+from flask import current_app
+from models.models import db, Document, Categorie, Fichier
+from services import search_index, storage
+from services.extraction import text_extractor
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+TAILLE_LOT = 500
+
+def scan(racine, extensions, categorie_defaut=None):
+    """
+    Liste les fichiers à importer : [(chemin, nom de catégorie)]. Les fichiers
+    à la racine vont dans `categorie_defaut` (ignorés si elle n'est pas donnée).
+    """
+    fichiers = []
+    ignores = 0
+    for dossier, sous_dossiers, noms in os.walk(racine):
+        sous_dossiers.sort()
+        relatif = os.path.relpath(dossier, racine)
+        categorie = categorie_defaut if relatif == '.' else relatif.split(os.sep)[0]
+        for nom in sorted(noms):
+            if nom.startswith('.') or os.path.splitext(nom)[1].lower() not in extensions:
+                continue
+            if categorie is None:
+                ignores += 1
+                continue
+            fichiers.append((os.path.join(dossier, nom), categorie))
+    return fichiers, ignores
+
+def _hash(chemin):
+    """
+    Exécuté dans un processus du pool : empreinte du fichier source, lu sur
+    place. Retourne (sha256, taille, erreur).
+    """
+    try:
+        sha, taille = storage.hash_file(chemin)
+        return sha, taille, None
+    except OSError as e:
+        return None, 0, str(e)
+
+def _copy(chemin, dossier_tmp, sha256):
+    """
+    Exécuté dans un processus du pool : copie un contenu nouveau dans le
+    dossier temporaire du stockage en vérifiant qu'il n'a pas changé depuis
+    son hachage. Retourne (chemin temporaire, erreur).
+    """
+    tmp = os.path.join(dossier_tmp, uuid.uuid4().hex)
+    sha = hashlib.sha256()
+    try:
+        with open(chemin, 'rb') as source, open(tmp, 'wb') as destination:
+            for bloc in iter(lambda: source.read(storage.TAILLE_BLOC), b''):
+                sha.update(bloc)
+                destination.write(bloc)
+        if sha.hexdigest() != sha256:
+            raise OSError("fichier modifié pendant l'import")
+        return tmp, None
+    except OSError as e:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return None, str(e)
+
+def _titre(chemin):
+    """Titre lisible tiré du nom de fichier"""
+    base = os.path.splitext(os.path.basename(chemin))[0]
+    return ' '.join(base.replace('_', ' ').replace('-', ' ').split())[:200] or base[:200]
+
+def _categories(noms):
+    """Catégories par nom, créées si besoin"""
+    existantes = {c.nom: c for c in Categorie.query.filter(Categorie.nom.in_(noms))}
+    for nom in noms:
+        if nom not in existantes:
+            existantes[nom] = Categorie(nom=nom)
+            db.session.add(existantes[nom])
+    db.session.commit()
+    return {nom: c.id for nom, c in existantes.items()}
+
+def _known_hashes():
+    """Empreintes des contenus déjà rattachés à un document"""
+    return {
+        sha for sha, in db.session.query(Fichier.blob_sha256)
+        .join(Document, Document.fichier_nom == Fichier.nom)
+    }
+
+def _commit_batch(lot, categories):
+    """Range les fichiers du lot dans le stockage et insère leurs documents"""
+    documents = []
+    for chemin, categorie, tmp, sha, taille in lot:
+        nom = storage.promote(tmp, sha, taille, os.path.basename(chemin))
+        doc = Document(titre=_titre(chemin), fichier_nom=nom,
+                       categorie_id=categories[categorie], taille_fichier=taille)
+        text_extractor.prepare(doc)
+        documents.append(doc)
+    db.session.add_all(documents)
+    db.session.flush()
+    search_index.index_new_documents(documents)
+    db.session.commit()
+    return [doc.id for doc in documents]
+
+def import_directory(racine, categorie_defaut=None, workers=None, taille_lot=TAILLE_LOT, progress=None):
+    """
+    Importe les fichiers de `racine`. `progress(traites, total, stats)` est
+    appelé après chaque lot. Retourne les statistiques de l'import.
+    """
+    extensions = current_app.config['ALLOWED_EXTENSIONS']
+    fichiers, hors_categorie = scan(racine, extensions, categorie_defaut)
+    stats = {'total': len(fichiers), 'importes': 0, 'deja_importes': 0,
+             'erreurs': 0, 'hors_categorie': hors_categorie, 'ids': [], 'categorie_ids': []}
+    if not fichiers:
+        return stats
+
+    categories = _categories(sorted({categorie for _, categorie in fichiers}))
+    stats['categorie_ids'] = sorted(categories.values())
+    connus = _known_hashes()
+    dossier_tmp = os.path.dirname(storage.temp_path())
+
+    lot = []
+    traites = 0
+
+    def valider():
+        # Copies des contenus nouveaux du lot, lancées au fil du hachage
+        copies = []
+        for chemin, categorie, copie, sha, taille in lot:
+            tmp, erreur = copie.result()
+            if erreur:
+                stats['erreurs'] += 1
+                logger.error(f"Copie impossible de {chemin}: {erreur}")
+                continue
+            copies.append((chemin, categorie, tmp, sha, taille))
+        try:
+            if copies:
+                stats['ids'].extend(_commit_batch(copies, categories))
+                stats['importes'] += len(copies)
+        except Exception as e:
+            db.session.rollback()
+            stats['erreurs'] += len(copies)
+            logger.error(f"Erreur lors de l'import d'un lot de {len(copies)} fichier(s): {str(e)}")
+            for _, _, tmp, _, _ in copies:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        lot.clear()
+        if progress:
+            progress(traites, len(fichiers), stats)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Hachage sur place : un contenu déjà importé n'est jamais copié
+        empreintes = pool.map(_hash, [chemin for chemin, _ in fichiers], chunksize=32)
+        for (chemin, categorie), (sha, taille, erreur) in zip(fichiers, empreintes):
+            traites += 1
+            if erreur:
+                stats['erreurs'] += 1
+                logger.error(f"Lecture impossible de {chemin}: {erreur}")
+                continue
+            if sha in connus:
+                # Contenu déjà importé (ou doublon dans l'arborescence)
+                stats['deja_importes'] += 1
+                continue
+            connus.add(sha)
+            lot.append((chemin, categorie, pool.submit(_copy, chemin, dossier_tmp, sha), sha, taille))
+            if len(lot) >= taille_lot:
+                valider()
+        valider()
+
+    return stats
@@ -0,0 +1,241 @@
+"""
+Instrumentation des requêtes HTTP : durée, nombre et durée des requêtes SQL,
+temps de rendu des templates et taille des réponses, par endpoint.
+Les histogrammes sont exposés au format texte Prometheus sur /metrics
+(administrateur ou jeton METRIQUES_TOKEN) ; les requêtes qui dépassent le
+budget configuré sont journalisées. Les valeurs sont propres à chaque
+processus : avec plusieurs workers, chacun est interrogé séparément.
+"""
+from flask import current_app, g, request, session, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from bisect import bisect_left
+import hmac
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PREFIXE = 'basedoc'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+SEUILS_DUREE = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SEUILS_REQUETES_SQL = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SEUILS_TAILLE = (1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2, 100 * 1024 ** 2)
+
+def _echapper(valeur):
+    return str(valeur).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    return '{' + ','.join(f'{nom}="{_echapper(valeur)}"' for nom, valeur in labels.items()) + '}'
+
+class Histogramme:
+    """Histogramme Prometheus par endpoint (compteurs par seuil, somme, nombre)"""
+
+    def __init__(self, nom, aide, seuils):
+        self.nom = nom
+        self.aide = aide
+        self.seuils = seuils
+        self._series = {}
+
+    def observe(self, endpoint, valeur):
+        serie = self._series.get(endpoint)
+        if serie is None:
+            serie = self._series[endpoint] = [[0] * (len(self.seuils) + 1), 0.0]
+        serie[0][bisect_left(self.seuils, valeur)] += 1
+        serie[1] += valeur
+
+    def render(self, lignes):
+        lignes.append(f'# HELP {self.nom} {self.aide}')
+        lignes.append(f'# TYPE {self.nom} histogram')
+        for endpoint in sorted(self._series):
+            compteurs, somme = self._series[endpoint]
+            cumul = 0
+            for seuil, nombre in zip((*self.seuils, '+Inf'), compteurs):
+                cumul += nombre
+                lignes.append(f'{self.nom}_bucket{_labels(endpoint=endpoint, le=seuil)} {cumul}')
+            lignes.append(f'{self.nom}_sum{_labels(endpoint=endpoint)} {round(somme, 6)}')
+            lignes.append(f'{self.nom}_count{_labels(endpoint=endpoint)} {cumul}')
+
+class Compteur:
+    """Compteur Prometheus avec des labels"""
+
+    def __init__(self, nom, aide):
+        self.nom = nom
+        self.aide = aide
+        self._valeurs = {}
+
+    def inc(self, **labels):
+        cle = tuple(labels.items())
+        self._valeurs[cle] = self._valeurs.get(cle, 0) + 1
+
+    def render(self, lignes):
+        lignes.append(f'# HELP {self.nom} {self.aide}')
+        lignes.append(f'# TYPE {self.nom} counter')
+        for cle in sorted(self._valeurs):
+            lignes.append(f'{self.nom}{_labels(**dict(cle))} {self._valeurs[cle]}')
+
+class Metriques:
+    """Collecte par requête (hooks Flask, événements SQLAlchemy et signaux de rendu)"""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self.duree = Histogramme(f'{PREFIXE}_requete_duree_secondes',
+                                 "Durée de traitement des requêtes HTTP", SEUILS_DUREE)
+        self.sql_nombre = Histogramme(f'{PREFIXE}_requete_sql_nombre',
+                                      "Requêtes SQL exécutées par requête HTTP", SEUILS_REQUETES_SQL)
+        self.sql_duree = Histogramme(f'{PREFIXE}_requete_sql_duree_secondes',
+                                     "Temps passé en SQL par requête HTTP", SEUILS_DUREE)
+        self.rendu = Histogramme(f'{PREFIXE}_rendu_template_secondes',
+                                 "Temps de rendu des templates par requête HTTP", SEUILS_DUREE)
+        self.taille = Histogramme(f'{PREFIXE}_reponse_taille_octets',
+                                  "Taille des réponses HTTP", SEUILS_TAILLE)
+        self.requetes = Compteur(f'{PREFIXE}_requetes_total', "Requêtes HTTP par endpoint et statut")
+        self.hors_budget = Compteur(f'{PREFIXE}_requetes_hors_budget_total',
+                                    "Requêtes HTTP au-delà du budget de temps ou de requêtes SQL")
+        self._jauges = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Installe les hooks sur l'application et la route /metrics"""
+        app.extensions['metriques'] = self
+        if not app.config.get('METRIQUES_ENABLED', True):
+            return
+        self.budget_ms = app.config.get('METRIQUES_BUDGET_MS', 500)
+        self.budget_requetes = app.config.get('METRIQUES_BUDGET_REQUETES', 20)
+        self.jeton = app.config.get('METRIQUES_TOKEN')
+
+        app.before_request(self._debut)
+        # Enregistré en premier, donc exécuté en dernier parmi les after_request
+        app.after_request(self._fin)
+        before_render_template.connect(self._debut_rendu, app)
+        template_rendered.connect(self._fin_rendu, app)
+        app.add_url_rule('/metrics', 'metrics', self.view)
+
+    def register_gauge(self, nom, aide, fonction, label=None, type='gauge'):
+        """
+        Ajoute une valeur lue au moment de l'export : `fonction()` retourne un
+        nombre, ou {valeur du label: nombre} si `label` est donné. Une seconde
+        inscription sous le même nom remplace la première.
+        """
+        self._jauges[f'{PREFIXE}_{nom}'] = (aide, fonction, label, type)
+
+    # ---------- Requêtes HTTP ----------
+    def _debut(self):
+        g.metriques = {'debut': time.perf_counter(), 'sql': 0, 'sql_duree': 0.0,
+                       'rendu': 0.0, 'rendus': []}
+
+    def _fin(self, response):
+        mesure = g.pop('metriques', None)
+        if mesure is None or request.endpoint == 'metrics':
+            return response
+        duree = time.perf_counter() - mesure['debut']
+        endpoint = request.endpoint or 'aucun'
+        taille = response.content_length or 0
+
+        with self._lock:
+            self.duree.observe(endpoint, duree)
+            self.sql_nombre.observe(endpoint, mesure['sql'])
+            self.sql_duree.observe(endpoint, mesure['sql_duree'])
+            if mesure['rendu']:
+                self.rendu.observe(endpoint, mesure['rendu'])
+            self.taille.observe(endpoint, taille)
+            self.requetes.inc(endpoint=endpoint, statut=response.status_code)
+
+        raisons = []
+        if duree * 1000 > self.budget_ms:
+            raisons.append('duree')
+        if mesure['sql'] > self.budget_requetes:
+            raisons.append('requetes_sql')
+        if raisons:
+            details = {
+                'endpoint': endpoint, 'methode': request.method, 'chemin': request.full_path.rstrip('?'),
+                'statut': response.status_code, 'duree_ms': round(duree * 1000, 1),
+                'requetes_sql': mesure['sql'], 'sql_ms': round(mesure['sql_duree'] * 1000, 1),
+                'rendu_ms': round(mesure['rendu'] * 1000, 1), 'taille': taille, 'depassements': raisons,
+            }
+            with self._lock:
+                for raison in raisons:
+                    self.hors_budget.inc(endpoint=endpoint, raison=raison)
+            logger.warning(f"Requête hors budget: {json.dumps(details, ensure_ascii=False)}",
+                           extra={'metriques': details})
+        return response
+
+    # ---------- Rendu des templates ----------
+    def _debut_rendu(self, sender, template, context, **extra):
+        mesure = g.get('metriques') if has_request_context() else None
+        if mesure is not None:
+            mesure['rendus'].append(time.perf_counter())
+
+    def _fin_rendu(self, sender, template, context, **extra):
+        mesure = g.get('metriques') if has_request_context() else None
+        if mesure is not None and mesure['rendus']:
+            debut = mesure['rendus'].pop()
+            # Les fragments rendus pendant un template sont déjà comptés dans celui-ci
+            if not mesure['rendus']:
+                mesure['rendu'] += time.perf_counter() - debut
+
+    # ---------- Export ----------
+    def autorise(self):
+        """Administrateur connecté, ou jeton `Authorization: Bearer ...` valide"""
+        if session.get('is_admin'):
+            return True
+        entete = request.headers.get('Authorization', '')
+        return bool(self.jeton) and entete.startswith('Bearer ') and \
+            hmac.compare_digest(entete[len('Bearer '):], self.jeton)
+
+    def render(self):
+        lignes = []
+        with self._lock:
+            for metrique in (self.duree, self.sql_nombre, self.sql_duree, self.rendu,
+                             self.taille, self.requetes, self.hors_budget):
+                metrique.render(lignes)
+        for nom, (aide, fonction, label, type) in self._jauges.items():
+            try:
+                valeurs = fonction()
+            except Exception as e:
+                logger.error(f"Erreur lors de la lecture de la métrique {nom}: {str(e)}")
+                continue
+            lignes.append(f'# HELP {nom} {aide}')
+            lignes.append(f'# TYPE {nom} {type}')
+            if label is None:
+                lignes.append(f'{nom} {valeurs}')
+            else:
+                for valeur_label, valeur in sorted(valeurs.items()):
+                    lignes.append(f'{nom}{_labels(**{label: valeur_label})} {valeur}')
+        return '\n'.join(lignes) + '\n'
+
+    def view(self):
+        """GET /metrics (format texte Prometheus)"""
+        if not self.autorise():
+            return current_app.response_class("Accès réservé aux administrateurs\n", status=403,
+                                              mimetype='text/plain')
+        return current_app.response_class(self.render(), content_type=CONTENT_TYPE)
+
+metriques = Metriques()
+
+# ==================== REQUÊTES SQL ====================
+@event.listens_for(Engine, 'before_cursor_execute')
+def _debut_sql(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metriques' in g:
+        conn.info.setdefault('metriques_debuts', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _fin_sql(conn, cursor, statement, parameters, context, executemany):
+    debuts = conn.info.get('metriques_debuts')
+    if debuts and has_request_context():
+        mesure = g.get('metriques')
+        debut = debuts.pop()
+        if mesure is not None:
+            mesure['sql'] += 1
+            mesure['sql_duree'] += time.perf_counter() - debut
+
+@event.listens_for(Engine, 'handle_error')
+def _erreur_sql(contexte):
+    if contexte.connection is not None:
+        debuts = contexte.connection.info.get('metriques_debuts')
+        if debuts:
+            debuts.pop()
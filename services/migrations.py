@@ -0,0 +1,125 @@
+"""Migrations de schéma versionnées, appliquées sur place (flask upgrade-db)"""
+from flask import current_app
+from models.models import db
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+from datetime import datetime
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = []
+
+def migration(version, description):
+    """Déclare une migration ; elles sont appliquées par ordre de version"""
+    def decorator(f):
+        MIGRATIONS.append((version, description, f))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return f
+    return decorator
+
+# ==================== OUTILS ====================
+def _create_index(conn, nom, table, colonnes):
+    """Crée un index s'il n'existe pas (SQLite ne bloque pas les lecteurs en WAL)"""
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {nom} ON {table} ({colonnes})"))
+
+def _add_column(conn, table, colonne, definition):
+    """Ajoute une colonne si elle n'existe pas encore (base créée par create_all)"""
+    colonnes = {c['name'] for c in inspect(conn).get_columns(table)}
+    if colonne not in colonnes:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {colonne} {definition}"))
+        return True
+    return False
+
+# ==================== MIGRATIONS ====================
+@migration(1, "Index composites des listes, du tableau de bord et du top des vues")
+def _index_documents(conn):
+    _create_index(conn, 'ix_document_categorie_date', 'document', 'categorie_id, date_ajout')
+    _create_index(conn, 'ix_document_categorie_titre', 'document', 'categorie_id, titre')
+    _create_index(conn, 'ix_document_categorie_vues', 'document', 'categorie_id, nombre_vues')
+    _create_index(conn, 'ix_document_date_ajout', 'document', 'date_ajout')
+    _create_index(conn, 'ix_document_nombre_vues', 'document', 'nombre_vues')
+    if conn.dialect.name == 'sqlite':
+        conn.execute(text("ANALYZE document"))
+
+@migration(2, "Compteur de documents dénormalisé sur les catégories")
+def _categorie_document_count(conn):
+    _add_column(conn, 'categorie', 'document_count', 'INTEGER NOT NULL DEFAULT 0')
+    conn.execute(text(
+        "UPDATE categorie SET document_count = "
+        "(SELECT COUNT(*) FROM document WHERE document.categorie_id = categorie.id)"
+    ))
+
+@migration(3, "Titre et description normalisés, vocabulaire de la recherche approchée")
+def _recherche_approchee(conn):
+    from services.recherche_approchee import rebuild_terms
+    _add_column(conn, 'document', 'titre_normalise', 'VARCHAR(200)')
+    _add_column(conn, 'document', 'description_normalisee', 'TEXT')
+    rebuild_terms(conn)
+
+# ==================== EXÉCUTION ====================
+def _ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, description VARCHAR(200), date_application DATETIME)"
+    ))
+
+def current_version():
+    """Dernière version de schéma appliquée (0 pour une base jamais migrée)"""
+    with db.engine.begin() as conn:
+        _ensure_version_table(conn)
+        return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+
+def pending_migrations():
+    """Migrations pas encore appliquées sur la base courante"""
+    version = current_version()
+    return [m for m in MIGRATIONS if m[0] > version]
+
+def _begin_write(conn):
+    """
+    Prend le verrou d'écriture SQLite avant de relire schema_version. Un
+    autre processus qui migre le garde le temps de sa migration : on attend
+    jusqu'à MIGRATIONS_ATTENTE secondes, par tranches de busy_timeout.
+    """
+    if conn.dialect.name != 'sqlite':
+        return
+    limite = time.monotonic() + current_app.config.get('MIGRATIONS_ATTENTE', 600)
+    while True:
+        try:
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+            return
+        except OperationalError as e:
+            if 'locked' not in str(e) or time.monotonic() > limite:
+                raise
+            logger.info("Migration en cours dans un autre processus, attente du verrou d'écriture")
+
+def upgrade():
+    """
+    Applique les migrations en attente, chacune dans sa propre transaction.
+    La transaction prend le verrou d'écriture (BEGIN IMMEDIATE) avant de
+    vérifier que la migration n'est pas déjà appliquée : de deux workers qui
+    démarrent en même temps, le second attend le premier puis trouve la
+    version enregistrée et passe à la suivante.
+    """
+    appliquees = []
+    for version, description, fonction in pending_migrations():
+        with db.engine.connect() as conn:
+            _begin_write(conn)
+            deja = conn.execute(
+                text("SELECT 1 FROM schema_version WHERE version = :version"), {'version': version}
+            ).first()
+            if deja:
+                conn.rollback()
+                continue
+            fonction(conn)
+            insertion = 'INSERT OR IGNORE' if conn.dialect.name == 'sqlite' else 'INSERT'
+            conn.execute(
+                text(f"{insertion} INTO schema_version (version, description, date_application) "
+                     "VALUES (:version, :description, :date)"),
+                {'version': version, 'description': description, 'date': datetime.utcnow()}
+            )
+            conn.commit()
+        logger.info(f"Migration {version} appliquée: {description}")
+        appliquees.append((version, description))
+    return appliquees
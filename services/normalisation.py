@@ -0,0 +1,26 @@
+"""
+Normalisation du texte pour la recherche, identique au tokenizer de l'index
+plein texte (unicode61 remove_diacritics 2) : minuscules sans accents,
+découpage en mots et trigrammes des mots pour la recherche approchée.
+"""
+import re
+import unicodedata
+
+MOT_RE = re.compile(r'[^\W_]+')
+
+def plier(texte):
+    """Minuscules sans accents ('Récolte' -> 'recolte')"""
+    texte = unicodedata.normalize('NFKD', (texte or '').casefold())
+    return ''.join(c for c in texte if not unicodedata.combining(c))
+
+def mots(texte):
+    """Mots pliés de `texte`, dans l'ordre"""
+    return MOT_RE.findall(plier(texte))
+
+def trigrammes(mot):
+    """
+    Trigrammes d'un mot plié, complété comme pg_trgm (deux espaces avant,
+    un après) pour que le début du mot compte davantage que la fin
+    """
+    entoure = f"  {mot} "
+    return {entoure[i:i + 3] for i in range(len(entoure) - 2)}
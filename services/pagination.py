@@ -0,0 +1,171 @@
+"""Pagination par curseur (keyset) et comptages approximatifs mis en cache"""
+from flask import current_app
+from models.models import db, Document
+from services.cache import documents_generation
+from collections import OrderedDict
+from datetime import datetime
+import base64
+import json
+import threading
+import time
+
+# Clé de tri de chaque ordre proposé dans les vues ; Document.id départage
+SORTS = {
+    'date_desc': (Document.date_ajout, 'desc'),
+    'date_asc': (Document.date_ajout, 'asc'),
+    'titre_asc': (Document.titre, 'asc'),
+    'titre_desc': (Document.titre, 'desc'),
+    'vues_desc': (Document.nombre_vues, 'desc'),
+}
+
+DEFAULT_SORT = 'date_desc'
+
+def sort_key(sort_by):
+    """Retourne (expression, sens) pour un ordre de tri ; date_desc par défaut"""
+    return SORTS.get(sort_by, SORTS[DEFAULT_SORT])
+
+# ==================== CURSEURS ====================
+def encode_cursor(valeur, doc_id, sens):
+    """Encode la position (valeur de tri, id) dans un jeton opaque pour l'URL"""
+    if isinstance(valeur, datetime):
+        valeur = {'dt': valeur.isoformat()}
+    data = json.dumps({'v': valeur, 'id': doc_id, 's': sens}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Décode un jeton ; retourne (valeur, id, sens) ou None s'il est invalide"""
+    if not cursor:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        valeur = data['v']
+        if isinstance(valeur, dict):
+            valeur = datetime.fromisoformat(valeur['dt'])
+        if data['s'] not in ('next', 'prev'):
+            return None
+        return valeur, int(data['id']), data['s']
+    except (ValueError, KeyError, TypeError):
+        return None
+
+# ==================== PAGE ====================
+class KeysetPage:
+    """Page de résultats obtenue par curseur (interface proche de Pagination)"""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+def _nullable(cle):
+    """Indique si la clé de tri peut valoir NULL"""
+    colonne = getattr(cle, 'expression', cle)
+    return getattr(colonne, 'nullable', True)
+
+def _seek(cle, sens, valeur, doc_id):
+    """
+    Condition « strictement après (valeur, id) » dans le sens donné. La
+    comparaison de tuples (cle, id) < (?, ?) est résolue par l'index.
+    """
+    if valeur is None:
+        # Les NULL sont en tête en ASC et en fin en DESC (SQLite)
+        if sens == 'asc':
+            return db.or_(cle.isnot(None), db.and_(cle.is_(None), Document.id > doc_id))
+        return db.and_(cle.is_(None), Document.id < doc_id)
+
+    position = db.tuple_(cle, Document.id)
+    if sens == 'desc':
+        condition = position < db.tuple_(valeur, doc_id)
+        return db.or_(condition, cle.is_(None)) if _nullable(cle) else condition
+    return position > db.tuple_(valeur, doc_id)
+
+def _order(cle, sens):
+    if sens == 'desc':
+        return cle.desc(), Document.id.desc()
+    return cle.asc(), Document.id.asc()
+
+def paginate_keyset(query, cle, sens, cursor=None, per_page=10, total=None):
+    """
+    Pagine `query` (sur Document) triée par (cle, id) sans OFFSET : chaque page
+    coûte une recherche d'index quelle que soit sa profondeur.
+    """
+    position = decode_cursor(cursor)
+    inverse = {'asc': 'desc', 'desc': 'asc'}[sens]
+
+    query = query.add_columns(cle.label('_cle_tri'))
+    if position is not None:
+        valeur, doc_id, direction = position
+        if direction == 'next':
+            query = query.filter(_seek(cle, sens, valeur, doc_id)).order_by(*_order(cle, sens))
+        else:
+            query = query.filter(_seek(cle, inverse, valeur, doc_id)).order_by(*_order(cle, inverse))
+    else:
+        direction = 'next'
+        query = query.order_by(*_order(cle, sens))
+
+    lignes = query.limit(per_page + 1).all()
+    encore = len(lignes) > per_page
+    lignes = lignes[:per_page]
+    if direction == 'prev':
+        lignes.reverse()
+
+    items = [ligne[0] for ligne in lignes]
+    next_cursor = prev_cursor = None
+    if lignes:
+        premiere, derniere = lignes[0], lignes[-1]
+        if direction == 'next':
+            if encore:
+                next_cursor = encode_cursor(derniere[-1], derniere[0].id, 'next')
+            if position is not None:
+                prev_cursor = encode_cursor(premiere[-1], premiere[0].id, 'prev')
+        else:
+            next_cursor = encode_cursor(derniere[-1], derniere[0].id, 'next')
+            if encore:
+                prev_cursor = encode_cursor(premiere[-1], premiere[0].id, 'prev')
+
+    return KeysetPage(items, per_page, next_cursor, prev_cursor, total)
+
+# ==================== COMPTAGES APPROXIMATIFS ====================
+class CountCache:
+    """
+    Comptages des recherches mis en cache par signature de requête (les listes
+    par catégorie utilisent Categorie.document_count). Une entrée reste valable
+    jusqu'à une écriture sur les documents ou l'expiration du TTL ; le total
+    affiché peut donc être légèrement en retard (nombre de vues, extraction).
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, signature, query):
+        """Retourne le nombre de lignes de `query`, depuis le cache si possible"""
+        ttl = current_app.config.get('PAGINATION_COUNT_TTL', 300)
+        cle = (signature, documents_generation.current())
+        maintenant = time.monotonic()
+
+        with self._lock:
+            entree = self._entries.get(cle)
+            if entree is not None and entree[1] > maintenant:
+                self._entries.move_to_end(cle)
+                return entree[0]
+
+        total = query.order_by(None).count()
+        with self._lock:
+            self._entries[cle] = (total, maintenant + ttl)
+            self._entries.move_to_end(cle)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return total
+
+count_cache = CountCache()
@@ -0,0 +1,59 @@
+"""Construction des requêtes de recherche, partagée par les pages et l'API"""
+from models.models import db, Document
+from services.search_index import search_subquery
+from services.pagination import sort_key
+from services.normalisation import plier
+from datetime import datetime, timedelta
+
+FORMAT_DATE = '%Y-%m-%d'
+
+def parse_date(valeur):
+    """Date AAAA-MM-JJ ; None si absente, ValueError si invalide"""
+    if not valeur:
+        return None
+    return datetime.strptime(valeur, FORMAT_DATE)
+
+def date_conditions(date_debut=None, date_fin=None):
+    """Conditions sur la date d'ajout ; la date de fin est incluse (jusqu'à minuit)"""
+    conditions = []
+    if date_debut:
+        conditions.append(Document.date_ajout >= date_debut)
+    if date_fin:
+        conditions.append(Document.date_ajout < date_fin + timedelta(days=1))
+    return conditions
+
+def build_search(q=None, categorie_id=None, date_debut=None, date_fin=None, query=None, score=True):
+    """
+    Applique les critères de recherche à `query` (Document.query par défaut).
+    Retourne (requête, sous-requête plein texte ou None). score=False quand
+    seuls des comptages sont calculés (pas de tri par pertinence).
+    """
+    query = query if query is not None else Document.query
+    fts = None
+
+    # Terme de recherche (index plein texte, colonnes normalisées à défaut)
+    if q:
+        fts = search_subquery(q, score=score)
+        if fts is not None:
+            query = query.join(fts, fts.c.doc_id == Document.id)
+        else:
+            motif = f'%{plier(q)}%'
+            query = query.filter(
+                db.or_(
+                    Document.titre_normalise.like(motif),
+                    Document.description_normalisee.like(motif)
+                )
+            )
+
+    if categorie_id:
+        query = query.filter(Document.categorie_id == int(categorie_id))
+    for condition in date_conditions(date_debut, date_fin):
+        query = query.filter(condition)
+
+    return query, fts
+
+def search_order(sort_by, fts):
+    """Clé de tri : pertinence BM25 si l'index plein texte est utilisé"""
+    if sort_by == 'pertinence' and fts is not None:
+        return fts.c.score, 'asc'
+    return sort_key(sort_by)
@@ -0,0 +1,158 @@
+"""
+Recherche approchée : correction des fautes de frappe ('fertilisaton')
+par similarité de trigrammes avec les mots des titres et descriptions.
+
+Le vocabulaire (terme_recherche) et son index de trigrammes
+(terme_trigramme) sont alimentés à l'écriture des documents. Ils ne sont
+pas purgés : un terme qui n'apparaît plus dans aucun document ne trouve
+simplement rien, et `flask reindex` les reconstruit.
+
+La correction est calculée par SQLite dans la requête de recherche
+elle-même (voir search_index.search_subquery) : elle ne coûte rien tant
+que tous les mots recherchés sont connus.
+"""
+from flask import current_app
+from models.models import Document, TermeRecherche, TermeTrigramme
+from services.normalisation import MOT_RE, plier, trigrammes
+from sqlalchemy import bindparam, select
+import logging
+
+logger = logging.getLogger(__name__)
+
+LONGUEUR_MIN = 4        # Les mots plus courts ne sont jamais corrigés
+LONGUEUR_MAX = 100
+MAX_CORRECTIONS = 5     # Termes proches retenus par mot inconnu
+ECART_MAX = 0.1         # Écart de similarité toléré avec le terme le plus proche
+MAX_MOTS = 8            # Au-delà, pas de correction
+TAILLE_LOT = 2000
+
+# Ne trouve aucun document (un MATCH sur NULL est une erreur de syntaxe FTS5)
+AUCUN = '\'""\''
+
+def _termes(textes):
+    """Mots (déjà pliés) de `textes` qui ont leur place dans le vocabulaire"""
+    return {
+        mot for texte in textes if texte for mot in MOT_RE.findall(texte)
+        if LONGUEUR_MIN <= len(mot) <= LONGUEUR_MAX and not mot.isdigit()
+    }
+
+def _inserer(connection, termes):
+    if not termes:
+        return
+    connection.execute(
+        TermeRecherche.__table__.insert().prefix_with('OR IGNORE', dialect='sqlite'),
+        [{'terme': terme, 'nb_trigrammes': len(trigrammes(terme))} for terme in termes]
+    )
+    connection.execute(
+        TermeTrigramme.__table__.insert().prefix_with('OR IGNORE', dialect='sqlite'),
+        [{'trigramme': trigramme, 'terme': terme} for terme in termes for trigramme in trigrammes(terme)]
+    )
+
+def record_terms(connection, textes):
+    """Ajoute au vocabulaire les mots nouveaux de `textes` (titre et description pliés)"""
+    termes = _termes(textes)
+    if not termes:
+        return
+    table = TermeRecherche.__table__
+    connus = {terme for terme, in connection.execute(select(table.c.terme).where(table.c.terme.in_(termes)))}
+    _inserer(connection, sorted(termes - connus))
+
+def rebuild_terms(connection):
+    """
+    Recalcule les colonnes normalisées de tous les documents, puis le
+    vocabulaire et ses trigrammes. Retourne le nombre de termes.
+    """
+    document = Document.__table__
+    mise_a_jour = document.update().where(document.c.id == bindparam('b_id')).values(
+        titre_normalise=bindparam('b_titre'), description_normalisee=bindparam('b_description')
+    )
+    vocabulaire = set()
+    dernier = 0
+    while True:
+        lignes = connection.execute(
+            select(document.c.id, document.c.titre, document.c.description)
+            .where(document.c.id > dernier).order_by(document.c.id).limit(TAILLE_LOT)
+        ).all()
+        if not lignes:
+            break
+        valeurs = []
+        for doc_id, titre, description in lignes:
+            titre, description = plier(titre), plier(description) if description else None
+            valeurs.append({'b_id': doc_id, 'b_titre': titre, 'b_description': description})
+            vocabulaire.update(_termes((titre, description)))
+        connection.execute(mise_a_jour, valeurs)
+        dernier = lignes[-1][0]
+
+    connection.execute(TermeTrigramme.__table__.delete())
+    connection.execute(TermeRecherche.__table__.delete())
+    termes = sorted(vocabulaire)
+    for debut in range(0, len(termes), TAILLE_LOT):
+        _inserer(connection, termes[debut:debut + TAILLE_LOT])
+    logger.info(f"Vocabulaire de la recherche approchée reconstruit: {len(termes)} terme(s)")
+    return len(termes)
+
+# ==================== CORRECTION DES RECHERCHES ====================
+def _corrigeable(mot):
+    return LONGUEUR_MIN <= len(mot) <= LONGUEUR_MAX and not mot.isdigit()
+
+def _groupe(i, mot):
+    """
+    Sélection (inconnu, groupe) pour le i-ème mot : le préfixe tel quel si un
+    terme connu commence par ce mot, sinon ses termes les plus proches.
+    """
+    if not _corrigeable(mot):
+        return f"SELECT 0 AS inconnu, '\"' || :mot_{i} || '\"*' AS groupe", {f'mot_{i}': mot}, []
+
+    similarite = f"COUNT(*) * 1.0 / (:nb_{i} + t.nb_trigrammes - COUNT(*))"
+    proches = (
+        f"SELECT terme, similarite, MAX(similarite) OVER () AS meilleure FROM ("
+        f"SELECT t.terme AS terme, {similarite} AS similarite "
+        f"FROM terme_trigramme tt JOIN terme_recherche t ON t.terme = tt.terme "
+        f"WHERE tt.trigramme IN :trigrammes_{i} GROUP BY t.terme HAVING similarite >= :seuil)"
+    )
+    sql = (
+        f"SELECT NOT connu AS inconnu, CASE WHEN connu THEN '\"' || :mot_{i} || '\"*' ELSE ("
+        f"SELECT '(' || group_concat('\"' || terme || '\"', ' OR ') || ')' FROM ("
+        f"SELECT terme FROM ({proches}) WHERE similarite >= meilleure - :ecart "
+        f"ORDER BY similarite DESC, terme LIMIT :max_corrections)"
+        f") END AS groupe FROM (SELECT EXISTS ("
+        f"SELECT 1 FROM terme_recherche WHERE terme >= :mot_{i} AND terme < :fin_{i}) AS connu)"
+    )
+    valeurs = trigrammes(mot)
+    parametres = {f'mot_{i}': mot, f'fin_{i}': mot + '\U0010ffff',
+                  f'nb_{i}': len(valeurs), f'trigrammes_{i}': sorted(valeurs)}
+    return sql, parametres, [f'trigrammes_{i}']
+
+def correction(query):
+    """
+    Expression SQL de la requête FTS5 corrigée de `query` : (sql, paramètres,
+    noms des paramètres de liste), ou None si la correction est désactivée
+    ou qu'aucun mot ne peut être corrigé (mots trop courts, nombres).
+    L'expression vaut AUCUN quand tous les mots sont connus ou qu'un mot
+    inconnu n'a aucun terme assez proche.
+    """
+    if not current_app.config.get('RECHERCHE_APPROCHEE', True):
+        return None
+    mots = MOT_RE.findall(plier(query))
+    if not any(_corrigeable(mot) for mot in mots) or len(mots) > MAX_MOTS:
+        return None
+
+    selections = []
+    parametres = {
+        'seuil': current_app.config.get('RECHERCHE_APPROCHEE_SEUIL', 0.4),
+        'max_corrections': MAX_CORRECTIONS,
+        'ecart': ECART_MAX,
+    }
+    listes = []
+    for i, mot in enumerate(mots):
+        sql, valeurs, noms = _groupe(i, mot)
+        selections.append(sql)
+        parametres.update(valeurs)
+        listes.extend(noms)
+
+    sql = (
+        f"SELECT CASE WHEN SUM(inconnu) > 0 AND COUNT(groupe) = COUNT(*) "
+        f"THEN group_concat(groupe, ' AND ') ELSE {AUCUN} END "
+        f"FROM ({' UNION ALL '.join(selections)})"
+    )
+    return sql, parametres, listes
@@ -0,0 +1,239 @@
+"""Cache des pages publiques et des fragments de gabarit, invalidé par étiquettes"""
+from flask import current_app, request, session, render_template, g
+from markupsafe import Markup
+from services.cache import Generation, documents_generation, configuration_generation
+from collections import OrderedDict
+from functools import wraps
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Étiquette portée implicitement par toutes les pages (purge complète)
+TAG_PAGES = 'pages'
+
+_NOM_INVALIDE = re.compile(r'[^A-Za-z0-9_-]')
+
+# ==================== ÉTIQUETTES ====================
+# Chaque étiquette est une génération partagée entre workers ; les générations
+# existantes sont utilisables directement comme étiquettes
+_etiquettes = {
+    'documents': documents_generation,
+    'configuration': configuration_generation,
+}
+_etiquettes_lock = threading.Lock()
+
+def tag_generation(tag):
+    """Génération associée à une étiquette (ex. 'category:3')"""
+    with _etiquettes_lock:
+        generation = _etiquettes.get(tag)
+        if generation is None:
+            generation = Generation('tag-' + _NOM_INVALIDE.sub('-', tag))
+            _etiquettes[tag] = generation
+        return generation
+
+def purge(*tags):
+    """Invalide, dans tous les workers, les entrées portant l'une des étiquettes"""
+    for tag in set(tags):
+        tag_generation(tag).bump()
+
+def _jetons(tags):
+    return tuple(tag_generation(tag).current() for tag in tags)
+
+# ==================== STOCKAGE ====================
+class TaggedCache:
+    """
+    Cache LRU en mémoire dont chaque entrée mémorise les jetons de ses
+    étiquettes : elle est périmée dès que l'une d'elles a été purgée
+    (ou que le TTL est écoulé).
+    """
+
+    def __init__(self, prefixe_config):
+        self.prefixe_config = prefixe_config
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _config(self, nom, defaut):
+        return current_app.config.get(f'{self.prefixe_config}_{nom}', defaut)
+
+    def get(self, cle):
+        with self._lock:
+            entree = self._entries.get(cle)
+        if entree is not None:
+            valeur, tags, jetons, expiration = entree
+            if expiration > time.monotonic() and jetons == _jetons(tags):
+                with self._lock:
+                    if cle in self._entries:
+                        self._entries.move_to_end(cle)
+                    self.hits += 1
+                return valeur
+            # Entrée périmée : libère sa place sans attendre l'éviction
+            with self._lock:
+                if self._entries.get(cle) is entree:
+                    del self._entries[cle]
+                    self.expirations += 1
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, cle, valeur, tags, jetons):
+        expiration = time.monotonic() + self._config('TTL', 300)
+        with self._lock:
+            self._entries[cle] = (valeur, tags, jetons, expiration)
+            self._entries.move_to_end(cle)
+            while len(self._entries) > self._config('MAX_ENTRIES', 512):
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, cle, tags, calcul):
+        """
+        Valeur en cache, ou résultat de `calcul()` mémorisé sous les étiquettes
+        `tags` (jetons lus avant le calcul : une purge concurrente l'emporte)
+        """
+        valeur = self.get(cle)
+        if valeur is None:
+            jetons = _jetons(tags)
+            valeur = calcul()
+            self.set(cle, valeur, tags, jetons)
+        return valeur
+
+    def clear(self):
+        """Vide le cache local"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            demandes = self.hits + self.misses
+            return {'entrees': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'expirations': self.expirations,
+                    'taux_succes': round(self.hits / demandes, 4) if demandes else None}
+
+# ==================== PAGES ====================
+class ResponseCache(TaggedCache):
+    """
+    Cache des réponses GET, indexé par chemin, paramètres de requête et état
+    d'authentification. Les pages qui affichent un message flash ou modifient
+    la session ne sont jamais mises en cache.
+    """
+
+    def __init__(self):
+        super().__init__('RESPONSE_CACHE')
+
+    def _enabled(self):
+        return (self._config('ENABLED', True)
+                and request.method == 'GET'
+                and '_flashes' not in session)
+
+    @staticmethod
+    def _key():
+        auth = session.get('username') if session.get('is_admin') else None
+        return (request.path, tuple(sorted(request.args.items(multi=True))), auth)
+
+    @staticmethod
+    def _storable(response):
+        return (response.status_code == 200
+                and not response.direct_passthrough
+                and not session.modified
+                and 'Set-Cookie' not in response.headers)
+
+    def cached(self, tags=()):
+        """
+        Décorateur de vue. `tags` est une liste d'étiquettes ou une fonction
+        recevant les arguments de la vue et retournant cette liste.
+        """
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if not self._enabled():
+                    return f(*args, **kwargs)
+
+                cle = self._key()
+                entree = self.get(cle)
+                if entree is not None:
+                    status, headers, body = entree
+                    response = current_app.response_class(body, status=status, headers=headers)
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                etiquettes = (TAG_PAGES,) + tuple(tags(**kwargs) if callable(tags) else tags)
+                # Jetons lus avant le rendu : une purge concurrente l'emporte
+                jetons = _jetons(etiquettes)
+                response = current_app.make_response(f(*args, **kwargs))
+                # La page dépend aussi des fragments qu'elle contient
+                for tags_fragment, jetons_fragment in g.pop('fragments_rendus', ()):
+                    etiquettes += tags_fragment
+                    jetons += jetons_fragment
+                if self._storable(response):
+                    headers = [(k, v) for k, v in response.headers.items() if k != 'X-Cache']
+                    self.set(cle, (response.status_code, headers, response.get_data()), etiquettes, jetons)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+# ==================== FRAGMENTS ====================
+class FragmentCache(TaggedCache):
+    """
+    Fragments de gabarit communs à tous les visiteurs (navigation, annonce),
+    rendus une fois puis réutilisés par toutes les pages.
+    """
+
+    def __init__(self):
+        super().__init__('FRAGMENT_CACHE')
+
+    def render(self, template, *tags):
+        """Rend `template` ou le sert depuis le cache (à appeler depuis un gabarit)"""
+        tags = tuple(tags)
+        entree = self.get(template)
+        if entree is not None:
+            fragment, jetons = entree
+        else:
+            jetons = _jetons(tags)
+            fragment = Markup(render_template(template))
+            self.set(template, (fragment, jetons), tags, jetons)
+        # Transmis à la page en cours de mise en cache (ResponseCache.cached)
+        g.setdefault('fragments_rendus', []).append((tags, jetons))
+        return fragment
+
+    def init_app(self, app):
+        app.add_template_global(self.render, 'cached_fragment')
+
+response_cache = ResponseCache()
+fragment_cache = FragmentCache()
+
+# ==================== STATISTIQUES ====================
+_caches = {}
+
+def register_cache(nom, cache):
+    """Ajoute un TaggedCache aux métriques (label cache=nom) et aux statistiques"""
+    _caches[nom] = cache
+
+def caches_stats():
+    """{nom: statistiques} des caches enregistrés (processus courant)"""
+    return {nom: cache.stats() for nom, cache in _caches.items()}
+
+def init_app(app):
+    """Enregistre les caches de pages et de fragments"""
+    fragment_cache.init_app(app)
+    app.extensions['response_cache'] = response_cache
+    register_cache('pages', response_cache)
+    register_cache('fragments', fragment_cache)
+
+    from services.metriques import metriques
+    for cle, aide, type in (('hits', "Réponses servies depuis le cache", 'counter'),
+                            ('misses', "Réponses absentes du cache", 'counter'),
+                            ('evictions', "Entrées évincées pour respecter la taille maximale", 'counter'),
+                            ('expirations', "Entrées trouvées périmées (TTL ou purge)", 'counter'),
+                            ('entrees', "Entrées présentes dans le cache", 'gauge')):
+        metriques.register_gauge(
+            f'cache_{cle}' + ('_total' if type == 'counter' else ''), aide,
+            lambda cle=cle: {nom: stats[cle] for nom, stats in caches_stats().items()},
+            label='cache', type=type
+        )
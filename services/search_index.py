@@ -0,0 +1,171 @@
+"""Index plein texte des documents (SQLite FTS5, classement BM25)"""
+from flask import current_app
+from models.models import db
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import OperationalError
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'document_fts'
+
+# Poids BM25 des colonnes indexées : titre, description, contenu extrait
+BM25_POIDS = (10.0, 5.0, 1.0)
+
+def is_available():
+    """Indique si l'index FTS5 a pu être créé sur la base courante"""
+    return current_app.extensions.get('search_index', False)
+
+def ensure_index():
+    """Crée l'index FTS5 s'il n'existe pas et le remplit à partir des documents existants"""
+    available = False
+    try:
+        if db.engine.dialect.name == 'sqlite':
+            existe = db.session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :nom"),
+                {'nom': FTS_TABLE}
+            ).first()
+
+            db.session.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                "USING fts5(titre, description, contenu, tokenize = 'unicode61 remove_diacritics 2')"
+            ))
+            if not existe:
+                _fill_from_documents()
+            db.session.commit()
+            available = True
+        else:
+            logger.warning("Index plein texte indisponible: base non SQLite, recherche par ILIKE")
+    except OperationalError as e:
+        db.session.rollback()
+        logger.warning(f"Index plein texte indisponible (FTS5 non supporté ?): {str(e)}")
+
+    current_app.extensions['search_index'] = available
+    return available
+
+def _fill_from_documents():
+    """Copie titre et description de tous les documents dans l'index"""
+    db.session.execute(text(
+        f"INSERT INTO {FTS_TABLE} (rowid, titre, description, contenu) "
+        "SELECT id, titre, COALESCE(description, ''), '' FROM document"
+    ))
+
+def rebuild_index():
+    """Reconstruit entièrement l'index (le contenu extrait est conservé)"""
+    if not is_available():
+        return 0
+
+    contenus = dict(db.session.execute(
+        text(f"SELECT rowid, contenu FROM {FTS_TABLE} WHERE contenu != ''")
+    ).all())
+    db.session.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    _fill_from_documents()
+    for doc_id, contenu in contenus.items():
+        db.session.execute(
+            text(f"UPDATE {FTS_TABLE} SET contenu = :contenu WHERE rowid = :id"),
+            {'id': doc_id, 'contenu': contenu}
+        )
+    db.session.commit()
+
+    total = db.session.execute(text(f"SELECT COUNT(*) FROM {FTS_TABLE}")).scalar()
+    logger.info(f"Index plein texte reconstruit: {total} document(s)")
+    return total
+
+def index_document(doc, contenu=None):
+    """
+    Indexe (ou réindexe) un document dans la transaction courante.
+    Si contenu est None, le texte extrait déjà indexé est conservé.
+    """
+    if not is_available():
+        return
+
+    if doc.id is None:
+        db.session.flush()
+
+    if contenu is None:
+        contenu = db.session.execute(
+            text(f"SELECT contenu FROM {FTS_TABLE} WHERE rowid = :id"),
+            {'id': doc.id}
+        ).scalar() or ''
+
+    remove_document(doc.id)
+    db.session.execute(
+        text(f"INSERT INTO {FTS_TABLE} (rowid, titre, description, contenu) "
+             "VALUES (:id, :titre, :description, :contenu)"),
+        {'id': doc.id, 'titre': doc.titre, 'description': doc.description or '', 'contenu': contenu}
+    )
+
+def index_new_documents(docs):
+    """
+    Indexe en une seule instruction des documents qui viennent d'être créés
+    (déjà insérés, sans texte extrait), par exemple lors d'un import en masse.
+    """
+    if not is_available() or not docs:
+        return
+    db.session.execute(
+        text(f"INSERT INTO {FTS_TABLE} (rowid, titre, description, contenu) "
+             "VALUES (:id, :titre, :description, '')"),
+        [{'id': doc.id, 'titre': doc.titre, 'description': doc.description or ''} for doc in docs]
+    )
+
+def remove_document(doc_id):
+    """Retire un document de l'index dans la transaction courante"""
+    if not is_available():
+        return
+    db.session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {'id': doc_id})
+
+def build_match_query(query):
+    """
+    Transforme la saisie utilisateur en requête FTS5 : chaque mot devient
+    un préfixe entre guillemets, les mots étant combinés par un ET implicite.
+    """
+    mots = re.findall(r'\w+', query, re.UNICODE)
+    if not mots:
+        return None
+    return ' '.join(f'"{mot}"*' for mot in mots)
+
+def search_subquery(query, score=True):
+    """
+    Retourne une sous-requête (doc_id, score) des documents correspondant à la
+    recherche, ou None si l'index n'est pas utilisable. Un score BM25 plus
+    petit signifie un document plus pertinent. Avec score=False (comptages),
+    la sous-requête n'a que doc_id : le calcul de bm25 est évité.
+
+    Si un mot recherché n'apparaît dans aucun titre ni description, la même
+    requête SQL ajoute les documents trouvés avec ses termes les plus proches
+    (services/recherche_approchee.py), classés après les résultats exacts :
+    leur score, 1 / (1 - bm25), est positif alors que bm25 est négatif.
+    """
+    if not is_available():
+        return None
+
+    match = build_match_query(query)
+    if match is None:
+        return None
+
+    from services.recherche_approchee import correction
+
+    poids = ', '.join(str(p) for p in BM25_POIDS)
+    colonnes = [db.column('doc_id', db.Integer)]
+    score_exact = score_approche = ''
+    if score:
+        colonnes.append(db.column('score', db.Float))
+        score_exact = f", bm25({FTS_TABLE}, {poids}) AS score"
+        score_approche = f", 1.0 / (1.0 - bm25({FTS_TABLE}, {poids})) AS score"
+    sql = f"SELECT rowid AS doc_id{score_exact} FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match"
+    parametres = {'match': match}
+    listes = []
+    corrigee = correction(query)
+    if corrigee is not None:
+        sql_correction, valeurs, listes = corrigee
+        sql += (
+            f" UNION ALL SELECT rowid AS doc_id{score_approche} "
+            f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ({sql_correction}) "
+            f"AND rowid NOT IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match)"
+        )
+        parametres.update(valeurs)
+
+    return text(sql).bindparams(
+        *(bindparam(nom, expanding=True) for nom in listes), **parametres
+    ).columns(*colonnes).subquery('fts')
@@ -0,0 +1,532 @@
+"""
+Documents similaires : vecteurs TF-IDF creux (titre, description, texte
+extrait) et voisins précalculés dans la table document_similaire. La page
+d'un document ne fait qu'une lecture de cette table.
+"""
+from models.models import db, Document, DocumentTexte, DocumentSimilaire
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from contextlib import contextmanager
+import json
+import logging
+import math
+import os
+import re
+import threading
+import unicodedata
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # Dépendances optionnelles : repli sur la même catégorie
+    np = None
+    sparse = None
+
+try:
+    import fcntl
+except ImportError:  # Windows : verrou limité au processus courant
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Poids de chaque champ dans le vecteur (répétition des termes)
+POIDS_TITRE = 3
+POIDS_DESCRIPTION = 2
+POIDS_CONTENU = 1
+TAILLE_MAX_CONTENU = 200000  # Caractères du texte extrait pris en compte
+TAILLE_BLOC = 256  # Lignes traitées à la fois lors d'une reconstruction
+JOURNAL = 'journal.jsonl'  # Mises à jour postérieures à la dernière écriture de l'index
+
+MOT_RE = re.compile(r'[a-z0-9]{3,}')
+MOTS_VIDES = frozenset("""
+    les des une est son sur aux par pour dans avec que qui pas plus sont ont
+    ses ces cette cet elle ils nous vous leur leurs mais donc car comme tout
+    tous toute toutes fait faire peut entre sans sous chez etre avoir aussi
+    ainsi alors apres avant tres bien meme lors dont cela ceci celle celui
+    the and for with from that this are was were been has have not
+""".split())
+
+def is_available():
+    """Indique si NumPy et SciPy sont installés"""
+    return np is not None
+
+def tokenize(texte):
+    """Mots normalisés (minuscules, sans accents, sans mots vides)"""
+    if not texte:
+        return []
+    texte = unicodedata.normalize('NFKD', texte.lower())
+    texte = ''.join(c for c in texte if not unicodedata.combining(c))
+    return [mot for mot in MOT_RE.findall(texte) if mot not in MOTS_VIDES]
+
+def term_counts(titre, description, contenu):
+    """Fréquences pondérées des termes d'un document"""
+    compteur = Counter()
+    for texte, poids in ((titre, POIDS_TITRE), (description, POIDS_DESCRIPTION), (contenu, POIDS_CONTENU)):
+        for mot in tokenize(texte):
+            compteur[mot] += poids
+    return compteur
+
+def _textes_query():
+    """(id, titre, description, début du texte extrait) de chaque document"""
+    return db.session.query(
+        Document.id, Document.titre, Document.description,
+        db.func.substr(DocumentTexte.contenu, 1, TAILLE_MAX_CONTENU)
+    ).outerjoin(DocumentTexte, DocumentTexte.document_id == Document.id)
+
+# ==================== INDEX VECTORIEL ====================
+class VectorIndex:
+    """
+    Matrice creuse documents × termes (tf sous-linéaire), son vocabulaire,
+    les fréquences documentaires des termes et, par ligne, le seuil d'entrée
+    dans la liste de voisins (score du K-ième voisin, 0 si la liste est
+    incomplète). Ajouter ou retirer un document ne touche que sa ligne et
+    les fréquences de ses termes : une ligne retirée est mise à zéro et
+    n'est éliminée qu'à l'écriture de l'index. La pondération IDF et les
+    normes sont recalculées à la volée, sans copie pondérée de la matrice.
+    """
+
+    def __init__(self, ids=None, vocabulaire=None, matrice=None, seuils=None):
+        self.ids = list(ids or [])
+        self.vocabulaire = dict(vocabulaire or {})
+        if matrice is None:
+            matrice = sparse.csr_matrix((len(self.ids), len(self.vocabulaire)), dtype=np.float32)
+        self.matrice = matrice.tocsr()
+        self.seuils = None if seuils is None else np.asarray(seuils, dtype=np.float32)
+        self._positions = {doc_id: i for i, doc_id in enumerate(self.ids) if doc_id is not None}
+        actifs = self.matrice.indices[self.matrice.data != 0]
+        self.df = np.bincount(actifs, minlength=self.matrice.shape[1]).astype(np.int64)
+        self._normes = None
+
+    @classmethod
+    def build(cls, documents):
+        """Construit l'index depuis des couples (id, compteur de termes)"""
+        ids, vocabulaire = [], {}
+        lignes, colonnes, valeurs = [], [], []
+        for i, (doc_id, compteur) in enumerate(documents):
+            ids.append(doc_id)
+            for mot, n in compteur.items():
+                lignes.append(i)
+                colonnes.append(vocabulaire.setdefault(mot, len(vocabulaire)))
+                valeurs.append(1.0 + math.log(n))
+        matrice = sparse.csr_matrix(
+            (np.asarray(valeurs, dtype=np.float32), (lignes, colonnes)),
+            shape=(len(ids), len(vocabulaire))
+        )
+        return cls(ids, vocabulaire, matrice, np.zeros(len(ids), dtype=np.float32))
+
+    def position(self, doc_id):
+        return self._positions.get(doc_id)
+
+    def idf(self):
+        n = len(self._positions)
+        return (np.log((1.0 + n) / (1.0 + self.df)) + 1.0).astype(np.float32)
+
+    def normes(self):
+        """Normes TF-IDF des lignes, recalculées après chaque modification"""
+        if self._normes is None:
+            idf = self.idf()
+            normes = np.sqrt(np.asarray(self.matrice.power(2) @ (idf * idf)).ravel()).astype(np.float32)
+            normes[normes == 0] = 1.0
+            self._normes = normes
+        return self._normes
+
+    def _row(self, compteur):
+        colonnes, valeurs = [], []
+        for mot, n in compteur.items():
+            colonne = self.vocabulaire.get(mot)
+            if colonne is None:
+                colonne = self.vocabulaire[mot] = len(self.vocabulaire)
+            colonnes.append(colonne)
+            valeurs.append(1.0 + math.log(n))
+        self.matrice.resize((self.matrice.shape[0], len(self.vocabulaire)))
+        if len(self.df) < len(self.vocabulaire):
+            self.df = np.concatenate([self.df, np.zeros(len(self.vocabulaire) - len(self.df), dtype=np.int64)])
+        return sparse.csr_matrix(
+            (np.asarray(valeurs, dtype=np.float32), ([0] * len(colonnes), colonnes)),
+            shape=(1, len(self.vocabulaire))
+        )
+
+    def upsert(self, doc_id, compteur):
+        """Ajoute ou remplace la ligne d'un document ; retourne sa position"""
+        self.remove(doc_id)
+        ligne = self._row(compteur)
+        self.matrice = sparse.vstack([self.matrice, ligne], format='csr')
+        self.df[ligne.indices] += 1
+        self.ids.append(doc_id)
+        self._positions[doc_id] = len(self.ids) - 1
+        self._normes = None
+        self.seuils = np.append(self.seuils, np.float32(0.0))
+        return len(self.ids) - 1
+
+    def remove(self, doc_id):
+        """Met à zéro la ligne d'un document (les colonnes restent)"""
+        i = self._positions.pop(doc_id, None)
+        if i is None:
+            return False
+        debut, fin = self.matrice.indptr[i], self.matrice.indptr[i + 1]
+        self.df[self.matrice.indices[debut:fin]] -= 1
+        self.matrice.data[debut:fin] = 0.0
+        self.ids[i] = None
+        self.seuils[i] = np.inf
+        self._normes = None
+        return True
+
+    def scores(self, positions):
+        """
+        Similarités cosinus des lignes `positions` avec toutes les lignes
+        (tableau len(positions) × N), sans pondérer toute la matrice
+        """
+        idf = self.idf()
+        normes = self.normes()
+        requetes = self.matrice[positions] @ sparse.diags(idf * idf)
+        produits = (self.matrice @ requetes.T).toarray().T
+        produits /= normes
+        produits /= normes[positions][:, None]
+        return produits
+
+    def apply(self, entree):
+        """Rejoue une entrée du journal : {'suppressions', 'ajouts', 'seuils'}"""
+        for doc_id in entree.get('suppressions', []):
+            self.remove(doc_id)
+        for doc_id, compteur in entree.get('ajouts', {}).items():
+            self.upsert(int(doc_id), compteur)
+        for doc_id, seuil in entree.get('seuils', {}).items():
+            i = self._positions.get(int(doc_id))
+            if i is not None:
+                self.seuils[i] = seuil
+
+    def compact(self):
+        """Copie sans les lignes retirées"""
+        garder = np.array([doc_id is not None for doc_id in self.ids], dtype=bool)
+        return VectorIndex([d for d in self.ids if d is not None], self.vocabulaire,
+                           self.matrice[garder], self.seuils[garder])
+
+    # ---------- Persistance ----------
+    def save(self, dossier):
+        """Écrit l'index (compacté) de manière atomique : matrice, seuils puis métadonnées"""
+        os.makedirs(dossier, exist_ok=True)
+        matrice_tmp = os.path.join(dossier, f'matrice.{os.getpid()}.tmp.npz')
+        seuils_tmp = os.path.join(dossier, f'seuils.{os.getpid()}.tmp.npy')
+        meta_tmp = os.path.join(dossier, f'index.{os.getpid()}.tmp.json')
+        sparse.save_npz(matrice_tmp, self.matrice)
+        np.save(seuils_tmp, self.seuils)
+        vocabulaire = sorted(self.vocabulaire, key=self.vocabulaire.get)
+        with open(meta_tmp, 'w') as f:
+            json.dump({'ids': self.ids, 'vocabulaire': vocabulaire}, f)
+        os.replace(matrice_tmp, os.path.join(dossier, 'matrice.npz'))
+        os.replace(seuils_tmp, os.path.join(dossier, 'seuils.npy'))
+        os.replace(meta_tmp, os.path.join(dossier, 'index.json'))
+
+    @classmethod
+    def load(cls, dossier):
+        """
+        Relit l'index ; None s'il n'existe pas ou est incohérent. Les seuils
+        valent None si l'index a été écrit sans eux.
+        """
+        try:
+            with open(os.path.join(dossier, 'index.json')) as f:
+                meta = json.load(f)
+            matrice = sparse.load_npz(os.path.join(dossier, 'matrice.npz'))
+        except (OSError, ValueError):
+            return None
+        vocabulaire = {mot: i for i, mot in enumerate(meta['vocabulaire'])}
+        if matrice.shape != (len(meta['ids']), len(vocabulaire)):
+            logger.warning("Index de similarité incohérent, reconstruction nécessaire (flask build-similarities)")
+            return None
+        try:
+            seuils = np.load(os.path.join(dossier, 'seuils.npy'))
+        except (OSError, ValueError):
+            seuils = None
+        if seuils is not None and seuils.shape != (len(meta['ids']),):
+            seuils = None
+        return cls(meta['ids'], vocabulaire, matrice, seuils)
+
+# ==================== MOTEUR ====================
+class SimilarityEngine:
+    """
+    Calcule les K plus proches voisins de chaque document. La reconstruction
+    complète se fait hors ligne (flask build-similarities) ; les ajouts,
+    modifications et suppressions sont appliqués en arrière-plan, un à la fois.
+
+    L'index reste en mémoire entre deux mises à jour. Chacune ajoute une
+    ligne au journal du dossier de l'index, que les autres processus
+    rejouent ; au-delà de SIMILARITE_JOURNAL_MAX entrées, l'index est
+    réécrit et le journal vidé.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.executor = None
+        self._lock = threading.Lock()
+        self._index = None
+        self._signature = None
+        self._position_journal = 0
+        self._entrees_journal = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure le moteur et son worker de mise à jour"""
+        self.app = app
+        self.k = app.config.get('SIMILARITE_K', 10)
+        self.journal_max = app.config.get('SIMILARITE_JOURNAL_MAX', 200)
+        self.dossier = app.config.get('SIMILARITE_DOSSIER') or os.path.join(app.instance_path, 'similarite')
+        if is_available():
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='similarite')
+        else:
+            logger.warning("NumPy/SciPy absents : documents similaires limités à la même catégorie")
+        app.extensions['similarity_engine'] = self
+
+    @contextmanager
+    def _verrou(self):
+        """Sérialise les mises à jour de l'index (threads et workers)"""
+        with self._lock:
+            os.makedirs(self.dossier, exist_ok=True)
+            with open(os.path.join(self.dossier, '.verrou'), 'w') as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                yield
+
+    def _top_k(self, scores, index, exclu):
+        """[(id, score)] des K meilleurs scores positifs, hors `exclu`"""
+        scores = np.asarray(scores).ravel().copy()
+        scores[exclu] = 0.0
+        k = min(self.k, len(scores))
+        if k == 0:
+            return []
+        candidats = np.argpartition(-scores, k - 1)[:k]
+        candidats = candidats[np.argsort(-scores[candidats], kind='stable')]
+        return [(index.ids[j], float(scores[j])) for j in candidats if scores[j] > 0]
+
+    def _write(self, voisins):
+        """Remplace les voisins des documents donnés ({id: [(id, score)]})"""
+        if not voisins:
+            return
+        table = DocumentSimilaire.__table__
+        db.session.execute(table.delete().where(table.c.document_id.in_(list(voisins))))
+        lignes = [
+            {'document_id': doc_id, 'similaire_id': similaire_id, 'rang': rang, 'score': score}
+            for doc_id, liste in voisins.items()
+            for rang, (similaire_id, score) in enumerate(liste)
+        ]
+        if lignes:
+            db.session.execute(table.insert(), lignes)
+
+    def _set_seuils(self, index, voisins):
+        """Met à jour les seuils des listes `voisins` ; retourne {id: seuil} pour le journal"""
+        seuils = {}
+        for doc_id, liste in voisins.items():
+            i = index.position(doc_id)
+            if i is not None:
+                index.seuils[i] = seuils[doc_id] = liste[-1][1] if len(liste) >= self.k else 0.0
+        return seuils
+
+    # ---------- Index en mémoire et journal ----------
+    def _fichier(self, nom):
+        return os.path.join(self.dossier, nom)
+
+    def _signature_index(self):
+        """Identifie la version écrite de l'index (remplacée à chaque save())"""
+        try:
+            infos = os.stat(self._fichier('index.json'))
+            return infos.st_ino, infos.st_mtime_ns, infos.st_size
+        except OSError:
+            return None
+
+    def _seuils_depuis_la_base(self, index):
+        """Seuils d'un index écrit sans eux, d'après les listes enregistrées"""
+        seuils = np.zeros(len(index.ids), dtype=np.float32)
+        for doc_id, n, minimum in db.session.query(
+            DocumentSimilaire.document_id, db.func.count(), db.func.min(DocumentSimilaire.score)
+        ).group_by(DocumentSimilaire.document_id):
+            i = index.position(doc_id)
+            if i is not None and n >= self.k:
+                seuils[i] = minimum
+        return seuils
+
+    def _index_courant(self):
+        """
+        Index à jour, sous le verrou : relu seulement si un autre processus a
+        réécrit l'index, puis complété par les entrées du journal qu'il n'a
+        pas encore vues.
+        """
+        signature = self._signature_index()
+        if self._index is None or signature != self._signature:
+            index = VectorIndex.load(self.dossier) or VectorIndex()
+            if index.seuils is None:
+                index.seuils = self._seuils_depuis_la_base(index)
+            self._index, self._signature = index, signature
+            self._position_journal = self._entrees_journal = 0
+
+        try:
+            with open(self._fichier(JOURNAL), 'rb') as f:
+                f.seek(self._position_journal)
+                for ligne in f:
+                    if not ligne.endswith(b'\n'):
+                        break  # Écriture interrompue
+                    self._index.apply(json.loads(ligne))
+                    self._position_journal += len(ligne)
+                    self._entrees_journal += 1
+        except FileNotFoundError:
+            pass
+        return self._index
+
+    def _journaliser(self, entree):
+        """Ajoute une entrée au journal ; réécrit l'index quand le journal est long"""
+        with open(self._fichier(JOURNAL), 'ab') as f:
+            f.write((json.dumps(entree) + '\n').encode('utf-8'))
+            self._position_journal = f.tell()
+        self._entrees_journal += 1
+        if self._entrees_journal >= self.journal_max:
+            self._save(self._index.compact())
+
+    def _save(self, index):
+        """Écrit l'index complet et vide le journal"""
+        index.save(self.dossier)
+        try:
+            os.remove(self._fichier(JOURNAL))
+        except FileNotFoundError:
+            pass
+        self._index, self._signature = index, self._signature_index()
+        self._position_journal = self._entrees_journal = 0
+
+    # ---------- Reconstruction complète ----------
+    def rebuild(self):
+        """Recalcule l'index et tous les voisins ; retourne le nombre de documents"""
+        if not is_available():
+            raise RuntimeError("NumPy et SciPy sont nécessaires pour calculer les similarités")
+
+        with self._verrou():
+            documents = (
+                (doc_id, term_counts(titre, description, contenu))
+                for doc_id, titre, description, contenu in _textes_query().yield_per(500)
+            )
+            index = VectorIndex.build(documents)
+
+            db.session.execute(DocumentSimilaire.__table__.delete())
+            for debut in range(0, len(index.ids), TAILLE_BLOC):
+                bloc = list(range(debut, min(debut + TAILLE_BLOC, len(index.ids))))
+                voisins = {
+                    index.ids[i]: self._top_k(scores, index, i)
+                    for i, scores in zip(bloc, index.scores(bloc))
+                }
+                self._write(voisins)
+                self._set_seuils(index, voisins)
+            db.session.commit()
+            self._save(index)
+
+        logger.info(f"Similarités recalculées pour {len(index.ids)} documents")
+        return len(index.ids)
+
+    # ---------- Mises à jour incrémentales ----------
+    def submit_update(self, doc_ids):
+        """Planifie le recalcul des voisins après ajout ou modification"""
+        if self.executor is not None:
+            for doc_id in doc_ids:
+                self.executor.submit(self._run, self.update_document, doc_id)
+
+    def submit_removal(self, doc_ids):
+        """Planifie le retrait de documents supprimés"""
+        if self.executor is not None and doc_ids:
+            self.executor.submit(self._run, self.remove_documents, list(doc_ids))
+
+    def _run(self, fonction, argument):
+        with self.app.app_context():
+            try:
+                fonction(argument)
+            except Exception as e:
+                db.session.rollback()
+                # L'index en mémoire a pu être modifié sans être journalisé
+                self._index = None
+                logger.error(f"Erreur lors de la mise à jour des similarités: {str(e)}")
+
+    def _refresh(self, index, doc_ids, voisins):
+        """Recalcule la liste des documents `doc_ids` et l'ajoute à `voisins`"""
+        positions = [index.position(d) for d in doc_ids if d not in voisins and index.position(d) is not None]
+        for debut in range(0, len(positions), TAILLE_BLOC):
+            bloc = positions[debut:debut + TAILLE_BLOC]
+            for i, scores in zip(bloc, index.scores(bloc)):
+                voisins[index.ids[i]] = self._top_k(scores, index, i)
+
+    def update_document(self, doc_id):
+        """Ajoute ou met à jour un document et les listes qu'il modifie"""
+        ligne = _textes_query().filter(Document.id == doc_id).first()
+        if ligne is None:
+            return self.remove_documents([doc_id])
+        compteur = term_counts(*ligne[1:])
+
+        with self._verrou():
+            index = self._index_courant()
+            i = index.upsert(doc_id, compteur)
+            scores = index.scores([i])[0]
+            voisins = {doc_id: self._top_k(scores, index, i)}
+
+            # Documents dont le K-ième voisin est battu par le nouveau venu,
+            # ou qui le comptaient déjà parmi leurs voisins
+            affectes = {
+                d for d, in db.session.query(DocumentSimilaire.document_id)
+                .filter(DocumentSimilaire.similaire_id == doc_id)
+            }
+            affectes.update(index.ids[j] for j in np.nonzero(scores > index.seuils)[0] if j != i)
+
+            self._refresh(index, affectes, voisins)
+            self._write(voisins)
+            db.session.commit()
+            seuils = self._set_seuils(index, voisins)
+            self._journaliser({'ajouts': {doc_id: compteur}, 'seuils': seuils})
+
+        logger.info(f"Similarités mises à jour pour le document {doc_id} ({len(voisins) - 1} liste(s) modifiée(s))")
+
+    def remove_documents(self, doc_ids):
+        """Retire des documents supprimés et complète les listes qui les contenaient"""
+        with self._verrou():
+            index = self._index_courant()
+            for doc_id in doc_ids:
+                index.remove(doc_id)
+
+            affectes = {
+                d for d, in db.session.query(DocumentSimilaire.document_id)
+                .filter(DocumentSimilaire.similaire_id.in_(doc_ids))
+            }
+            table = DocumentSimilaire.__table__
+            db.session.execute(table.delete().where(
+                table.c.document_id.in_(doc_ids) | table.c.similaire_id.in_(doc_ids)
+            ))
+
+            voisins = {}
+            if affectes:
+                self._refresh(index, affectes - set(doc_ids), voisins)
+            self._write(voisins)
+            db.session.commit()
+            seuils = self._set_seuils(index, voisins)
+            self._journaliser({'suppressions': list(doc_ids), 'seuils': seuils})
+
+    def reset(self):
+        """Oublie l'index (après une réinitialisation de la base)"""
+        with self._lock:
+            for nom in ('index.json', 'matrice.npz', 'seuils.npy', JOURNAL):
+                try:
+                    os.remove(self._fichier(nom))
+                except OSError:
+                    pass
+            self._index = None
+
+similarity_engine = SimilarityEngine()
+
+def documents_similaires(document, limit=5):
+    """
+    Voisins précalculés d'un document ; à défaut (index pas encore calculé,
+    NumPy absent), les documents les plus récents de la même catégorie.
+    """
+    similaires = Document.query.join(
+        DocumentSimilaire, DocumentSimilaire.similaire_id == Document.id
+    ).filter(
+        DocumentSimilaire.document_id == document.id
+    ).order_by(DocumentSimilaire.rang.asc()).limit(limit).all()
+    if similaires:
+        return similaires
+
+    return Document.query.filter(
+        Document.categorie_id == document.categorie_id,
+        Document.id != document.id
+    ).order_by(Document.date_ajout.desc()).limit(limit).all()
@@ -0,0 +1,75 @@
+"""Statistiques du tableau de bord : un instantané calculé en un aller-retour et mis en cache"""
+from flask import current_app
+from models.models import db, Document, Categorie, User
+from services.cache import CachedValue, documents_generation, utilisateurs_generation
+from datetime import datetime, timedelta
+from sqlalchemy import func
+import logging
+
+logger = logging.getLogger(__name__)
+
+NB_TOP_DOCUMENTS = 5
+
+def _compte(modele, *conditions):
+    """Sous-requête scalaire COUNT(*) sur un modèle"""
+    return db.select(func.count()).select_from(modele).where(*conditions).scalar_subquery()
+
+def _load_snapshot():
+    """Calcule tous les agrégats du tableau de bord en une seule requête"""
+    date_limite = datetime.utcnow() - timedelta(days=7)
+    agregats = db.session.execute(db.select(
+        _compte(Document).label('total_documents'),
+        _compte(Categorie).label('total_categories'),
+        _compte(User).label('total_users'),
+        _compte(Document, Document.date_ajout >= date_limite).label('documents_recents'),
+    )).one()
+
+    # Lignes légères : aucun objet ORM n'est conservé entre les requêtes
+    top = db.session.execute(
+        db.select(Document.id, Document.titre, Document.nombre_vues)
+        .order_by(Document.nombre_vues.desc(), Document.id.desc())
+        .limit(NB_TOP_DOCUMENTS)
+    ).all()
+
+    snapshot = dict(agregats._mapping)
+    snapshot['top_documents'] = [
+        {'id': d.id, 'titre': d.titre, 'nombre_vues': d.nombre_vues or 0} for d in top
+    ]
+    snapshot['date_calcul'] = datetime.utcnow()
+    return snapshot
+
+class DashboardStats:
+    """
+    Instantané des statistiques, recalculé après une écriture sur les documents
+    ou les utilisateurs, et au plus toutes les STATS_TTL secondes (vues, fenêtre
+    des 7 derniers jours).
+    """
+
+    def __init__(self):
+        self._cache = None
+
+    def init_app(self, app):
+        self._cache = CachedValue(
+            _load_snapshot,
+            generations=(documents_generation, utilisateurs_generation),
+            ttl=app.config.get('STATS_TTL', 30)
+        )
+        app.extensions['dashboard_stats'] = self
+
+    def snapshot(self):
+        """Retourne le dictionnaire des statistiques (ne pas le modifier)"""
+        if self._cache is None:
+            self.init_app(current_app)
+        return self._cache.get()
+
+    def to_json(self):
+        """Instantané sérialisable pour l'endpoint de suivi"""
+        snapshot = dict(self.snapshot())
+        snapshot['date_calcul'] = snapshot['date_calcul'].isoformat()
+        return snapshot
+
+    def clear(self):
+        if self._cache is not None:
+            self._cache.clear()
+
+dashboard_stats = DashboardStats()
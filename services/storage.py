@@ -0,0 +1,224 @@
+"""Stockage des fichiers uploadés adressé par contenu (SHA-256) avec déduplication"""
+from flask import current_app
+from models.models import db, Blob, Fichier
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename
+import hashlib
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+TAILLE_BLOC = 1024 * 1024  # Lecture/écriture par blocs de 1 Mo
+
+def _upload_folder():
+    return current_app.config['UPLOAD_FOLDER']
+
+def blob_path(sha256):
+    """Chemin du blob sur le disque (uploads/blobs/ab/cd/abcd...)"""
+    return os.path.join(_upload_folder(), 'blobs', sha256[:2], sha256[2:4], sha256)
+
+def temp_path():
+    """Chemin d'un fichier temporaire sur le même disque que les blobs"""
+    dossier = os.path.join(_upload_folder(), '.tmp')
+    os.makedirs(dossier, exist_ok=True)
+    return os.path.join(dossier, uuid.uuid4().hex)
+
+def _legacy_path(nom):
+    """Chemin d'un fichier enregistré avant le stockage par contenu"""
+    return safe_join(_upload_folder(), nom)
+
+def file_path(nom):
+    """Chemin sur le disque du fichier public `nom` (blob ou fichier historique)"""
+    fichier = db.session.get(Fichier, nom)
+    if fichier is not None:
+        return blob_path(fichier.blob_sha256)
+    return _legacy_path(nom)
+
+def path_for(nom, sha256):
+    """Chemin du fichier `nom` dont l'empreinte est déjà connue (None : fichier historique)"""
+    return blob_path(sha256) if sha256 else _legacy_path(nom)
+
+def file_hash(nom):
+    """Empreinte SHA-256 du fichier public `nom`, ou None pour un fichier historique"""
+    fichier = db.session.get(Fichier, nom)
+    return fichier.blob_sha256 if fichier is not None else None
+
+# Empreintes des fichiers historiques, indexées par (chemin, mtime, taille)
+_empreintes_historiques = {}
+MAX_EMPREINTES_HISTORIQUES = 4096
+
+def content_hash(nom, chemin):
+    """
+    Empreinte SHA-256 du contenu d'un fichier public : lue dans la table des
+    blobs, ou calculée une fois par processus pour un fichier historique.
+    """
+    empreinte = file_hash(nom)
+    if empreinte is not None:
+        return empreinte
+
+    stat = os.stat(chemin)
+    cle = (chemin, stat.st_mtime_ns, stat.st_size)
+    empreinte = _empreintes_historiques.get(cle)
+    if empreinte is None:
+        empreinte, _ = hash_file(chemin)
+        if len(_empreintes_historiques) >= MAX_EMPREINTES_HISTORIQUES:
+            _empreintes_historiques.clear()
+        _empreintes_historiques[cle] = empreinte
+    return empreinte
+
+def hash_file(filepath):
+    """Calcule (sha256, taille) d'un fichier en le lisant par blocs"""
+    sha = hashlib.sha256()
+    taille = 0
+    with open(filepath, 'rb') as f:
+        for bloc in iter(lambda: f.read(TAILLE_BLOC), b''):
+            sha.update(bloc)
+            taille += len(bloc)
+    return sha.hexdigest(), taille
+
+def _write_stream(stream):
+    """Copie un flux dans un fichier temporaire en calculant son empreinte"""
+    chemin = temp_path()
+    sha = hashlib.sha256()
+    taille = 0
+    try:
+        with open(chemin, 'wb') as f:
+            for bloc in iter(lambda: stream.read(TAILLE_BLOC), b''):
+                sha.update(bloc)
+                f.write(bloc)
+                taille += len(bloc)
+    except Exception:
+        _remove_quietly(chemin)
+        raise
+    return chemin, sha.hexdigest(), taille
+
+def _resolve_name(filename, sha256):
+    """
+    Choisit le nom public du fichier en O(1) : le nom d'origine s'il est libre
+    ou désigne déjà ce contenu, sinon le nom suffixé par le début de l'empreinte.
+    """
+    base, ext = os.path.splitext(filename)
+    for candidat in (filename, f"{base}_{sha256[:8]}{ext}", f"{base}_{sha256}{ext}"):
+        fichier = db.session.get(Fichier, candidat)
+        if fichier is not None:
+            if fichier.blob_sha256 == sha256:
+                return candidat, fichier
+            continue
+        if not os.path.exists(_legacy_path(candidat)):
+            return candidat, None
+    raise ValueError(f"Impossible de trouver un nom libre pour {filename}")
+
+def promote(chemin, sha256, taille, filename):
+    """
+    Référence le blob d'un fichier temporaire déjà haché (dans la transaction
+    courante) et retourne son nom public. Le fichier n'est rangé dans le
+    stockage qu'à la validation de la transaction, et supprimé si elle est annulée.
+    """
+    destination = blob_path(sha256)
+    # Le blob a pu être libéré plus tôt dans la même transaction
+    a_supprimer = db.session.info.get('fichiers_a_supprimer', [])
+    if destination in a_supprimer:
+        a_supprimer.remove(destination)
+    db.session.info.setdefault('fichiers_a_ranger', []).append((chemin, destination))
+
+    # Deux uploads simultanés du même contenu ne se disputent pas la création du blob
+    db.session.flush()
+    db.session.execute(
+        Blob.__table__.insert().prefix_with('OR IGNORE', dialect='sqlite'),
+        {'sha256': sha256, 'taille': taille, 'nb_references': 0}
+    )
+    _count_reference(sha256, 1)
+
+    nom, fichier = _resolve_name(secure_filename(filename) or 'fichier', sha256)
+    if fichier is None:
+        db.session.add(Fichier(nom=nom, blob_sha256=sha256))
+    db.session.flush()
+    return nom
+
+def save_upload(file):
+    """
+    Enregistre un fichier uploadé (FileStorage) en le hachant pendant l'écriture.
+    Retourne (nom public, taille en octets).
+    """
+    chemin, sha256, taille = _write_stream(file.stream)
+    return promote(chemin, sha256, taille, file.filename), taille
+
+def release(nom):
+    """
+    Libère la référence d'un document sur le fichier `nom`. Le blob est
+    supprimé du disque après validation de la transaction s'il n'est plus utilisé.
+    """
+    fichier = db.session.get(Fichier, nom)
+    if fichier is None:
+        # Fichier historique, stocké sous son nom
+        _delete_after_commit(_legacy_path(nom))
+        return
+
+    if _count_reference(fichier.blob_sha256, -1) <= 0:
+        _delete_after_commit(blob_path(fichier.blob_sha256))
+        db.session.delete(fichier.blob)
+        db.session.flush()
+
+def _count_reference(sha256, delta):
+    """
+    Ajoute `delta` aux références du blob par une mise à jour SQL (jamais par
+    lecture-modification-écriture dans l'ORM, qu'un upload simultané du même
+    contenu écraserait) et retourne le nombre relu dans la même transaction.
+    """
+    db.session.flush()
+    table = Blob.__table__
+    db.session.execute(
+        table.update().where(table.c.sha256 == sha256)
+        .values(nb_references=table.c.nb_references + delta)
+    )
+    blob = db.session.identity_map.get(db.session.identity_key(Blob, sha256))
+    if blob is not None:
+        db.session.expire(blob, ['nb_references'])
+    return db.session.execute(
+        select(table.c.nb_references).where(table.c.sha256 == sha256)
+    ).scalar() or 0
+
+def _delete_after_commit(chemin):
+    """Programme la suppression d'un fichier à la validation de la transaction"""
+    if chemin:
+        db.session.info.setdefault('fichiers_a_supprimer', []).append(chemin)
+
+def _remove_quietly(chemin):
+    try:
+        os.remove(chemin)
+    except OSError:
+        pass
+
+@event.listens_for(Session, 'after_commit')
+def _store_promoted_files(session):
+    for chemin, destination in session.info.pop('fichiers_a_ranger', []):
+        try:
+            if os.path.exists(destination):
+                # Contenu déjà connu : aucun octet supplémentaire sur le disque
+                _remove_quietly(chemin)
+            else:
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                os.replace(chemin, destination)
+        except Exception as e:
+            logger.error(f"Erreur lors du rangement du fichier {os.path.basename(destination)}: {str(e)}")
+
+@event.listens_for(Session, 'after_commit')
+def _purge_deleted_files(session):
+    for chemin in session.info.pop('fichiers_a_supprimer', []):
+        try:
+            if os.path.exists(chemin):
+                os.remove(chemin)
+                logger.info(f"Fichier supprimé: {os.path.basename(chemin)}")
+        except Exception as e:
+            logger.error(f"Erreur lors de la suppression du fichier {chemin}: {str(e)}")
+
+@event.listens_for(Session, 'after_rollback')
+def _cancel_file_operations(session):
+    session.info.pop('fichiers_a_supprimer', None)
+    # Fichiers jamais rangés : aucun blob validé ne les référence
+    for chemin, _ in session.info.pop('fichiers_a_ranger', []):
+        _remove_quietly(chemin)
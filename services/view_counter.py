@@ -0,0 +1,96 @@
+"""Compteur de vues tamponné en mémoire et écrit en base par lots"""
+from collections import Counter
+from models.models import db
+from sqlalchemy import text
+import atexit
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class ViewCounter:
+    """
+    Accumule les vues des documents en mémoire et les écrit en une seule
+    transaction toutes les N secondes ou tous les M évènements. Le tampon
+    est vidé à l'arrêt propre du processus.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._events = 0
+        self._thread = None
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure le compteur pour l'application"""
+        self.app = app
+        self.intervalle = app.config.get('VUES_FLUSH_INTERVALLE', 10)
+        self.seuil = app.config.get('VUES_FLUSH_SEUIL', 100)
+        app.extensions['view_counter'] = self
+        atexit.register(self.flush)
+
+    def record(self, doc_id):
+        """Enregistre une vue (sans accès à la base)"""
+        self._ensure_thread()
+        with self._lock:
+            self._pending[doc_id] += 1
+            self._events += 1
+            plein = self._events >= self.seuil
+        if plein:
+            self.flush()
+
+    def pending(self, doc_id):
+        """Nombre de vues pas encore écrites en base pour un document"""
+        with self._lock:
+            return self._pending.get(doc_id, 0)
+
+    def flush(self):
+        """Écrit toutes les vues en attente en un seul UPDATE groupé"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            lot = self._pending
+            self._pending = Counter()
+            self._events = 0
+
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as conn:
+                    conn.execute(
+                        text("UPDATE document SET nombre_vues = COALESCE(nombre_vues, 0) + :n WHERE id = :id"),
+                        [{'id': doc_id, 'n': n} for doc_id, n in lot.items()]
+                    )
+        except Exception as e:
+            # Remettre les vues dans le tampon pour ne rien perdre
+            with self._lock:
+                self._pending.update(lot)
+                self._events += sum(lot.values())
+            logger.error(f"Erreur lors de l'écriture des vues: {str(e)}")
+            return 0
+
+        return sum(lot.values())
+
+    def _ensure_thread(self):
+        """Démarre le thread de vidage périodique (une fois par processus)"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='view-counter', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """Boucle du thread de vidage périodique"""
+        while True:
+            time.sleep(self.intervalle)
+            self.flush()
+
+view_counter = ViewCounter()
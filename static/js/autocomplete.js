@@ -0,0 +1,91 @@
+/*
+ * Suggestions pendant la saisie dans la barre de recherche.
+ * Les requêtes sont espacées (debounce) et une réponse périmée est ignorée.
+ */
+(function () {
+    const input = document.querySelector('input[data-autocomplete]');
+    if (!input) {
+        return;
+    }
+
+    const url = input.dataset.autocomplete;
+    const DELAI = 120;
+    let timer = null;
+    let sequence = 0;
+
+    const menu = document.createElement('div');
+    menu.className = 'dropdown-menu shadow w-100';
+    menu.style.top = '100%';
+    menu.style.left = '0';
+    input.parentNode.appendChild(menu);
+
+    function hide() {
+        menu.classList.remove('show');
+        menu.innerHTML = '';
+    }
+
+    function item(href, label, icon, detail) {
+        const a = document.createElement('a');
+        a.className = 'dropdown-item text-truncate';
+        a.href = href;
+        const i = document.createElement('i');
+        i.className = 'fas ' + icon + ' me-2 text-muted';
+        a.appendChild(i);
+        a.appendChild(document.createTextNode(label));
+        if (detail) {
+            const small = document.createElement('small');
+            small.className = 'text-muted ms-2';
+            small.textContent = detail;
+            a.appendChild(small);
+        }
+        return a;
+    }
+
+    function render(data) {
+        menu.innerHTML = '';
+        data.categories.forEach(function (cat) {
+            menu.appendChild(item(cat.url, cat.nom, 'fa-folder', cat.nb_documents + ' doc.'));
+        });
+        if (data.categories.length && data.documents.length) {
+            const divider = document.createElement('div');
+            divider.className = 'dropdown-divider';
+            menu.appendChild(divider);
+        }
+        data.documents.forEach(function (doc) {
+            menu.appendChild(item(doc.url, doc.titre, 'fa-file-alt'));
+        });
+        menu.classList.toggle('show', menu.children.length > 0);
+    }
+
+    function suggest() {
+        const q = input.value.trim();
+        if (q.length < 2) {
+            hide();
+            return;
+        }
+        const courant = ++sequence;
+        fetch(url + '?q=' + encodeURIComponent(q), {credentials: 'same-origin'})
+            .then(function (response) { return response.json(); })
+            .then(function (data) {
+                if (courant === sequence) {
+                    render(data);
+                }
+            })
+            .catch(hide);
+    }
+
+    input.addEventListener('input', function () {
+        clearTimeout(timer);
+        timer = setTimeout(suggest, DELAI);
+    });
+    input.addEventListener('keydown', function (event) {
+        if (event.key === 'Escape') {
+            hide();
+        }
+    });
+    document.addEventListener('click', function (event) {
+        if (!menu.contains(event.target) && event.target !== input) {
+            hide();
+        }
+    });
+})();
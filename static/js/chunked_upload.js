@@ -0,0 +1,208 @@
+/*
+ * Upload par morceaux des fichiers volumineux (formulaire d'ajout de documents).
+ * Les fichiers plus gros que data-chunk-threshold sont envoyés morceau par
+ * morceau vers /admin/uploads ; en cas de coupure l'envoi reprend au dernier
+ * morceau reçu par le serveur. Chaque morceau porte son empreinte SHA-256 et
+ * l'empreinte du fichier entier est vérifiée par le serveur à la fin.
+ */
+(function () {
+    const form = document.querySelector('form[data-chunked-upload]');
+    if (!form) {
+        return;
+    }
+
+    const csrfToken = form.querySelector('input[name="csrf_token"]').value;
+    const threshold = parseInt(form.dataset.chunkThreshold, 10);
+    const baseUrl = form.dataset.chunkedUpload;
+    const MAX_RETRIES = 5;
+
+    function api(method, url, body, headers) {
+        return fetch(url, {
+            method: method,
+            body: body,
+            credentials: 'same-origin',
+            headers: Object.assign({'X-CSRFToken': csrfToken}, headers || {})
+        }).then(function (response) {
+            return response.json().catch(function () { return {}; }).then(function (data) {
+                if (!response.ok) {
+                    throw new Error(data.erreur || response.statusText);
+                }
+                return data;
+            });
+        });
+    }
+
+    function json(method, url, payload) {
+        return api(method, url, JSON.stringify(payload), {'Content-Type': 'application/json'});
+    }
+
+    // SHA-256 incrémental en JavaScript : crypto.subtle n'existe qu'en contexte
+    // sécurisé (HTTPS) et ne sait pas hacher un fichier morceau par morceau.
+    const K = new Uint32Array([
+        0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+        0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+        0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+        0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+        0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+        0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+        0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+        0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2
+    ]);
+
+    function Sha256() {
+        this.h = new Uint32Array([
+            0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19
+        ]);
+        this.w = new Uint32Array(64);
+        this.block = new Uint8Array(64);
+        this.used = 0;
+        this.length = 0;
+    }
+
+    Sha256.prototype.compress = function (data, pos) {
+        const w = this.w, h = this.h;
+        for (let i = 0; i < 16; i++, pos += 4) {
+            w[i] = (data[pos] << 24) | (data[pos + 1] << 16) | (data[pos + 2] << 8) | data[pos + 3];
+        }
+        for (let i = 16; i < 64; i++) {
+            const x = w[i - 15], y = w[i - 2];
+            const s0 = ((x >>> 7) | (x << 25)) ^ ((x >>> 18) | (x << 14)) ^ (x >>> 3);
+            const s1 = ((y >>> 17) | (y << 15)) ^ ((y >>> 19) | (y << 13)) ^ (y >>> 10);
+            w[i] = w[i - 16] + s0 + w[i - 7] + s1;
+        }
+        let a = h[0], b = h[1], c = h[2], d = h[3], e = h[4], f = h[5], g = h[6], k = h[7];
+        for (let i = 0; i < 64; i++) {
+            const s1 = ((e >>> 6) | (e << 26)) ^ ((e >>> 11) | (e << 21)) ^ ((e >>> 25) | (e << 7));
+            const t1 = (k + s1 + ((e & f) ^ (~e & g)) + K[i] + w[i]) | 0;
+            const s0 = ((a >>> 2) | (a << 30)) ^ ((a >>> 13) | (a << 19)) ^ ((a >>> 22) | (a << 10));
+            const t2 = (s0 + ((a & b) ^ (a & c) ^ (b & c))) | 0;
+            k = g; g = f; f = e; e = (d + t1) | 0;
+            d = c; c = b; b = a; a = (t1 + t2) | 0;
+        }
+        h[0] += a; h[1] += b; h[2] += c; h[3] += d;
+        h[4] += e; h[5] += f; h[6] += g; h[7] += k;
+    };
+
+    Sha256.prototype.update = function (bytes) {
+        let pos = 0;
+        this.length += bytes.length;
+        if (this.used) {
+            pos = Math.min(64 - this.used, bytes.length);
+            this.block.set(bytes.subarray(0, pos), this.used);
+            this.used += pos;
+            if (this.used < 64) {
+                return this;
+            }
+            this.compress(this.block, 0);
+            this.used = 0;
+        }
+        for (; pos + 64 <= bytes.length; pos += 64) {
+            this.compress(bytes, pos);
+        }
+        this.block.set(bytes.subarray(pos), 0);
+        this.used = bytes.length - pos;
+        return this;
+    };
+
+    Sha256.prototype.hex = function () {
+        const bits = this.length * 8;
+        const padding = new Uint8Array((this.used < 56 ? 64 : 128) - this.used);
+        const view = new DataView(padding.buffer);
+        padding[0] = 0x80;
+        view.setUint32(padding.length - 8, Math.floor(bits / 0x100000000));
+        view.setUint32(padding.length - 4, bits >>> 0);
+        this.update(padding);
+        return Array.from(this.h).map(function (x) {
+            return x.toString(16).padStart(8, '0');
+        }).join('');
+    };
+
+    function chunkDigest(bytes) {
+        if (!window.crypto || !window.crypto.subtle) {
+            return Promise.resolve(new Sha256().update(bytes).hex());
+        }
+        return window.crypto.subtle.digest('SHA-256', bytes).then(function (digest) {
+            return Array.from(new Uint8Array(digest)).map(function (b) {
+                return b.toString(16).padStart(2, '0');
+            }).join('');
+        });
+    }
+
+    function readBytes(file, start, end) {
+        return file.slice(start, end).arrayBuffer().then(function (buffer) {
+            return new Uint8Array(buffer);
+        });
+    }
+
+    function sleep(ms) {
+        return new Promise(function (resolve) { setTimeout(resolve, ms); });
+    }
+
+    async function sendChunks(file, status, progress, fileHash) {
+        let retries = 0;
+        let hashed = 0;
+        while (status.offset < file.size) {
+            try {
+                // Morceaux reçus par le serveur dont la réponse s'est perdue
+                while (hashed < status.offset) {
+                    const bytes = await readBytes(file, hashed, Math.min(status.offset, hashed + status.chunk_size));
+                    fileHash.update(bytes);
+                    hashed += bytes.length;
+                }
+                const chunk = await readBytes(file, status.offset, status.offset + status.chunk_size);
+                status = await api('PUT', baseUrl + '/' + status.upload_id + '/chunks/' + status.next_chunk,
+                                   chunk, {'X-Chunk-Sha256': await chunkDigest(chunk)});
+                fileHash.update(chunk);
+                hashed += chunk.length;
+                retries = 0;
+                progress(status.offset / file.size);
+            } catch (error) {
+                if (++retries > MAX_RETRIES) {
+                    throw error;
+                }
+                await sleep(1000 * retries);
+                // Reprendre là où le serveur s'est arrêté
+                status = await api('GET', baseUrl + '/' + status.upload_id);
+            }
+        }
+        return status;
+    }
+
+    async function uploadFile(file, fields, progress) {
+        const fileHash = new Sha256();
+        let status = await json('POST', baseUrl, {filename: file.name, taille: file.size});
+        status = await sendChunks(file, status, progress, fileHash);
+        return json('POST', baseUrl + '/' + status.upload_id + '/complete',
+                    Object.assign({sha256: fileHash.hex()}, fields));
+    }
+
+    form.addEventListener('submit', async function (event) {
+        const files = Array.from(form.querySelector('input[type="file"]').files);
+        if (!files.some(function (file) { return file.size > threshold; })) {
+            return;  // Envoi classique du formulaire
+        }
+        event.preventDefault();
+
+        const button = form.querySelector('button[type="submit"]');
+        const label = button.innerHTML;
+        button.disabled = true;
+
+        const titre = form.elements['titre'].value.trim();
+        try {
+            for (let i = 0; i < files.length; i++) {
+                await uploadFile(files[i], {
+                    titre: files.length > 1 ? titre + ' - ' + files[i].name : titre,
+                    description: form.elements['description'].value.trim(),
+                    categorie_id: form.elements['categorie_id'].value
+                }, function (ratio) {
+                    button.textContent = 'Fichier ' + (i + 1) + '/' + files.length + ' : ' + Math.round(ratio * 100) + ' %';
+                });
+            }
+            window.location.reload();
+        } catch (error) {
+            alert("Erreur lors de l'envoi : " + error.message);
+            button.disabled = false;
+            button.innerHTML = label;
+        }
+    });
+})();